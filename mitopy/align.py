@@ -8,9 +8,22 @@ from .utils import (
     check_files_exist,
 )
 from .constants import MT_REFS
+from concurrent.futures import ThreadPoolExecutor
 import os
+import pysam
 import sys
 
+# Canonical coordinates (0-based, half-open) flanking the chrM origin that are
+# called from the shifted alignment (see CONTROL_REGION in call.py)
+CONTROL_REGION_END = 576
+CONTROL_REGION_START = 16024
+CONTROL_REGION_PADDING = 300
+
+MARKDUP_ENGINES = ["spark", "samtools", "auto"]
+
+# Inputs smaller than this (in bytes) are deduplicated with samtools in auto mode
+MARKDUP_AUTO_MAX_SIZE = 2 * 1024**3
+
 
 def _ubam_to_fastq(ubam: str, out_fn: str, gatk_exec: Executable) -> None:
     """Convert uBAM to FASTQ format using gatk SamToFastq."""
@@ -72,6 +85,87 @@ def _mark_dup_sort(
     gatk_exec.run(subcommand="MarkDuplicatesSpark", **params)
 
 
+def _mark_dup_sort_samtools(
+    bam: str, out_fn: str, out_metrics: str, ncores: int
+) -> None:
+    """Mark duplicates and coordinate-sort using samtools fixmate, sort and markdup."""
+
+    threads = str(max((os.cpu_count() if ncores == -1 else ncores) - 1, 0))
+    basename = os.path.splitext(out_fn)[0]
+    fixmate_out = f"{basename}.fixmate.bam"
+    sorted_out = f"{basename}.coordsorted.bam"
+
+    # Input is queryname-sorted by MergeBamAlignment, so mates are adjacent
+    pysam.fixmate("-m", "-@", threads, bam, fixmate_out, catch_stdout=False)
+    pysam.sort("-@", threads, "-o", sorted_out, fixmate_out, catch_stdout=False)
+    pysam.markdup(
+        "-S",
+        "--include-fails",
+        "-d",
+        "2500",
+        "-f",
+        out_metrics,
+        "-@",
+        threads,
+        sorted_out,
+        out_fn,
+        catch_stdout=False,
+    )
+    pysam.index(out_fn)
+
+    os.remove(fixmate_out)
+    os.remove(sorted_out)
+
+
+def _select_markdup_engine(bam: str, engine: str) -> str:
+    """Resolve duplicate marking engine (auto-select by input size)."""
+
+    if engine.lower() != "auto":
+        return engine.lower()
+    return "samtools" if os.path.getsize(bam) < MARKDUP_AUTO_MAX_SIZE else "spark"
+
+
+def _select_control_region_reads(
+    bam: str, padding: int = CONTROL_REGION_PADDING
+) -> set:
+    """Collect names of read pairs touching control region or unmapped in canonical alignment."""
+
+    read_names = set()
+    with pysam.AlignmentFile(bam, "rb") as aln:
+        contig = aln.references[0]
+        contig_len = aln.lengths[0]
+
+        windows = [
+            (contig, 0, min(CONTROL_REGION_END + padding, contig_len)),
+            (contig, max(CONTROL_REGION_START - padding, 0), contig_len),
+        ]
+
+        # Reads overlapping control region (including reads clipped at the chrM origin)
+        for window in windows:
+            for read in aln.fetch(*window):
+                read_names.add(read.query_name)
+
+        # Read pairs without any mapped mate
+        for read in aln.fetch("*"):
+            read_names.add(read.query_name)
+
+    return read_names
+
+
+def _subset_ubam(ubam: str, read_names: set, out_fn: str) -> int:
+    """Subset uBAM to selected read names."""
+
+    n_reads = 0
+    with pysam.AlignmentFile(ubam, "rb", check_sq=False) as in_bam:
+        with pysam.AlignmentFile(out_fn, "wb", template=in_bam) as out_bam:
+            for read in in_bam.fetch(until_eof=True):
+                if read.query_name in read_names:
+                    out_bam.write(read)
+                    n_reads += 1
+
+    return n_reads
+
+
 def _mt_bwa_align(
     mt_fastq: str, mt_ref: str, out_fn: str, ncores: int, bwa_exec: Executable
 ) -> None:
@@ -95,6 +189,9 @@ def do_align(
     prefix: str = None,
     shifted: bool = False,
     ncores: int = 1,
+    fastq: str = None,
+    canonical_bam: str = None,
+    markdup_engine: str = "spark",
     verbose: bool = False,
     gatk_path: str = "gatk",
     bwamem2_path: str = "bwa-mem2",
@@ -108,6 +205,9 @@ def do_align(
         prefix (str, optional): Prefix. Defaults to None.
         shifted (bool, optional): Shifted mode. If True, align against shifted mitochondrial reference. Defaults to False.
         ncores (int, optional): Number of cores. Defaults to 1.
+        fastq (str, optional): Interleaved FASTQ converted from uBAM. If provided, the conversion step is skipped. Defaults to None.
+        canonical_bam (str, optional): Indexed canonical alignment of the same uBAM. If provided in shifted mode, only read pairs touching control region (or unmapped) are realigned. Defaults to None.
+        markdup_engine (str, optional): Duplicate marking engine ("spark", "samtools" or "auto" to select by input size). Defaults to "spark".
         verbose (bool, optional): Verbosity. If True, record logs of underlying tools. Defaults to False.
         gatk_path (str, optional): Path to GATK executable. Defaults to "gatk".
         bwamem2_path (str, optional): Path to bwa-mem2 executable. Defaults to "bwa-mem2".
@@ -134,10 +234,26 @@ def do_align(
         MT_REFS[mt_ref.lower()] if not shifted else MT_REFS[f"{mt_ref.lower()}_shifted"]
     )
 
+    # Restrict shifted realignment to reads relevant for control region
+    if shifted and canonical_bam:
+        logging.info("Selecting read pairs touching control region for realignment...")
+        read_names = _select_control_region_reads(canonical_bam)
+        subset_ubam = create_output_path(prefix, out_dir, "_control_region", ".bam")
+        n_reads = _subset_ubam(ubam, read_names, subset_ubam)
+        logging.info(f"Realigning {n_reads} reads to shifted reference.")
+
+        ubam = subset_ubam
+        fastq = None
+
     # Convert uBAM to FASTQ
-    logging.info("Converting uBAM to FASTQ format for alignment...")
-    mt_fastq = create_output_path(prefix=prefix, out_dir=out_dir, suffix="", ext=".fq")
-    _ubam_to_fastq(ubam=ubam, out_fn=mt_fastq, gatk_exec=gatk)
+    if fastq:
+        mt_fastq = fastq
+    else:
+        logging.info("Converting uBAM to FASTQ format for alignment...")
+        mt_fastq = create_output_path(
+            prefix=prefix, out_dir=out_dir, suffix="", ext=".fq"
+        )
+        _ubam_to_fastq(ubam=ubam, out_fn=mt_fastq, gatk_exec=gatk)
 
     # Align to mitochondrial reference
     logging.info(f"Aligning to mitochondrial reference genome {mt_ref}...")
@@ -168,13 +284,18 @@ def do_align(
     logging.info("Marking duplicates and coordinate-sorting...")
     md_out = create_output_path(prefix, out_dir, "_dedup", ".bam")
     md_metrics = create_output_path(prefix, out_dir, "", ".dedup.metrics.txt")
-    _mark_dup_sort(
-        bam=merged_out,
-        out_fn=md_out,
-        out_metrics=md_metrics,
-        ncores=ncores,
-        gatk_exec=gatk,
-    )
+    if _select_markdup_engine(merged_out, markdup_engine) == "samtools":
+        _mark_dup_sort_samtools(
+            bam=merged_out, out_fn=md_out, out_metrics=md_metrics, ncores=ncores
+        )
+    else:
+        _mark_dup_sort(
+            bam=merged_out,
+            out_fn=md_out,
+            out_metrics=md_metrics,
+            ncores=ncores,
+            gatk_exec=gatk,
+        )
 
     # Collect main outputs
     output_paths = {
@@ -192,3 +313,97 @@ def do_align(
         sys.exit(1)
 
     return output_paths
+
+
+def do_align_dual(
+    ubam: str,
+    mt_ref: str = "rcrs",
+    out_dir: str = None,
+    prefix: str = None,
+    ncores: int = 1,
+    control_region_only: bool = False,
+    markdup_engine: str = "spark",
+    verbose: bool = False,
+    gatk_path: str = "gatk",
+    bwamem2_path: str = "bwa-mem2",
+) -> dict:
+    """Align unmapped BAM file to canonical and shifted mitochondrial reference concurrently.
+
+    The uBAM is converted to FASTQ once and both alignments share it. Available cores are split between the two alignments.
+    In control-region-only mode, the canonical alignment runs first and only read pairs touching control region are realigned to shifted reference.
+
+    Args:
+        ubam (str): Path to uBAM
+        mt_ref (str, optional): Mitochondrial reference. Defaults to "rcrs".
+        out_dir (str, optional): Output directory. Defaults to None.
+        prefix (str, optional): Prefix. Defaults to None.
+        ncores (int, optional): Number of cores. Defaults to 1.
+        control_region_only (bool, optional): Realign only read pairs touching control region to shifted reference. Defaults to False.
+        markdup_engine (str, optional): Duplicate marking engine ("spark", "samtools" or "auto"). Defaults to "spark".
+        verbose (bool, optional): Verbosity. If True, record logs of underlying tools. Defaults to False.
+        gatk_path (str, optional): Path to GATK executable. Defaults to "gatk".
+        bwamem2_path (str, optional): Path to bwa-mem2 executable. Defaults to "bwa-mem2".
+
+    Returns:
+        dict: Main output file paths (shifted outputs are prefixed with "shifted_")
+    """
+    gatk = Executable(gatk_path, verbose)
+
+    if not prefix:
+        prefix = get_file_basename(ubam)
+
+    if not out_dir:
+        out_dir = get_file_directory(ubam)
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Convert uBAM to FASTQ (shared by both alignments)
+    logging.info("Converting uBAM to FASTQ format for alignment...")
+    mt_fastq = create_output_path(prefix=prefix, out_dir=out_dir, suffix="", ext=".fq")
+    _ubam_to_fastq(ubam=ubam, out_fn=mt_fastq, gatk_exec=gatk)
+
+    ncores = os.cpu_count() if ncores == -1 else ncores
+
+    align_params = {
+        "ubam": ubam,
+        "mt_ref": mt_ref,
+        "out_dir": out_dir,
+        "prefix": prefix,
+        "fastq": mt_fastq,
+        "markdup_engine": markdup_engine,
+        "verbose": verbose,
+        "gatk_path": gatk_path,
+        "bwamem2_path": bwamem2_path,
+    }
+
+    if control_region_only:
+        # Align everything to canonical reference, realign control region reads only
+        canonical = do_align(ncores=ncores, **align_params)
+        shifted = do_align(
+            ncores=ncores,
+            shifted=True,
+            canonical_bam=canonical["dedup_sorted_bam"],
+            **align_params,
+        )
+    else:
+        # Split cores between canonical and shifted alignment
+        canonical_cores = max(1, (ncores + 1) // 2)
+        shifted_cores = max(1, ncores // 2)
+
+        logging.info(
+            f"Aligning to canonical and shifted mitochondrial reference {mt_ref} concurrently..."
+        )
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            canonical_future = executor.submit(
+                do_align, ncores=canonical_cores, **align_params
+            )
+            shifted_future = executor.submit(
+                do_align, ncores=shifted_cores, shifted=True, **align_params
+            )
+            canonical = canonical_future.result()
+            shifted = shifted_future.result()
+
+    output_paths = dict(canonical)
+    output_paths.update({"shifted_" + key: value for key, value in shifted.items()})
+
+    return output_paths
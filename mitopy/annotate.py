@@ -11,6 +11,7 @@ from .utils import (
 import os
 import sys
 from .executable import Executable
+from .vcfio import index_vcf
 from .constants import ANNOT_RESOURCES
 
 
@@ -229,6 +230,7 @@ def do_annotate(
     prefix: str = None,
     out_dir: str = None,
     create_csv: bool = True,
+    vcf_format: str = "vcf",
     snpeff_path: str = "snpeff",
     snpsift_path: str = "snpsift",
     verbose: bool = False,
@@ -245,6 +247,7 @@ def do_annotate(
         prefix (str, optional): Prefix. Defaults to None.
         out_dir (str, optional): Output directory. Defaults to None.
         create_csv (bool, optional): Export annotated variants to CSV format. Defaults to True.
+        vcf_format (str, optional): Output VCF format, "vcf" or "vcf.gz" (BGZF compressed, tabix indexed). Defaults to "vcf".
         snpeff_path (str, optional): Path to snpeff executable. Defaults to "snpeff".
         snpsift_path (str, optional): Path to snpsift executable. Defaults to "snpsift".
         verbose (bool, optional): Verbosity. Defaults to False.
@@ -262,7 +265,7 @@ def do_annotate(
 
     os.makedirs(out_dir, exist_ok=True)
 
-    out_vcf = create_output_path(prefix, out_dir, "_annotated", ".vcf")
+    out_vcf = create_output_path(prefix, out_dir, "_annotated", f".{vcf_format}")
     snpeff_vcf = create_output_path(prefix, out_dir, "_snpeff", ".vcf")
 
     # Perform functional annotation
@@ -376,6 +379,10 @@ def do_annotate(
         "annotated_vcf": out_vcf,
     }
 
+    # Compressed VCF is indexed for random access by region
+    if out_vcf.endswith(".gz"):
+        output_paths["annotated_vcf_index"] = index_vcf(out_vcf)
+
     # Create CSV report
     if create_csv:
         logging.info("Creating CSV report...")
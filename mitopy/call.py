@@ -4,36 +4,227 @@ from .utils import (
     get_file_directory,
     create_output_path,
     check_files_exist,
+    merge_stats_tables,
+    read_stats_table,
+    write_stats_table,
 )
+from .vcfio import merge_vcfs, read_vcf_lines, write_vcf_lines, get_vcf_index_path
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import numpy as np
 import os
+import pysam
 import sys
 from .constants import MT_REFS
 
 NON_CONTROL_REGION = "chrM:576-16024"
 CONTROL_REGION = "chrM:8025-9144"
 
+# Shards overlap so that calls near shard boundaries see full assembly regions
+SHARD_OVERLAP = 500
+
+# Mutect2 default --callable-depth, minimum depth of a site counted as callable
+CALLABLE_DEPTH = 10
+
+# Covered regions separated by shorter gaps are called as one interval
+MIN_EXCLUDED_GAP = 100
+
+
+def _parse_interval(interval: str) -> tuple:
+    """Parse interval string (contig:start-end) to tuple."""
+
+    contig, coords = interval.split(":")
+    start, end = coords.split("-")
+    return contig, int(start), int(end)
+
+
+def _split_interval(interval: str, nshards: int, overlap: int = SHARD_OVERLAP) -> list:
+    """Split interval into overlapping shards.
+
+    Returns:
+        list: Shards as 1-based, closed (call start, call end, core start, core end) tuples. Cores partition the input interval.
+    """
+
+    _, start, end = _parse_interval(interval)
+    shard_len = -(-(end - start + 1) // nshards)
+
+    shards = []
+    for core_start in range(start, end + 1, shard_len):
+        core_end = min(core_start + shard_len - 1, end)
+        call_start = max(core_start - overlap, start)
+        call_end = min(core_end + overlap, end)
+        shards.append((call_start, call_end, core_start, core_end))
+
+    return shards
+
+
+def _get_depth(bam: str, contig: str, start: int, end: int) -> np.ndarray:
+    """Get per-base depth of interval (1-based, closed) from reads passing Mutect2 default read filters.
+
+    Depth is computed from read spans (as Mutect2 pileups, deletions are counted) of reads fetched via BAM index.
+    """
+
+    depth_diff = np.zeros(end - start + 2, dtype=np.int64)
+    with pysam.AlignmentFile(bam, "rb") as aln:
+        for read in aln.fetch(contig, start - 1, end):
+            if (
+                read.is_unmapped
+                or read.is_secondary
+                or read.is_duplicate
+                or read.is_qcfail
+                or read.mapping_quality < 20
+            ):
+                continue
+            read_start = max(read.reference_start + 1, start) - start
+            read_end = min(read.reference_end, end) - start + 1
+            depth_diff[read_start] += 1
+            depth_diff[read_end] -= 1
+
+    return np.cumsum(depth_diff[:-1])
+
+
+def _get_covered_intervals(bam: str | list, interval: str, min_depth: int) -> tuple:
+    """Split interval into regions covered at least min_depth and excluded regions.
+
+    For multiple BAM files, a region is covered if it is covered in at least one of them.
+
+    Returns:
+        tuple: Covered and excluded regions as lists of 1-based, closed (start, end) tuples
+    """
+
+    contig, start, end = _parse_interval(interval)
+    bams = [bam] if isinstance(bam, str) else bam
+
+    covered_mask = np.zeros(end - start + 1, dtype=bool)
+    for bam_fn in bams:
+        covered_mask |= _get_depth(bam_fn, contig, start, end) >= min_depth
+
+    # Find runs of covered bases
+    edges = np.diff(np.concatenate(([0], covered_mask.astype(np.int8), [0])))
+    run_starts = np.flatnonzero(edges == 1) + start
+    run_ends = np.flatnonzero(edges == -1) + start - 1
+
+    covered = []
+    for run_start, run_end in zip(run_starts.tolist(), run_ends.tolist()):
+        if covered and run_start - covered[-1][1] - 1 < MIN_EXCLUDED_GAP:
+            covered[-1] = (covered[-1][0], run_end)
+        else:
+            covered.append((run_start, run_end))
+
+    excluded = []
+    previous_end = start - 1
+    for run_start, run_end in covered + [(end + 1, end + 1)]:
+        if run_start > previous_end + 1:
+            excluded.append((previous_end + 1, run_start - 1))
+        previous_end = run_end
+
+    return covered, excluded
+
+
+def _count_callable_sites(bam: str | list, contig: str, regions: list) -> int:
+    """Count sites of regions (1-based, closed) covered at least CALLABLE_DEPTH, summing depth of multiple BAM files."""
+
+    bams = [bam] if isinstance(bam, str) else bam
+
+    callable_sites = 0
+    for start, end in regions:
+        depth = sum(_get_depth(bam_fn, contig, start, end) for bam_fn in bams)
+        callable_sites += int(np.count_nonzero(depth >= CALLABLE_DEPTH))
+    return callable_sites
+
+
+def _intersect_intervals(interval: str, regions: list) -> list:
+    """Intersect interval with regions, return list of interval strings."""
+
+    contig, start, end = _parse_interval(interval)
+    return [
+        f"{contig}:{max(start, region_start)}-{min(end, region_end)}"
+        for region_start, region_end in regions
+        if region_start <= end and region_end >= start
+    ]
+
+
+def _run_mutect2(
+    bam: str | list,
+    mt_ref: str,
+    interval: str | list,
+    out_fn: str,
+    m2_extra_args: str,
+    gatk_exec: Executable,
+    pair_hmm_threads: int = None,
+) -> None:
+    """Call variants in interval using gatk Mutect2 in mitochondria mode (jointly for multiple BAM files)."""
+
+    params = {
+        "-I": bam,
+        "-R": mt_ref,
+        "-O": out_fn,
+        "--read-filter": [
+            "MateOnSameContigOrNoMappedMateReadFilter",
+            "MateUnmappedAndUnmappedReadFilter",
+        ],
+        "--annotation": "StrandBiasBySample",
+        "--mitochondria-mode": True,
+        "--max-reads-per-alignment-start": 75,
+        "--max-mnp-distance": 0,
+        "-L": interval,
+    }
+    if pair_hmm_threads:
+        params["--native-pair-hmm-threads"] = pair_hmm_threads
+
+    gatk_exec.run(m2_extra_args, subcommand="Mutect2", **params)
+
+
+def _trim_shard(vcf: str, core_start: int, core_end: int, out_fn: str) -> None:
+    """Keep only calls within shard core (calls from overlaps are owned by neighbouring shards).
+
+    Records are copied as written by Mutect2.
+    """
+
+    with pysam.VariantFile(vcf) as in_vcf:
+        header = in_vcf.header.copy()
+
+    write_vcf_lines(
+        out_fn,
+        header,
+        (
+            line
+            for line in read_vcf_lines(vcf)
+            if core_start <= int(line.split("\t", 2)[1]) <= core_end
+        ),
+    )
+
 
 def do_call(
-    bam: str,
+    bam: str | list,
     mt_ref: str = "rcrs",
     m2_extra_args: str = "",
     out_dir: str = None,
     prefix: str = None,
     gatk_path: str = "gatk",
     shifted: bool = False,
+    ncores: int = 1,
+    nshards: int = 1,
+    min_depth: int = 0,
+    vcf_format: str = "vcf",
     verbose: bool = False,
 ) -> dict:
     """Call mitochondrial variants using Mutect2.
 
+    If multiple BAM files are provided (e.g. family or serial samples), variants are called jointly by a single Mutect2 run, producing multi-sample VCF.
+
     Args:
-        bam (str): Path to BAM file
+        bam (str | list): Path to BAM file or list of paths to BAM files
         mt_ref (str, optional): Mitochondrial reference. Defaults to "rcrs".
         m2_extra_args (str, optional): Extra args to pass onto Mutect2. Defaults to "".
         out_dir (str, optional): Output directory. Defaults to None.
         prefix (str, optional): Prefix. Defaults to None.
         gatk_path (str, optional): Path to GATK executable. Defaults to "gatk".
         shifted (bool, optional): Shifted mode. If True, variants are called against shifted mitochondrial reference. Defaults to False.
+        ncores (int, optional): Number of cores. Split between shards as PairHMM threads. Defaults to 1.
+        nshards (int, optional): Number of overlapping interval shards called in parallel. Calls and callable sites are taken from shard cores only. Defaults to 1.
+        min_depth (int, optional): Minimum depth. If set, only regions covered at least min_depth are called. Defaults to 0.
+        vcf_format (str, optional): Output VCF format, "vcf" or "vcf.gz" (BGZF compressed, tabix indexed). Defaults to "vcf".
         verbose (bool, optional): Verbosity. If True, record logs of underlying tools. Defaults to False.
 
     Returns:
@@ -41,11 +232,13 @@ def do_call(
     """
     gatk = Executable(gatk_path, verbose)
 
+    bams = [bam] if isinstance(bam, str) else list(bam)
+
     if not prefix:
-        prefix = get_file_basename(bam)
+        prefix = get_file_basename(bams[0]) if len(bams) == 1 else "cohort"
 
     if not out_dir:
-        out_dir = get_file_directory(bam)
+        out_dir = get_file_directory(bams[0])
 
     os.makedirs(out_dir, exist_ok=True)
 
@@ -56,33 +249,129 @@ def do_call(
         MT_REFS[mt_ref.lower()] if not shifted else MT_REFS[f"{mt_ref.lower()}_shifted"]
     )
 
+    region = CONTROL_REGION if shifted else NON_CONTROL_REGION
+    contig, region_start, region_end = _parse_interval(region)
+    output_fn = create_output_path(prefix, out_dir, "", f".{vcf_format}")
+    output_paths = {}
+
+    # Restrict calling to sufficiently covered regions
+    interval = region
+    covered = [(region_start, region_end)]
+    if min_depth > 0:
+        logging.info(
+            f"Excluding regions covered less than {min_depth}x from calling..."
+        )
+        covered, excluded = _get_covered_intervals(bams, region, min_depth)
+        if not covered:
+            logging.warning(
+                f"No region is covered at least {min_depth}x, calling the whole interval."
+            )
+            covered, excluded = [(region_start, region_end)], []
+
+        excluded_bed = create_output_path(prefix, out_dir, "_excluded", ".bed")
+        with open(excluded_bed, "w") as f:
+            for excluded_start, excluded_end in excluded:
+                f.write(f"{contig}\t{excluded_start - 1}\t{excluded_end}\n")
+        output_paths["excluded_regions"] = excluded_bed
+
+        if excluded:
+            callable_intervals = create_output_path(
+                prefix, out_dir, "_callable", ".intervals"
+            )
+            with open(callable_intervals, "w") as f:
+                for covered_start, covered_end in covered:
+                    f.write(f"{contig}:{covered_start}-{covered_end}\n")
+            interval = callable_intervals
+
     # Call variants
-    output_fn = create_output_path(prefix, out_dir, "", ".vcf")
+    if len(bams) > 1:
+        logging.info(f"Calling variants jointly in {len(bams)} samples...")
 
-    params = {
-        "-I": bam,
-        "-R": mt_reference_fasta,
-        "-O": output_fn,
-        "--read-filter": [
-            "MateOnSameContigOrNoMappedMateReadFilter",
-            "MateUnmappedAndUnmappedReadFilter",
-        ],
-        "--annotation": "StrandBiasBySample",
-        "--mitochondria-mode": True,
-        "--max-reads-per-alignment-start": 75,
-        "--max-mnp-distance": 0,
-        "-L": CONTROL_REGION if shifted else NON_CONTROL_REGION,
-    }
+    if nshards <= 1:
+        logging.info("Calling variants with Mutect2 in mitochondria mode...")
+        _run_mutect2(
+            bam=bams,
+            mt_ref=mt_reference_fasta,
+            interval=interval,
+            out_fn=output_fn,
+            m2_extra_args=m2_extra_args,
+            gatk_exec=gatk,
+        )
+    else:
+        # Split cores between shards
+        ncores = os.cpu_count() if ncores == -1 else ncores
+        nworkers = max(1, min(nshards, ncores))
+        pair_hmm_threads = max(1, ncores // nworkers)
+
+        # Shards are called on covered part of their overlapping call interval,
+        # shards without any covered region in their core are skipped
+        shards = [
+            (
+                _intersect_intervals(f"{contig}:{call_start}-{call_end}", covered),
+                core_start,
+                core_end,
+            )
+            for call_start, call_end, core_start, core_end in _split_interval(
+                region, nshards
+            )
+            if _intersect_intervals(f"{contig}:{core_start}-{core_end}", covered)
+        ]
+        shards_dir = os.path.join(out_dir, "shards")
+        os.makedirs(shards_dir, exist_ok=True)
+        shard_vcfs = [
+            create_output_path(prefix, shards_dir, f"_shard{i}", f".{vcf_format}")
+            for i in range(len(shards))
+        ]
+
+        # Scatter
+        logging.info(
+            f"Calling variants with Mutect2 in mitochondria mode across {len(shards)} shards..."
+        )
+        with ThreadPoolExecutor(max_workers=nworkers) as executor:
+            futures = [
+                executor.submit(
+                    _run_mutect2,
+                    bam=bams,
+                    mt_ref=mt_reference_fasta,
+                    interval=call_intervals,
+                    out_fn=shard_vcf,
+                    m2_extra_args=m2_extra_args,
+                    gatk_exec=gatk,
+                    pair_hmm_threads=pair_hmm_threads,
+                )
+                for (call_intervals, _, _), shard_vcf in zip(shards, shard_vcfs)
+            ]
+            for future in futures:
+                future.result()
+
+        # Gather
+        logging.info("Gathering variant calls and stats from shards...")
+        trimmed_vcfs = []
+        for (_, core_start, core_end), shard_vcf in zip(shards, shard_vcfs):
+            trimmed_vcf = create_output_path(
+                get_file_basename(shard_vcf), shards_dir, "_core", f".{vcf_format}"
+            )
+            _trim_shard(shard_vcf, core_start, core_end, trimmed_vcf)
+            trimmed_vcfs.append(trimmed_vcf)
+
+        merge_vcfs(trimmed_vcfs, output_fn)
 
-    logging.info("Calling variants with Mutect2 in mitochondria mode...")
-    gatk.run(m2_extra_args, subcommand="Mutect2", **params)
+        # Mutect2 counts callable sites of whole (overlapping) shards,
+        # so they are recounted on the called region (the union of cores) as in a single run
+        stats_fn = f"{output_fn}.stats"
+        merge_stats_tables([f"{shard_vcf}.stats" for shard_vcf in shard_vcfs], stats_fn)
+        stats = read_stats_table(stats_fn)
+        stats["callable"] = float(_count_callable_sites(bams, contig, covered))
+        write_stats_table(stats, stats_fn)
 
     # Collect outputs
-    output_paths = {
-        "raw_vcf": output_fn,
-        "raw_vcf_index": f"{output_fn}.idx",
-        "raw_vcf_stats": f"{output_fn}.stats",
-    }
+    output_paths.update(
+        {
+            "raw_vcf": output_fn,
+            "raw_vcf_index": get_vcf_index_path(output_fn),
+            "raw_vcf_stats": f"{output_fn}.stats",
+        }
+    )
 
     # Check if output files exist
     if check_files_exist(list(output_paths.values())):
@@ -92,3 +381,97 @@ def do_call(
         sys.exit(1)
 
     return output_paths
+
+
+def do_call_dual(
+    bam: str | list,
+    shifted_bam: str | list,
+    mt_ref: str = "rcrs",
+    m2_extra_args: str = "",
+    out_dir: str = None,
+    prefix: str = None,
+    gatk_path: str = "gatk",
+    ncores: int = 1,
+    nshards: int = 1,
+    min_depth: int = 0,
+    vcf_format: str = "vcf",
+    verbose: bool = False,
+) -> dict:
+    """Call mitochondrial variants in non-control and control region concurrently using Mutect2.
+
+    Cores are split between both Mutect2 processes proportionally to the length of called region.
+    With a single core, the regions are called one after the other.
+
+    Args:
+        bam (str | list): Path to BAM file or list of paths to BAM files (canonical alignment)
+        shifted_bam (str | list): Path to BAM file or list of paths to BAM files (shifted alignment), in the same order as bam
+        mt_ref (str, optional): Mitochondrial reference. Defaults to "rcrs".
+        m2_extra_args (str, optional): Extra args to pass onto Mutect2. Defaults to "".
+        out_dir (str, optional): Output directory. Defaults to None.
+        prefix (str, optional): Prefix. Defaults to None.
+        gatk_path (str, optional): Path to GATK executable. Defaults to "gatk".
+        ncores (int, optional): Number of cores. Defaults to 1.
+        nshards (int, optional): Number of interval shards for non-control region. Defaults to 1.
+        min_depth (int, optional): Minimum depth. If set, only regions covered at least min_depth are called. Defaults to 0.
+        vcf_format (str, optional): Output VCF format, "vcf" or "vcf.gz" (BGZF compressed, tabix indexed). Defaults to "vcf".
+        verbose (bool, optional): Verbosity. If True, record logs of underlying tools. Defaults to False.
+
+    Returns:
+        dict: Main output file paths (shifted outputs are prefixed with "shifted_")
+    """
+
+    bams = [bam] if isinstance(bam, str) else list(bam)
+    shifted_bams = [shifted_bam] if isinstance(shifted_bam, str) else list(shifted_bam)
+
+    if len(bams) != len(shifted_bams):
+        logging.error(
+            "Number of canonical and shifted BAM files differ, please provide shifted BAM for each sample."
+        )
+        sys.exit(1)
+
+    if not prefix:
+        prefix = get_file_basename(bams[0]) if len(bams) == 1 else "cohort"
+
+    if not out_dir:
+        out_dir = get_file_directory(bams[0])
+
+    # Split cores proportionally to the length of called regions
+    ncores = os.cpu_count() if ncores == -1 else max(1, ncores)
+    if ncores < 2:
+        nworkers = canonical_cores = shifted_cores = 1
+    else:
+        _, start, end = _parse_interval(CONTROL_REGION)
+        _, nc_start, nc_end = _parse_interval(NON_CONTROL_REGION)
+        control_share = (end - start + 1) / (end - start + nc_end - nc_start + 2)
+        shifted_cores = max(1, round(ncores * control_share))
+        canonical_cores = ncores - shifted_cores
+        nworkers = 2
+
+    call_params = {
+        "mt_ref": mt_ref,
+        "m2_extra_args": m2_extra_args,
+        "out_dir": out_dir,
+        "prefix": prefix,
+        "gatk_path": gatk_path,
+        "min_depth": min_depth,
+        "vcf_format": vcf_format,
+        "verbose": verbose,
+    }
+
+    if nworkers > 1:
+        logging.info(
+            "Calling variants in non-control and control region concurrently..."
+        )
+    with ThreadPoolExecutor(max_workers=nworkers) as executor:
+        canonical = executor.submit(
+            do_call, bam, ncores=canonical_cores, nshards=nshards, **call_params
+        )
+        shifted = executor.submit(
+            do_call, shifted_bam, shifted=True, ncores=shifted_cores, **call_params
+        )
+        output_paths = dict(canonical.result())
+        output_paths.update(
+            {"shifted_" + key: value for key, value in shifted.result().items()}
+        )
+
+    return output_paths
@@ -5,15 +5,27 @@ from click_option_group import optgroup
 from ._version import __version__
 
 from .preprocess import do_preprocess
-from .visualize import do_visualize
+from .downsample import do_downsample
+from .visualize import (
+    do_visualize,
+    do_visualize_batch,
+    do_visualize_cohort,
+    COHORT_VIS_MODES,
+)
 from .annotate import do_annotate
-from .align import do_align
-from .call import do_call
+from .align import do_align, do_align_dual, MARKDUP_ENGINES
+from .call import do_call, do_call_dual
 from .merge import do_merge
-from .postprocess import do_postprocess
+from .postprocess import do_postprocess, do_postprocess_sweep, CONTAMINATION_ENGINES
 from .coverage import do_coverage
-from .haplogroup import do_identify_haplogroup
+from .haplogroup import (
+    do_identify_haplogroup,
+    do_identify_haplogroup_cohort,
+    HAPLOGROUP_ENGINES,
+)
+from .report import do_report
 from .pipeline import do_run_pipeline
+from .vcfio import VCF_FORMATS
 
 
 @click.group()
@@ -43,6 +55,13 @@ def mitopy():
     type=str,
     help="Name of the mitochondrial contig in the alignment file. If not provided, it will be automatically detected.",
 )
+@click.option(
+    "--estimate-coverage",
+    type=bool,
+    show_default=True,
+    default=False,
+    help="Estimate median autosomal coverage and mtDNA copy number from index statistics and sampled windows.",
+)
 @click.option(
     "--out-dir",
     "-o",
@@ -70,6 +89,48 @@ def preprocess(**kwargs):
     do_preprocess(**kwargs)
 
 
+@mitopy.command()
+@click.argument(
+    "ubam",
+    type=click.Path(exists=True),
+)
+@click.option(
+    "--target-depth",
+    type=float,
+    help="Target mean mitochondrial depth.",
+)
+@click.option(
+    "--fraction",
+    type=float,
+    help="Fraction of read pairs to keep. If provided, --target-depth is ignored.",
+)
+@click.option(
+    "--seed",
+    type=int,
+    default=0,
+    show_default=True,
+    help="Random seed.",
+)
+@click.option(
+    "--out-dir",
+    "-o",
+    type=click.Path(),
+    help="Output directory",
+)
+@click.option(
+    "--prefix",
+    "-p",
+    type=str,
+    help="Prefix for output files.",
+)
+def downsample(**kwargs):
+    """Downsample UBAM to target mitochondrial depth (pair-aware and reproducible).
+
+    UBAM contains unaligned mitochondrial reads.
+    """
+    do_downsample(**kwargs)
+
+
 @mitopy.command()
 @click.argument(
     "ubam",
@@ -88,6 +149,32 @@ def preprocess(**kwargs):
     default=False,
     help="Shifted mode. If true, perform alignment to shifted mitochondrial reference.",
 )
+@click.option(
+    "--dual",
+    type=bool,
+    show_default=True,
+    default=False,
+    help="Dual mode. If true, align to canonical and shifted mitochondrial reference concurrently (--shifted is ignored).",
+)
+@click.option(
+    "--control-region-only",
+    type=bool,
+    show_default=True,
+    default=False,
+    help="Dual mode only. If true, align to canonical reference first and realign only reads touching control region to shifted reference.",
+)
+@click.option(
+    "--markdup-engine",
+    type=click.Choice(MARKDUP_ENGINES, case_sensitive=False),
+    default="spark",
+    show_default=True,
+    help="Duplicate marking engine. Use samtools for small mitochondrial BAMs or auto to select by input size.",
+)
+@click.option(
+    "--canonical-bam",
+    type=click.Path(exists=True),
+    help="Shifted mode only. Indexed canonical alignment of UBAM. If provided, only reads touching control region are realigned.",
+)
 @click.option(
     "--ncores",
     "-c",
@@ -114,18 +201,25 @@ def preprocess(**kwargs):
     default=False,
     help="Verbosity. If true, record logs generated by the underlying tools.",
 )
-def align(**kwargs):
+def align(dual, control_region_only, **kwargs):
     """Align UBAM to (shifted) mitochondrial reference.
 
     UBAM contains unaligned mitochondrial reads.
     """
-    do_align(**kwargs)
+    if dual:
+        kwargs.pop("shifted")
+        kwargs.pop("canonical_bam")
+        do_align_dual(control_region_only=control_region_only, **kwargs)
+    else:
+        do_align(**kwargs)
 
 
 @mitopy.command()
 @click.argument(
     "bam",
     type=click.Path(exists=True),
+    nargs=-1,
+    required=True,
 )
 @click.option(
     "--mt-ref",
@@ -146,6 +240,40 @@ def align(**kwargs):
     default=False,
     help="Shifted mode.",
 )
+@click.option(
+    "--shifted-bam",
+    type=click.Path(exists=True),
+    multiple=True,
+    help="BAM aligned to shifted mitochondrial reference. If provided, variants in non-control (BAM) and control region (SHIFTED_BAM) are called concurrently (--shifted is ignored). Repeat for each sample in joint calling.",
+)
+@click.option(
+    "--ncores",
+    "-c",
+    type=int,
+    default=1,
+    help="Number of cores.",
+)
+@click.option(
+    "--nshards",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Number of interval shards called in parallel.",
+)
+@click.option(
+    "--min-depth",
+    type=int,
+    default=0,
+    show_default=True,
+    help="Minimum depth. If set, only regions covered at least min depth are called and excluded regions are recorded in BED file.",
+)
+@click.option(
+    "--vcf-format",
+    type=click.Choice(VCF_FORMATS),
+    default="vcf",
+    show_default=True,
+    help="Output VCF format. vcf.gz files are BGZF compressed and tabix indexed.",
+)
 @click.option(
     "--out-dir",
     "-o",
@@ -165,12 +293,18 @@ def align(**kwargs):
     type=str,
     help="Prefix for output files.",
 )
-def call(**kwargs):
+def call(bam, shifted_bam, **kwargs):
     """Call mitochondrial variants from input BAM.
 
-    BAM contains the reads aligned to mitochondrial reference.
+    BAM contains the reads aligned to mitochondrial reference. If multiple BAM files are provided, variants are called jointly into multi-sample VCF.
     """
-    do_call(**kwargs)
+    kwargs["bam"] = bam[0] if len(bam) == 1 else list(bam)
+    if shifted_bam:
+        shifted_bam = shifted_bam[0] if len(shifted_bam) == 1 else list(shifted_bam)
+        kwargs.pop("shifted")
+        do_call_dual(shifted_bam=shifted_bam, **kwargs)
+    else:
+        do_call(**kwargs)
 
 
 @mitopy.command()
@@ -198,6 +332,32 @@ def call(**kwargs):
     default="rCRS",
     help="Mitochondrial reference.",
 )
+@click.option(
+    "--estimate-contamination",
+    type=bool,
+    show_default=True,
+    default=False,
+    help="Estimate contamination of merged VCF using Haplocheck concurrently with merging stats. The estimate is cached and reused by postprocess.",
+)
+@click.option(
+    "--contamination-engine",
+    type=click.Choice(CONTAMINATION_ENGINES),
+    default="haplocheck",
+    show_default=True,
+    help="Contamination estimator. Native estimator classifies major and minor heteroplasmy profiles in-process without Haplocheck.",
+)
+@click.option(
+    "--phylotree-dir",
+    type=click.Path(exists=True),
+    help="Haplogrep tree directory (tree.xml and weights.txt). Required by native contamination estimator.",
+)
+@click.option(
+    "--vcf-format",
+    type=click.Choice(VCF_FORMATS),
+    default="vcf",
+    show_default=True,
+    help="Output VCF format. vcf.gz files are BGZF compressed and tabix indexed.",
+)
 @click.option(
     "--out-dir",
     "-o",
@@ -272,6 +432,18 @@ def merge(**kwargs):
     default=False,
     help="Contamination filter. If true, sample contamination level will be estimated using Haplocheck and variants will be filtered.",
 )
+@click.option(
+    "--contamination-engine",
+    type=click.Choice(CONTAMINATION_ENGINES),
+    default="haplocheck",
+    show_default=True,
+    help="Contamination estimator. Native estimator classifies major and minor heteroplasmy profiles in-process without Haplocheck.",
+)
+@click.option(
+    "--phylotree-dir",
+    type=click.Path(exists=True),
+    help="Haplogrep tree directory (tree.xml and weights.txt). Required by native contamination estimator.",
+)
 @click.option(
     "--remove-non-pass",
     type=bool,
@@ -286,6 +458,13 @@ def merge(**kwargs):
     default=True,
     help="Split multi-allelic sites and left-align variant calls.",
 )
+@click.option(
+    "--vcf-format",
+    type=click.Choice(VCF_FORMATS),
+    default="vcf",
+    show_default=True,
+    help="Output VCF format. vcf.gz files are BGZF compressed and tabix indexed.",
+)
 @click.option(
     "--out-dir",
     "-o",
@@ -313,6 +492,146 @@ def postprocess(**kwargs):
     do_postprocess(**kwargs)
 
 
+@mitopy.command()
+@click.argument(
+    "vcf",
+    type=click.Path(exists=True),
+)
+@click.option(
+    "--stats",
+    type=click.Path(exists=True),
+    help="Mutect2 stats.",
+)
+@click.option(
+    "--mt-ref",
+    type=click.Choice(["rCRS", "RSRS"], case_sensitive=False),
+    default="rCRS",
+    help="Mitochondrial reference.",
+)
+@click.option(
+    "--f-score-beta",
+    type=float,
+    multiple=True,
+    default=[1.0],
+    show_default=True,
+    help="F score beta value to sweep (repeat for multiple values).",
+)
+@click.option(
+    "--vaf-treshold",
+    type=float,
+    multiple=True,
+    default=[0],
+    show_default=True,
+    help="Minimum variant allele fraction treshold to sweep (repeat for multiple values).",
+)
+@click.option(
+    "--max-alt-allele-count",
+    type=int,
+    multiple=True,
+    default=[4],
+    show_default=True,
+    help="Max alternate allele count to sweep (repeat for multiple values).",
+)
+@click.option(
+    "--min-hom-treshold",
+    type=float,
+    multiple=True,
+    default=[0.95],
+    show_default=True,
+    help="Minimum homoplasmy level treshold to sweep (repeat for multiple values).",
+)
+@click.option(
+    "--blacklisted-sites",
+    type=click.Path(exists=True),
+    help="Custom BED file containing blacklisted sites. If not specified, the default blacklist for chosen MT reference will be used.",
+)
+@click.option(
+    "--autosomal-coverage",
+    type=float,
+    default=0,
+    help="Median autosomal coverage. Set to activate filter against errounesly mapped NuMTs.",
+)
+@click.option(
+    "--contamination-filter",
+    type=bool,
+    show_default=True,
+    default=False,
+    help="Contamination filter. If true, sample contamination level will be estimated using Haplocheck and variants will be filtered.",
+)
+@click.option(
+    "--contamination-engine",
+    type=click.Choice(CONTAMINATION_ENGINES),
+    default="haplocheck",
+    show_default=True,
+    help="Contamination estimator. Native estimator classifies major and minor heteroplasmy profiles in-process without Haplocheck.",
+)
+@click.option(
+    "--phylotree-dir",
+    type=click.Path(exists=True),
+    help="Haplogrep tree directory (tree.xml and weights.txt). Required by native contamination estimator.",
+)
+@click.option(
+    "--normalize",
+    type=bool,
+    show_default=True,
+    default=True,
+    help="Split multi-allelic sites and left-align variant calls.",
+)
+@click.option(
+    "--write-vcfs",
+    type=bool,
+    show_default=True,
+    default=False,
+    help="Write postprocessed VCF file for each parameter combination.",
+)
+@click.option(
+    "--ncores",
+    "-c",
+    type=int,
+    default=1,
+    help="Number of cores.",
+)
+@click.option(
+    "--vcf-format",
+    type=click.Choice(VCF_FORMATS),
+    default="vcf",
+    show_default=True,
+    help="Output VCF format. vcf.gz files are BGZF compressed and tabix indexed.",
+)
+@click.option(
+    "--out-dir",
+    "-o",
+    type=click.Path(),
+    help="Output directory.",
+)
+@click.option(
+    "--prefix",
+    "-p",
+    type=str,
+    help="Prefix for output files.",
+)
+@click.option(
+    "--verbose",
+    "-v",
+    type=bool,
+    default=False,
+    help="Verbosity. If true, record logs generated by the underlying tools.",
+)
+def postprocess_sweep(**kwargs):
+    """Sweep postprocessing parameters on raw variant calls.
+
+    VCF contains raw variant calls. Number of passing variants for each parameter combination is recorded in a table.
+    """
+    for param in [
+        "f_score_beta",
+        "vaf_treshold",
+        "max_alt_allele_count",
+        "min_hom_treshold",
+    ]:
+        kwargs[param] = list(kwargs[param])
+    do_postprocess_sweep(**kwargs)
+
+
 @mitopy.command()
 @click.argument(
     "mt-bam",
@@ -337,6 +656,13 @@ def postprocess(**kwargs):
     default=True,
     help="Create coverage plot (HTML).",
 )
+@click.option(
+    "--shared-plotlyjs",
+    type=bool,
+    show_default=True,
+    default=False,
+    help="Write plotly.js once per output directory (plotly.min.js) and refer to it from HTML instead of embedding it in every HTML file.",
+)
 @click.option(
     "--out-dir",
     "-o",
@@ -412,6 +738,13 @@ def coverage(**kwargs):
     default=True,
     help="Export annotated variants to human-readable CSV format.",
 )
+@click.option(
+    "--vcf-format",
+    type=click.Choice(VCF_FORMATS),
+    default="vcf",
+    show_default=True,
+    help="Output VCF format. vcf.gz files are BGZF compressed and tabix indexed.",
+)
 @click.option(
     "--out-dir",
     "-o",
@@ -464,6 +797,13 @@ def annotate(**kwargs):
     default=False,
     help="Additionally, save plot as static PNG image.",
 )
+@click.option(
+    "--shared-plotlyjs",
+    type=bool,
+    show_default=True,
+    default=False,
+    help="Write plotly.js once per output directory (plotly.min.js) and refer to it from HTML instead of embedding it in every HTML file.",
+)
 @click.option(
     "--out-dir",
     "-o",
@@ -484,6 +824,181 @@ def visualize(**kwargs):
     do_visualize(**kwargs)
 
 
+@mitopy.command()
+@click.argument(
+    "vcfs",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True),
+)
+@click.option(
+    "--coverage-csv",
+    type=click.Path(exists=True),
+    multiple=True,
+    help="CSV file with coverage per-base, repeated for each VCF file in the same order. If provided, coverage will be included in the final visualizations.",
+)
+@click.option(
+    "--split-strands",
+    type=bool,
+    show_default=True,
+    default=False,
+    help="Split H and L strand of mitochondrial genome in the visualization.",
+)
+@click.option(
+    "--save-as-png",
+    type=bool,
+    show_default=True,
+    default=False,
+    help="Additionally, save plots as static PNG images.",
+)
+@click.option(
+    "--shared-plotlyjs",
+    type=bool,
+    show_default=True,
+    default=False,
+    help="Write plotly.js once per output directory (plotly.min.js) and refer to it from HTML instead of embedding it in every HTML file.",
+)
+@click.option(
+    "--ncores",
+    "-c",
+    type=int,
+    show_default=True,
+    default=1,
+    help="Number of PNG rendering workers.",
+)
+@click.option(
+    "--out-dir",
+    "-o",
+    type=click.Path(),
+    help="Output directory",
+)
+def visualize_batch(vcfs, coverage_csv, **kwargs):
+    """Generate visualizations of multiple samples.
+
+    VCFS contain variants to visualize.
+    """
+    do_visualize_batch(list(vcfs), list(coverage_csv), **kwargs)
+
+
+@mitopy.command()
+@click.argument(
+    "vcfs",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True),
+)
+@click.option(
+    "--mode",
+    type=click.Choice(COHORT_VIS_MODES),
+    default="ring",
+    show_default=True,
+    help="Variants of all samples on mitochondrial genome map (ring) or heteroplasmy per position bin and sample (heatmap).",
+)
+@click.option(
+    "--bin-size",
+    type=int,
+    default=100,
+    show_default=True,
+    help="Size of position bins (bp).",
+)
+@click.option(
+    "--split-strands",
+    type=bool,
+    show_default=True,
+    default=False,
+    help="Split H and L strand of mitochondrial genome in the visualization.",
+)
+@click.option(
+    "--shared-plotlyjs",
+    type=bool,
+    show_default=True,
+    default=False,
+    help="Write plotly.js once per output directory (plotly.min.js) and refer to it from HTML instead of embedding it in every HTML file.",
+)
+@click.option(
+    "--ncores",
+    "-c",
+    type=int,
+    show_default=True,
+    default=1,
+    help="Number of cores used to read VCF files.",
+)
+@click.option(
+    "--out-dir",
+    "-o",
+    type=click.Path(),
+    help="Output directory",
+)
+@click.option(
+    "--prefix",
+    "-p",
+    type=str,
+    default="cohort",
+    show_default=True,
+    help="Prefix for output files.",
+)
+def visualize_cohort(vcfs, **kwargs):
+    """Generate a single visualization of variants of multiple samples.
+
+    VCFS contain variants to visualize.
+    """
+    do_visualize_cohort(list(vcfs), **kwargs)
+
+
+@mitopy.command()
+@click.argument(
+    "vcf",
+    type=click.Path(exists=True),
+)
+@click.option(
+    "--coverage-csv",
+    type=click.Path(exists=True),
+    help="CSV file with coverage per-base. If provided, coverage will be included in the report.",
+)
+@click.option(
+    "--annot-csv",
+    type=click.Path(exists=True),
+    help="CSV annotation report. If provided, annotated variants will be included in the report.",
+)
+@click.option(
+    "--haplogroups",
+    type=click.Path(exists=True),
+    help="Haplogroup classification. If provided, haplogroups will be included in the report.",
+)
+@click.option(
+    "--split-strands",
+    type=bool,
+    show_default=True,
+    default=False,
+    help="Split H and L strand of mitochondrial genome in the visualization.",
+)
+@click.option(
+    "--shared-plotlyjs",
+    type=bool,
+    show_default=True,
+    default=False,
+    help="Write plotly.js once per output directory (plotly.min.js) and refer to it from report instead of embedding it.",
+)
+@click.option(
+    "--out-dir",
+    "-o",
+    type=click.Path(),
+    help="Output directory",
+)
+@click.option(
+    "--prefix",
+    "-p",
+    type=str,
+    help="Prefix for output files.",
+)
+def report(**kwargs):
+    """Create consolidated single-file HTML report of a sample.
+
+    VCF contains sample variants.
+    """
+    do_report(**kwargs)
+
+
 @mitopy.command()
 @click.argument(
     "vcf",
@@ -495,6 +1010,30 @@ def visualize(**kwargs):
     default="rCRS",
     help="Mitochondrial reference.",
 )
+@click.option(
+    "--phylotree-archive",
+    type=click.Path(exists=True),
+    help="Local phylotree archive installed instead of downloading RSRS phylotree (e.g. in air-gapped environments).",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(HAPLOGROUP_ENGINES),
+    default="haplogrep3",
+    show_default=True,
+    help="Classification engine. Native engine classifies in-process without Haplogrep3.",
+)
+@click.option(
+    "--phylotree-dir",
+    type=click.Path(exists=True),
+    help="Haplogrep tree directory (tree.xml and weights.txt). Required by native engine.",
+)
+@click.option(
+    "--hits",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Number of top haplogroups reported per sample.",
+)
 @click.option(
     "--out-dir",
     "-o",
@@ -522,6 +1061,72 @@ def identify_haplogroup(**kwargs):
     do_identify_haplogroup(**kwargs)
 
 
+@mitopy.command()
+@click.argument(
+    "vcfs",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True),
+)
+@click.option(
+    "--mt-ref",
+    type=click.Choice(["rCRS", "RSRS"], case_sensitive=False),
+    default="rCRS",
+    help="Mitochondrial reference.",
+)
+@click.option(
+    "--phylotree-archive",
+    type=click.Path(exists=True),
+    help="Local phylotree archive installed instead of downloading RSRS phylotree (e.g. in air-gapped environments).",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(HAPLOGROUP_ENGINES),
+    default="haplogrep3",
+    show_default=True,
+    help="Classification engine. Native engine classifies in-process without Haplogrep3.",
+)
+@click.option(
+    "--phylotree-dir",
+    type=click.Path(exists=True),
+    help="Haplogrep tree directory (tree.xml and weights.txt). Required by native engine.",
+)
+@click.option(
+    "--hits",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Number of top haplogroups reported per sample.",
+)
+@click.option(
+    "--out-dir",
+    "-o",
+    type=click.Path(),
+    help="Output directory",
+)
+@click.option(
+    "--prefix",
+    "-p",
+    type=str,
+    default="cohort",
+    show_default=True,
+    help="Prefix for combined output files.",
+)
+@click.option(
+    "--verbose",
+    "-v",
+    type=bool,
+    default=False,
+    help="Verbosity. If true, record logs generated by the underlying tools.",
+)
+def identify_haplogroup_cohort(vcfs, **kwargs):
+    """Identify haplogroups of multiple samples in a single run.
+
+    VCFS are single-sample VCF files containing sample variants.
+    """
+    do_identify_haplogroup_cohort(list(vcfs), **kwargs)
+
+
 # WHOLE PIPELINE
 @mitopy.command()
 @click.argument(
@@ -575,6 +1180,37 @@ def identify_haplogroup(**kwargs):
     default=1,
     help="Number of cores.",
 )
+@click.option(
+    "--target-depth",
+    type=float,
+    help="Downsample mitochondrial reads to target depth before alignment.",
+)
+@click.option(
+    "--downsample-fraction",
+    type=float,
+    help="Downsample mitochondrial read pairs to fraction before alignment. If provided, --target-depth is ignored.",
+)
+@click.option(
+    "--downsample-seed",
+    type=int,
+    default=0,
+    show_default=True,
+    help="Random seed for downsampling.",
+)
+@click.option(
+    "--markdup-engine",
+    type=click.Choice(MARKDUP_ENGINES, case_sensitive=False),
+    default="spark",
+    show_default=True,
+    help="Duplicate marking engine. Use samtools for small mitochondrial BAMs or auto to select by input size.",
+)
+@click.option(
+    "--control-region-realign",
+    type=bool,
+    show_default=True,
+    default=False,
+    help="Realign only reads touching control region to shifted mitochondrial reference.",
+)
 @click.option(
     "--tmp-dir",
     "-tmp",
@@ -593,6 +1229,27 @@ def identify_haplogroup(**kwargs):
     default="",
     help="Extra arguments to pass onto Mutect2 variant caller.",
 )
+@click.option(
+    "--nshards",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Number of interval shards for variant calling in non-control region.",
+)
+@click.option(
+    "--min-call-depth",
+    type=int,
+    default=0,
+    show_default=True,
+    help="Minimum depth. If set, variants are called only in regions covered at least min call depth.",
+)
+@click.option(
+    "--vcf-format",
+    type=click.Choice(VCF_FORMATS),
+    default="vcf",
+    show_default=True,
+    help="Format of VCF files produced by all stages. vcf.gz files are BGZF compressed and tabix indexed.",
+)
 @optgroup.group(
     "Variant postprocessing",
     help="Variant filtering and normalization options",
@@ -620,6 +1277,13 @@ def identify_haplogroup(**kwargs):
     default=0,
     help="Median autosomal coverage. Set to activate filter against errounesly mapped NuMTs.",
 )
+@optgroup.option(
+    "--estimate-autosomal-coverage",
+    type=bool,
+    show_default=True,
+    default=False,
+    help="Estimate median autosomal coverage from input BAM/CRAM index statistics and sampled windows to activate NuMT filter (if --autosomal-coverage is not set).",
+)
 @optgroup.option(
     "--contamination-filter",
     is_flag=True,
@@ -627,6 +1291,18 @@ def identify_haplogroup(**kwargs):
     default=False,
     help="Contamination filter. If true, sample contamination level will be estimated using Haplocheck and variants will be filtered.",
 )
+@optgroup.option(
+    "--contamination-engine",
+    type=click.Choice(CONTAMINATION_ENGINES),
+    default="haplocheck",
+    show_default=True,
+    help="Contamination estimator. Native estimator classifies major and minor heteroplasmy profiles in-process without Haplocheck.",
+)
+@optgroup.option(
+    "--phylotree-dir",
+    type=click.Path(exists=True),
+    help="Haplogrep tree directory (tree.xml and weights.txt). Required by native contamination estimator.",
+)
 @optgroup.option(
     "--remove-non-pass",
     type=bool,
@@ -705,6 +1381,20 @@ def identify_haplogroup(**kwargs):
     default=False,
     help="Additionally, save plot as static PNG image.",
 )
+@optgroup.option(
+    "--shared-plotlyjs",
+    type=bool,
+    show_default=True,
+    default=False,
+    help="Write plotly.js once to results directory and refer to it from HTML reports instead of embedding it.",
+)
+@optgroup.option(
+    "--create-sample-report",
+    type=bool,
+    show_default=True,
+    default=True,
+    help="Create consolidated single-file HTML report with all figures and tables.",
+)
 def run_pipeline(**kwargs):
     """Run the whole single-sample mitopy pipeline on input BAM file.
 
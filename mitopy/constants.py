@@ -9,6 +9,12 @@ FILTER_DIR = os.path.join(DATA_DIR, "filter_data")
 ANNOT_DIR = os.path.join(DATA_DIR, "annotation_data")
 VIS_DIR = os.path.join(DATA_DIR, "vis_data")
 
+# Cache of results reused across runs (e.g. contamination estimates)
+CACHE_DIR = os.environ.get(
+    "MITOPY_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "mitopy")
+)
+
+MT_LENGTH = 16569
 
 MT_REFS = {
     "rcrs": f"{REF_DIR}/rcrs/rcrs.fasta",
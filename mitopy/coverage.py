@@ -6,6 +6,7 @@ from .utils import (
     get_file_directory,
     create_output_path,
     check_files_exist,
+    write_plotlyjs,
 )
 from .executable import Executable
 import sys
@@ -73,6 +74,7 @@ def do_coverage(
     out_dir: str = None,
     prefix: str = None,
     create_plot: bool = True,
+    shared_plotlyjs: bool = False,
     mosdepth_path: str = "mosdepth",
     verbose: bool = False,
 ) -> dict:
@@ -86,6 +88,7 @@ def do_coverage(
         out_dir (str, optional): Output directory. Defaults to None.
         prefix (str, optional): Prefix. Defaults to None.
         create_plot (bool, optional): Create coverage plot. Defaults to True.
+        shared_plotlyjs (bool, optional): Write plotly.js once per output directory (plotly.min.js) and refer to it from HTML instead of embedding it. Defaults to False.
         mosdepth_path (str, optional): Path to mosdepth executable. Defaults to "mosdepth".
         verbose (bool, optional): Verbosity. Defaults to False.
 
@@ -145,7 +148,12 @@ def do_coverage(
 
         # Save as interactive (html)
         coverage_html = create_output_path(prefix, out_dir, "_coverage", ".html")
-        fig.write_html(coverage_html)
+        if shared_plotlyjs:
+            output_paths["plotlyjs"] = write_plotlyjs(out_dir)
+        fig.write_html(
+            coverage_html,
+            include_plotlyjs="plotly.min.js" if shared_plotlyjs else True,
+        )
         output_paths["coverage_html"] = coverage_html
 
     # Check if output files exist
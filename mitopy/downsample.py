@@ -0,0 +1,150 @@
+from .utils import (
+    get_file_basename,
+    get_file_directory,
+    create_output_path,
+    check_files_exist,
+    write_stats_table,
+)
+from .constants import MT_LENGTH
+import hashlib
+import logging
+import os
+import pysam
+import sys
+
+
+def _estimate_depth(ubam: str) -> tuple:
+    """Estimate mean mitochondrial depth of uBAM (number of reads, mean depth)."""
+
+    n_reads = 0
+    n_bases = 0
+    with pysam.AlignmentFile(ubam, "rb", check_sq=False) as bam:
+        for read in bam.fetch(until_eof=True):
+            n_reads += 1
+            n_bases += read.query_length
+
+    return n_reads, n_bases / MT_LENGTH
+
+
+def _keep_template(read_name: str, fraction: float, seed: int) -> bool:
+    """Decide whether to keep a read pair (deterministic for given name and seed)."""
+
+    digest = hashlib.blake2b(
+        read_name.encode(), digest_size=8, key=str(seed).encode()
+    ).digest()
+    return int.from_bytes(digest, "big") / 2**64 < fraction
+
+
+def _downsample_ubam(ubam: str, out_fn: str, fraction: float, seed: int) -> int:
+    """Downsample uBAM keeping both mates of the selected read pairs."""
+
+    n_kept = 0
+    with pysam.AlignmentFile(ubam, "rb", check_sq=False) as in_bam:
+        header = in_bam.header.to_dict()
+        header.setdefault("CO", []).append(
+            f"mitopy downsample: fraction={fraction:.6f} seed={seed}"
+        )
+
+        with pysam.AlignmentFile(out_fn, "wb", header=header) as out_bam:
+            for read in in_bam.fetch(until_eof=True):
+                if _keep_template(read.query_name, fraction, seed):
+                    out_bam.write(read)
+                    n_kept += 1
+
+    return n_kept
+
+
+def check_downsample_params(target_depth: float = None, fraction: float = None) -> None:
+    """Check that target depth or fraction is provided and valid, exit otherwise."""
+
+    if fraction is None and target_depth is None:
+        logging.error("Please provide either target depth or fraction to downsample.")
+        sys.exit(1)
+
+    if fraction is not None and not 0 < fraction <= 1:
+        logging.error(f"Downsampling fraction {fraction} is not in interval (0, 1].")
+        sys.exit(1)
+
+    if fraction is None and target_depth <= 0:
+        logging.error(f"Target depth {target_depth} has to be positive.")
+        sys.exit(1)
+
+
+def do_downsample(
+    ubam: str,
+    target_depth: float = None,
+    fraction: float = None,
+    seed: int = 0,
+    out_dir: str = None,
+    prefix: str = None,
+) -> dict:
+    """Downsample unmapped BAM file to target mitochondrial depth.
+
+    Read pairs are selected by a seeded hash of the read name, so the result is reproducible and mates are always kept together.
+
+    Args:
+        ubam (str): Path to uBAM
+        target_depth (float, optional): Target mean mitochondrial depth. Defaults to None.
+        fraction (float, optional): Fraction of read pairs to keep, in interval (0, 1]. If provided, target_depth is ignored. Defaults to None.
+        seed (int, optional): Random seed. Defaults to 0.
+        out_dir (str, optional): Output directory. Defaults to None.
+        prefix (str, optional): Prefix. Defaults to None.
+
+    Returns:
+        dict: Main output file paths
+    """
+
+    if not prefix:
+        prefix = get_file_basename(ubam)
+
+    if not out_dir:
+        out_dir = get_file_directory(ubam)
+
+    check_downsample_params(target_depth, fraction)
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Estimate depth and fraction of reads to keep
+    logging.info("Estimating mitochondrial depth of uBAM...")
+    n_reads, depth = _estimate_depth(ubam)
+
+    if fraction is None:
+        fraction = target_depth / depth if depth > 0 else 1.0
+
+    fraction = min(fraction, 1.0)
+
+    # Downsample
+    if fraction < 1.0:
+        logging.info(
+            f"Downsampling uBAM (estimated depth {depth:.0f}x) to fraction {fraction:.4f}..."
+        )
+        downsampled_ubam = create_output_path(prefix, out_dir, "_downsampled", ".bam")
+        n_kept = _downsample_ubam(ubam, downsampled_ubam, fraction, seed)
+    else:
+        logging.info(
+            f"Estimated depth {depth:.0f}x does not exceed target, skipping downsampling."
+        )
+        downsampled_ubam = ubam
+        n_kept = n_reads
+
+    # Record applied fraction
+    metrics = create_output_path(prefix, out_dir, "_downsample", ".metrics.txt")
+    downsample_stats = {"estimated_depth": depth, "fraction": fraction, "seed": seed}
+    if target_depth is not None:
+        downsample_stats["target_depth"] = target_depth
+    downsample_stats.update({"reads_in": n_reads, "reads_out": n_kept})
+    write_stats_table(downsample_stats, metrics)
+
+    output_paths = {
+        "unmapped_bam": downsampled_ubam,
+        "downsample_metrics": metrics,
+    }
+
+    # Check if output files exist
+    if check_files_exist(list(output_paths.values())):
+        logging.info(f"Downsampling of {ubam} completed successfully.")
+    else:
+        logging.error("Some output files are missing! Please rerun the analysis.")
+        sys.exit(1)
+
+    return output_paths
@@ -4,29 +4,145 @@ from .utils import (
     get_file_directory,
     create_output_path,
     check_files_exist,
+    get_file_hash,
 )
+from .vcfio import merge_samples
+from .constants import CACHE_DIR
+from .phylotree import get_phylotree, classify_vcf
+from shutil import which
+import fcntl
 import os
 import logging
+import pysam
 import sys
 
 
 PHYLOTREES = {"rcrs": "phylotree-rcrs@17.2", "rsrs": "phylotree-rsrs@17.1"}
 
+# Haplogrep3 or in-process classifier (mitopy.phylotree)
+HAPLOGROUP_ENGINES = ["haplogrep3", "native"]
+
+
+def get_phylotree_marker_path(tree: str) -> str:
+    """Get path of marker recording installation of phylotree on this host."""
+
+    return os.path.join(CACHE_DIR, "phylotrees", f"{tree}.installed")
+
+
+def _get_installed_tree_dir(haplogrep3: Executable, tree: str) -> str:
+    """Get directory of tree (name@version) installed in trees directory of Haplogrep3 installation."""
+
+    exec_path = os.path.realpath(which(haplogrep3.exec_path) or haplogrep3.exec_path)
+    name, version = tree.split("@")
+
+    return os.path.join(os.path.dirname(exec_path), "trees", name, version)
+
+
+def _get_haplogrep3_fingerprint(
+    haplogrep3: Executable, tree: str, phylotree_archive: str = None
+) -> str:
+    """Identify phylotree installation (Haplogrep3 resolved path and modification time, tree and archive content)."""
+
+    exec_path = os.path.realpath(which(haplogrep3.exec_path) or haplogrep3.exec_path)
+    mtime = os.path.getmtime(exec_path) if os.path.exists(exec_path) else 0
+    archive_hash = get_file_hash(phylotree_archive) if phylotree_archive else ""
+
+    return f"{exec_path}\t{mtime}\t{tree}\t{archive_hash}"
+
+
+def _install_phylotree(
+    haplogrep3: Executable, tree: str, phylotree_archive: str = None
+) -> None:
+    """Install phylotree unless it is already installed for this Haplogrep3 installation.
+
+    Installation is guarded by a file lock, so concurrent runs install the tree only once.
+    Tree is reinstalled if it is missing from Haplogrep3 trees directory, or if Haplogrep3 installation
+    or phylotree archive changed since it was installed.
+    """
+
+    marker_fn = get_phylotree_marker_path(tree)
+    os.makedirs(os.path.dirname(marker_fn), exist_ok=True)
+    fingerprint = _get_haplogrep3_fingerprint(haplogrep3, tree, phylotree_archive)
+
+    with open(f"{marker_fn}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        if os.path.exists(marker_fn) and os.path.isdir(
+            _get_installed_tree_dir(haplogrep3, tree)
+        ):
+            with open(marker_fn) as f:
+                if f.read() == fingerprint:
+                    logging.info(f"Using installed phylotree {tree}.")
+                    return
+
+        if phylotree_archive:
+            logging.info(f"Installing phylotree from {phylotree_archive}...")
+            haplogrep3.run(phylotree_archive, subcommand="install-tree")
+        else:
+            logging.info("Downloading phylotree for RSRS reference...")
+            haplogrep3.run(tree, subcommand="install-tree")
+
+        with open(f"{marker_fn}.tmp", "w") as f:
+            f.write(fingerprint)
+        os.replace(f"{marker_fn}.tmp", marker_fn)
+
+
+def _classify(
+    vcf: str,
+    haplo_out: str,
+    mt_ref: str,
+    engine: str,
+    hits: int,
+    haplogrep3: Executable,
+    phylotree_archive: str = None,
+    phylotree_dir: str = None,
+) -> None:
+    """Classify samples of VCF file using selected engine."""
+
+    # Select phylotree
+    tree = PHYLOTREES[mt_ref.lower()]
+
+    if engine == "native":
+        if not phylotree_dir:
+            logging.error("Please provide phylotree directory for native classifier.")
+            sys.exit(1)
+        logging.info("Identifying haplogroup using native classifier...")
+        classify_vcf(vcf, get_phylotree(phylotree_dir), haplo_out, hits)
+        return
+
+    # Install phylotree for rsrs
+    if mt_ref.lower() == "rsrs":
+        _install_phylotree(haplogrep3, tree, phylotree_archive)
+
+    logging.info("Identifying haplogroup using Haplogrep3...")
+    params = {"--tree": tree, "--in": vcf, "--out": haplo_out}
+    if hits > 1:
+        params["--hits"] = hits
+    haplogrep3.run(subcommand="classify", **params)
+
 
 def do_identify_haplogroup(
     vcf: str,
     mt_ref: str = "rcrs",
     haplogrep3_path: str = "haplogrep3",
+    phylotree_archive: str = None,
+    engine: str = "haplogrep3",
+    phylotree_dir: str = None,
+    hits: int = 1,
     prefix: str = None,
     out_dir: str = None,
     verbose: bool = False,
 ) -> dict:
-    """Identify haplogroup using Haplogrep3
+    """Identify haplogroup using Haplogrep3 or native classifier
 
     Args:
         vcf (str): path to VCF file
         mt_ref (str, optional): Mitochondrial reference. Defaults to "rcrs".
         haplogrep3_path (str, optional): Haplogrep3 path. Defaults to "haplogrep3".
+        phylotree_archive (str, optional): Local phylotree archive installed instead of downloading RSRS phylotree. Defaults to None.
+        engine (str, optional): Classification engine, Haplogrep3 or native in-process classifier. Defaults to "haplogrep3".
+        phylotree_dir (str, optional): Haplogrep tree directory (tree.xml and weights.txt) used by native classifier. Defaults to None.
+        hits (int, optional): Number of top haplogroups reported per sample. Defaults to 1.
         prefix (str, optional): Prefix. Defaults to None.
         out_dir (str, optional): Output directory. Defaults to None.
         verbose (bool, optional): Verbosity. Defaults to False.
@@ -45,19 +161,18 @@ def do_identify_haplogroup(
 
     os.makedirs(out_dir, exist_ok=True)
 
-    # Select phylotree
-    tree = PHYLOTREES[mt_ref.lower()]
-
-    # Download phylotree for rsrs
-    if mt_ref.lower() == "rsrs":
-        logging.info("Downloading phylotree for RSRS reference...")
-        haplogrep3.run(tree, subcommand="install-tree")
-
     # Classify
-    logging.info("Identifying haplogroup using Haplogrep3...")
     haplo_out = create_output_path(prefix, out_dir, "_haplogroup", ".txt")
-    params = {"--tree": tree, "--in": vcf, "--out": haplo_out}
-    haplogrep3.run(subcommand="classify", **params)
+    _classify(
+        vcf,
+        haplo_out,
+        mt_ref,
+        engine,
+        hits,
+        haplogrep3,
+        phylotree_archive,
+        phylotree_dir,
+    )
 
     output_paths = {
         "haplogroups": haplo_out,
@@ -70,3 +185,115 @@ def do_identify_haplogroup(
         sys.exit(1)
 
     return output_paths
+
+
+def _split_haplogroups(haplo_out: str, sample_names: dict, out_fns: dict) -> None:
+    """Split Haplogrep3 classification of multiple samples into per-sample reports.
+
+    Args:
+        haplo_out (str): Haplogrep3 classification of all samples
+        sample_names (dict): Original sample name of each sample ID in the classification
+        out_fns (dict): Output path of each sample ID
+    """
+
+    with open(haplo_out) as f:
+        header = f.readline()
+        lines = {sample_id: [] for sample_id in out_fns}
+        for line in f:
+            sample_id, rest = line.split("\t", 1)
+            sample_id = sample_id.strip('"')
+            lines[sample_id].append(f'"{sample_names[sample_id]}"\t{rest}')
+
+    for sample_id, out_fn in out_fns.items():
+        with open(out_fn, "w") as f:
+            f.write(header)
+            f.writelines(lines[sample_id])
+
+
+def do_identify_haplogroup_cohort(
+    vcfs: list,
+    mt_ref: str = "rcrs",
+    haplogrep3_path: str = "haplogrep3",
+    phylotree_archive: str = None,
+    engine: str = "haplogrep3",
+    phylotree_dir: str = None,
+    hits: int = 1,
+    prefix: str = "cohort",
+    out_dir: str = None,
+    verbose: bool = False,
+) -> dict:
+    """Identify haplogroups of multiple samples using a single Haplogrep3 run
+
+    VCF files are merged into a multi-sample VCF file, classified at once and the classification is split back into
+    per-sample reports (prefixed with VCF basenames) and a combined table.
+
+    Args:
+        vcfs (list): paths to VCF files
+        mt_ref (str, optional): Mitochondrial reference. Defaults to "rcrs".
+        haplogrep3_path (str, optional): Haplogrep3 path. Defaults to "haplogrep3".
+        phylotree_archive (str, optional): Local phylotree archive installed instead of downloading RSRS phylotree. Defaults to None.
+        engine (str, optional): Classification engine, Haplogrep3 or native in-process classifier. Defaults to "haplogrep3".
+        phylotree_dir (str, optional): Haplogrep tree directory (tree.xml and weights.txt) used by native classifier. Defaults to None.
+        hits (int, optional): Number of top haplogroups reported per sample. Defaults to 1.
+        prefix (str, optional): Prefix of combined table. Defaults to "cohort".
+        out_dir (str, optional): Output directory. Defaults to None.
+        verbose (bool, optional): Verbosity. Defaults to False.
+
+    Returns:
+        dict: Main output file names
+    """
+
+    haplogrep3 = Executable(haplogrep3_path, verbose)
+
+    if not out_dir:
+        out_dir = get_file_directory(vcfs[0])
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Samples are identified by VCF basenames in the merged VCF
+    sample_ids = [get_file_basename(vcf) for vcf in vcfs]
+    if len(set(sample_ids)) != len(sample_ids):
+        logging.error("VCF files of the cohort must have unique basenames.")
+        sys.exit(1)
+
+    # Merge samples
+    logging.info(f"Merging {len(vcfs)} VCF files...")
+    merged_vcf = create_output_path(prefix, out_dir, "_merged_samples", ".vcf")
+    merge_samples(vcfs, merged_vcf, sample_names=sample_ids)
+
+    # Classify
+    haplo_out = create_output_path(prefix, out_dir, "_haplogroups", ".txt")
+    _classify(
+        merged_vcf,
+        haplo_out,
+        mt_ref,
+        engine,
+        hits,
+        haplogrep3,
+        phylotree_archive,
+        phylotree_dir,
+    )
+
+    # Split into per-sample reports with original sample names
+    sample_names = {}
+    for sample_id, vcf in zip(sample_ids, vcfs):
+        with pysam.VariantFile(vcf) as in_vcf:
+            sample_names[sample_id] = in_vcf.header.samples[0]
+    out_fns = {
+        sample_id: create_output_path(sample_id, out_dir, "_haplogroup", ".txt")
+        for sample_id in sample_ids
+    }
+    _split_haplogroups(haplo_out, sample_names, out_fns)
+
+    output_paths = {
+        "haplogroups": haplo_out,
+        "sample_haplogroups": list(out_fns.values()),
+    }
+    # Check if output files exist
+    if check_files_exist([haplo_out] + output_paths["sample_haplogroups"]):
+        logging.info(f"Haplogroup identification completed successfully.")
+    else:
+        logging.error("Some output files are missing! Please rerun the analysis.")
+        sys.exit(1)
+
+    return output_paths
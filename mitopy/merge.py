@@ -1,55 +1,148 @@
 import logging
-from .executable import Executable
 from .utils import (
     get_file_basename,
     get_file_directory,
     create_output_path,
     check_files_exist,
+    merge_stats_tables,
+)
+from .vcfio import (
+    merge_vcfs,
+    get_vcf_index_path,
+    read_vcf_lines,
+    write_vcf_lines,
 )
+from .executable import Executable
+from .postprocess import get_contamination, get_contamination_cache_path
+from concurrent.futures import ThreadPoolExecutor
 import os
+import pysam
 from .constants import MT_REFS
 import sys
 
 
+def _read_chain(chain_fn: str) -> list:
+    """Read ungapped alignment blocks from UCSC chain file (forward strand only).
+
+    Returns:
+        list: Blocks as (source contig, source start, target contig, target start, size), 0-based
+    """
+
+    blocks = []
+    with open(chain_fn) as f:
+        for line in f:
+            fields = line.split()
+            if not fields:
+                continue
+
+            if fields[0] == "chain":
+                source_contig, source_pos = fields[2], int(fields[5])
+                target_contig, target_pos = fields[7], int(fields[10])
+                continue
+
+            size = int(fields[0])
+            blocks.append((source_contig, source_pos, target_contig, target_pos, size))
+
+            # Gaps between blocks in source and target
+            if len(fields) == 3:
+                source_pos += size + int(fields[1])
+                target_pos += size + int(fields[2])
+
+    return blocks
+
+
+def _lift_interval(blocks: list, contig: str, start: int, end: int) -> tuple:
+    """Lift 0-based, half-open interval, which has to be contained in a single block.
+
+    Returns:
+        tuple: Target contig and start, None if interval cannot be lifted
+    """
+
+    for source_contig, source_start, target_contig, target_start, size in blocks:
+        if (
+            source_contig == contig
+            and source_start <= start
+            and end <= source_start + size
+        ):
+            return target_contig, target_start + start - source_start
+
+    return None
+
+
+def _add_filter(fields: list, name: str) -> str:
+    """Add filter to VCF record fields, return record line."""
+
+    fields = list(fields)
+    fields[6] = name if fields[6] in (".", "PASS") else f"{fields[6]};{name}"
+    return "\t".join(fields) + "\n"
+
+
 def _liftover_shifted(
     vcf_shifted: str,
     mt_ref: str,
     shift_back_chain: str,
     out_fn: str,
     rejected_out: str,
-    gatk_exec: Executable,
 ) -> None:
-    """Liftover VCF file using gatk LiftoverVcf."""
-
-    params = {
-        "-I": vcf_shifted,
-        "-R": mt_ref,
-        "-O": out_fn,
-        "-C": shift_back_chain,
-        "--REJECT": rejected_out,
-    }
+    """Liftover VCF file using shift back chain.
 
-    gatk_exec.run(subcommand="LiftoverVcf", **params)
+    Reference alleles not matching mt_ref are rewritten from mt_ref. Records that cannot be lifted
+    or whose rewritten reference allele equals an alternate allele are rejected.
+    """
 
+    blocks = _read_chain(shift_back_chain)
 
-def _merge_vcfs(
-    vcf: str, vcf_shifted_back: str, out_fn: str, gatk_exec: Executable
-) -> None:
-    """Merge VCF files using gatk MergeVcfs."""
+    with pysam.VariantFile(vcf_shifted) as in_vcf, pysam.FastaFile(mt_ref) as fasta:
+        rejected_header = in_vcf.header.copy()
+        rejected_header.filters.add(
+            "NoTarget", None, None, "Variant could not be lifted to target reference"
+        )
+        rejected_header.filters.add(
+            "MismatchedRefAllele",
+            None,
+            None,
+            "Target reference allele equals an alternate allele",
+        )
 
-    params = {"-I": [vcf, vcf_shifted_back], "-O": out_fn}
+        # Records are rewritten as text, so that values are kept as written by Mutect2
+        lifted = []
+        rejected = []
+        rewritten = 0
+        for rec, line in zip(in_vcf, read_vcf_lines(vcf_shifted)):
+            fields = line.rstrip("\n").split("\t")
 
-    gatk_exec.run(subcommand="MergeVcfs", **params)
+            target = _lift_interval(blocks, rec.chrom, rec.start, rec.stop)
+            if target is None:
+                rejected.append(_add_filter(fields, "NoTarget"))
+                continue
 
+            target_contig, target_start = target
+            target_ref = fasta.fetch(
+                target_contig, target_start, target_start + rec.rlen
+            )
+            if target_ref.upper() != rec.ref.upper():
+                if target_ref.upper() in [alt.upper() for alt in rec.alts or ()]:
+                    rejected.append(_add_filter(fields, "MismatchedRefAllele"))
+                    continue
+                fields[3] = target_ref.upper()
+                rewritten += 1
 
-def _merge_stats(
-    stats: str, stats_shifted: str, out_fn: str, gatk_exec: Executable
-) -> None:
-    """Merge VCF stats using gatk MergeMutectStats."""
+            fields[0], fields[1] = target_contig, str(target_start + 1)
+            lifted.append(((target_contig, target_start + 1), "\t".join(fields) + "\n"))
 
-    params = {"-stats": [stats, stats_shifted], "-O": out_fn}
+        if rewritten:
+            logging.warning(
+                f"Reference allele of {rewritten} lifted variants rewritten from target reference."
+            )
 
-    gatk_exec.run(subcommand="MergeMutectStats", **params)
+        write_vcf_lines(rejected_out, rejected_header, rejected)
+
+        # Blocks are lifted to different parts of the reference, restore the order
+        write_vcf_lines(
+            out_fn,
+            in_vcf.header,
+            [line for _, line in sorted(lifted, key=lambda rec: rec[0])],
+        )
 
 
 def do_merge(
@@ -61,6 +154,11 @@ def do_merge(
     out_dir: str = None,
     prefix: str = None,
     gatk_path: str = "gatk",
+    estimate_contamination: bool = False,
+    vcf_format: str = "vcf",
+    haplocheck_path: str = "haplocheck",
+    contamination_engine: str = "haplocheck",
+    phylotree_dir: str = None,
     verbose: bool = False,
 ) -> dict:
     """Merge variant calls and stats from control and non-control mt regions.
@@ -73,14 +171,17 @@ def do_merge(
         stats_shifted (str, optional): Shifted VCF stats file. Defaults to None.
         out_dir (str, optional): Output directory. Defaults to None.
         prefix (str, optional): Prefix. Defaults to None.
-        gatk_path (str, optional): Path to GATK executable. Defaults to "gatk".
+        gatk_path (str, optional): Path to GATK executable. Unused, VCFs and stats are merged in process. Defaults to "gatk".
+        estimate_contamination (bool, optional): Estimate contamination of merged VCF concurrently with merging stats (estimate is cached for postprocessing). Defaults to False.
+        vcf_format (str, optional): Output VCF format, "vcf" or "vcf.gz" (BGZF compressed, tabix indexed). Defaults to "vcf".
+        haplocheck_path (str, optional): Path to Haplocheck executable. Defaults to "haplocheck".
+        contamination_engine (str, optional): Contamination estimator, Haplocheck or native phylogeny-based estimator. Defaults to "haplocheck".
+        phylotree_dir (str, optional): Haplogrep tree directory (tree.xml and weights.txt) used by native estimator. Defaults to None.
         verbose (bool, optional): Verbosity. If true, record logs of underlying tools. Defaults to False.
 
     Returns:
         dict: Main output file paths
     """
-    gatk = Executable(gatk_path, verbose)
-
     if not prefix:
         prefix = get_file_basename(vcf)
 
@@ -93,20 +194,13 @@ def do_merge(
 
     # If stats files are not explicitly provided, check if they exist in directory of VCF
     if not stats:
-        stats = create_output_path(
-            get_file_basename(vcf), get_file_directory(vcf), "", ".vcf.stats"
-        )
+        stats = f"{vcf}.stats"
         if not os.path.exists(stats):
             logging.error("VCF stats not found, please provide path to vcf stats.")
             sys.exit(1)
 
     if not stats_shifted:
-        stats_shifted = create_output_path(
-            get_file_basename(vcf_shifted),
-            get_file_directory(vcf_shifted),
-            "",
-            ".vcf.stats",
-        )
+        stats_shifted = f"{vcf_shifted}.stats"
         if not os.path.exists(stats_shifted):
             logging.error(
                 "VCF stats not found, please provide path to shifted vcf stats."
@@ -117,8 +211,10 @@ def do_merge(
 
     # Shift back shifted VCF
     logging.info("Lifting over shifted VCF...")
-    vcf_shifted_back = create_output_path(prefix, out_dir, "_shifted_back", ".vcf")
-    vcf_rejected = create_output_path(prefix, out_dir, "_rejected", ".vcf")
+    vcf_shifted_back = create_output_path(
+        prefix, out_dir, "_shifted_back", f".{vcf_format}"
+    )
+    vcf_rejected = create_output_path(prefix, out_dir, "_rejected", f".{vcf_format}")
 
     _liftover_shifted(
         vcf_shifted=vcf_shifted,
@@ -126,30 +222,43 @@ def do_merge(
         shift_back_chain=shift_back_chain,
         out_fn=vcf_shifted_back,
         rejected_out=vcf_rejected,
-        gatk_exec=gatk,
     )
 
     # Merge VCFs
     logging.info("Merging VCFs...")
-    merged_vcf = create_output_path(prefix, out_dir, "_merged", ".vcf")
+    merged_vcf = create_output_path(prefix, out_dir, "_merged", f".{vcf_format}")
 
-    _merge_vcfs(
-        vcf=vcf, vcf_shifted_back=vcf_shifted_back, out_fn=merged_vcf, gatk_exec=gatk
-    )
+    merge_vcfs([vcf, vcf_shifted_back], merged_vcf)
 
-    # Merge VCF stats
-    logging.info("Merging Mutect2 stats...")
-    merged_stats = create_output_path(prefix, out_dir, "_merged", ".vcf.stats")
-    _merge_stats(
-        stats=stats, stats_shifted=stats_shifted, out_fn=merged_stats, gatk_exec=gatk
-    )
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # Start contamination estimation as soon as merged VCF exists
+        if estimate_contamination:
+            contamination = executor.submit(
+                get_contamination,
+                vcf=merged_vcf,
+                haplocheck_exec=Executable(haplocheck_path, verbose),
+                engine=contamination_engine,
+                phylotree_dir=phylotree_dir,
+            )
+
+        # Merge VCF stats
+        logging.info("Merging Mutect2 stats...")
+        merged_stats = f"{merged_vcf}.stats"
+        merge_stats_tables([stats, stats_shifted], merged_stats)
+
+        if estimate_contamination:
+            contamination.result()
 
     # Collect outputs
     output_paths = {
         "merged_vcf": merged_vcf,
-        "merged_vcf_index": f"{merged_vcf}.idx",
-        "merged_vcf_stats": f"{merged_vcf}.stats",
+        "merged_vcf_index": get_vcf_index_path(merged_vcf),
+        "merged_vcf_stats": merged_stats,
     }
+    if estimate_contamination:
+        output_paths["contamination_estimate"] = get_contamination_cache_path(
+            merged_vcf, contamination_engine, phylotree_dir
+        )
 
     # Check if output files exist
     if check_files_exist(list(output_paths.values())):
@@ -0,0 +1,407 @@
+from .utils import get_file_hash
+from .constants import CACHE_DIR, MT_LENGTH
+from functools import lru_cache
+import logging
+import numpy as np
+import os
+import pandas as pd
+import pysam
+import re
+import sys
+import tempfile
+import xml.etree.ElementTree as ET
+
+# Variants with lower allele fraction are heteroplasmic and not used for classification (as in Haplogrep3)
+HETEROPLASMY_LEVEL = 0.9
+
+# Mutational hotspots ignored by Haplogrep
+HOTSPOTS = {
+    "309.1C",
+    "309.2C",
+    "315.1C",
+    "523d",
+    "524d",
+    "3107d",
+    "16182C",
+    "16183C",
+    "16193.1C",
+    "16519C",
+}
+
+# Weight of mutations missing from the weights file
+DEFAULT_WEIGHT = 1.0
+
+# Version of compiled tree format in cache
+COMPILED_TREE_VERSION = 2
+
+# Contamination: variants below this allele fraction are heteroplasmic, haplogroups of major and minor profile
+# have to be at least this many nodes apart
+CONTAMINATION_HOMOPLASMY_LEVEL = 0.99
+CONTAMINATION_MIN_DISTANCE = 2
+
+# Columns of Haplocheck raw report
+CONTAMINATION_COLUMNS = [
+    "Sample",
+    "Contamination Status",
+    "Contamination Level",
+    "Distance",
+    "Overall Homoplasmies",
+    "Overall Heteroplasmies",
+    "Major Heteroplasmy Level",
+    "Minor Heteroplasmy Level",
+    "Major Haplogroup",
+    "Major Haplogroup Quality",
+    "Minor Haplogroup",
+    "Minor Haplogroup Quality",
+]
+
+POLY_PATTERN = re.compile(r"^(\d+)(\.\d+)?([ACGTd])$")
+
+
+def _parse_poly(poly: str) -> tuple:
+    """Parse Phylotree polymorphism (e.g. 263G, 8281d, 315.1C, 152C!, (16519C)).
+
+    Returns:
+        tuple: Normalised polymorphism (None if not supported), back mutation flag
+    """
+
+    poly = poly.strip().strip("()").upper().replace("D", "d")
+    back_mutation = poly.endswith("!")
+    poly = poly.rstrip("!")
+
+    return (poly if POLY_PATTERN.match(poly) else None), back_mutation
+
+
+def _read_weights(weights_txt: str) -> dict:
+    """Read phylogenetic weights of polymorphisms (polymorphism and weight columns)."""
+
+    weights = {}
+    with open(weights_txt) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 2:
+                continue
+            poly, _ = _parse_poly(fields[0])
+            try:
+                weights[poly] = float(fields[1])
+            except ValueError:
+                continue
+
+    return weights
+
+
+class Phylotree:
+    """Phylotree with defining mutations of each haplogroup encoded as bitsets.
+
+    Each haplogroup is encoded as a packed bitset over a global mutation index, containing all mutations expected
+    on the path from the root (back mutations removed).
+    """
+
+    def __init__(
+        self,
+        names: list,
+        mutations: list,
+        bitsets: np.ndarray,
+        weights: np.ndarray,
+        parents: np.ndarray,
+    ):
+        self.names = names
+        self.parents = parents
+        self.mutations = mutations
+        self.index = {mutation: i for i, mutation in enumerate(mutations)}
+        self.bitsets = bitsets
+        self.weights = weights
+
+        # Weight of all mutations expected in each haplogroup
+        self.expected_weights = np.unpackbits(
+            bitsets, axis=1, count=len(mutations)
+        ).astype(np.float32) @ weights.astype(np.float32)
+
+    @classmethod
+    def from_xml(cls, tree_xml: str, weights_txt: str):
+        """Load Phylotree from Haplogrep tree XML and weights file."""
+
+        weights = _read_weights(weights_txt)
+        names = []
+        parents = []
+        paths = []
+        mutations = {}
+
+        def traverse(node, expected, parent):
+            expected = set(expected)
+            details = node.find("details")
+            for poly in details.iter("poly") if details is not None else []:
+                poly, back_mutation = _parse_poly(poly.text or "")
+                if poly is None or poly in HOTSPOTS:
+                    continue
+                if back_mutation:
+                    expected.discard(poly)
+                else:
+                    expected.add(poly)
+                    mutations.setdefault(poly, len(mutations))
+
+            node_index = len(names)
+            names.append(node.get("name"))
+            parents.append(parent)
+            paths.append(expected)
+            for child in node.findall("haplogroup"):
+                traverse(child, expected, node_index)
+
+        traverse(next(ET.parse(tree_xml).getroot().iter("haplogroup")), set(), -1)
+
+        bits = np.zeros((len(names), len(mutations)), dtype=bool)
+        for i, expected in enumerate(paths):
+            bits[i, [mutations[poly] for poly in expected]] = True
+
+        mutations = list(mutations)
+        return cls(
+            names,
+            mutations,
+            np.packbits(bits, axis=1),
+            np.array([weights.get(poly, DEFAULT_WEIGHT) for poly in mutations]),
+            np.array(parents),
+        )
+
+    @classmethod
+    def load(cls, tree_xml: str, weights_txt: str):
+        """Load Phylotree, using compiled tree cached by content hash of tree files."""
+
+        cache_fn = os.path.join(
+            CACHE_DIR,
+            "phylotrees",
+            f"{get_file_hash(tree_xml)[:16]}_{get_file_hash(weights_txt)[:16]}"
+            f"_v{COMPILED_TREE_VERSION}.npz",
+        )
+        if os.path.exists(cache_fn):
+            with np.load(cache_fn) as data:
+                return cls(
+                    data["names"].tolist(),
+                    data["mutations"].tolist(),
+                    data["bitsets"],
+                    data["weights"],
+                    data["parents"],
+                )
+
+        tree = cls.from_xml(tree_xml, weights_txt)
+
+        # Atomic write, so that concurrent runs never read a partial file
+        os.makedirs(os.path.dirname(cache_fn), exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(cache_fn), suffix=".npz", delete=False
+        ) as f:
+            np.savez(
+                f,
+                names=np.array(tree.names),
+                mutations=np.array(tree.mutations),
+                bitsets=tree.bitsets,
+                weights=tree.weights,
+                parents=tree.parents,
+            )
+        os.replace(f.name, cache_fn)
+
+        return tree
+
+    def classify(self, polys: list, hits: int = 1) -> list:
+        """Score sample polymorphisms against all haplogroups (Kulczynski measure, as in Haplogrep).
+
+        Quality is the mean of the weight fraction of expected mutations found in the sample and the weight fraction
+        of sample mutations explained by the haplogroup.
+
+        Args:
+            polys (list): Sample polymorphisms
+            hits (int, optional): Number of top haplogroups. Defaults to 1.
+
+        Returns:
+            list: Top haplogroups with quality scores (name, quality)
+        """
+
+        polys = [poly for poly in set(polys) if poly not in HOTSPOTS]
+        known = np.array(
+            [self.index[poly] for poly in polys if poly in self.index], dtype=int
+        )
+        sample_weight = self.weights[known].sum() + DEFAULT_WEIGHT * (
+            len(polys) - len(known)
+        )
+
+        if len(known) == 0 or sample_weight == 0:
+            found_weight = np.zeros(len(self.names))
+        else:
+            # Bits of sample mutations in each haplogroup
+            found = (self.bitsets[:, known // 8] >> (7 - known % 8)) & 1
+            found_weight = found @ self.weights[known]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            quality = 0.5 * (
+                np.nan_to_num(found_weight / self.expected_weights, nan=0.0)
+                + (found_weight / sample_weight if sample_weight else 0.0)
+            )
+
+        # Stable sort keeps the order of tree (ancestors before descendants) for ties
+        top = np.argsort(-quality, kind="stable")[:hits]
+        return [(self.names[i], float(quality[i])) for i in top]
+
+    def distance(self, name1: str, name2: str) -> int:
+        """Number of branches between two haplogroups in the tree."""
+
+        def ancestors(node):
+            path = [node]
+            while self.parents[path[-1]] >= 0:
+                path.append(int(self.parents[path[-1]]))
+            return path
+
+        path1 = ancestors(self.names.index(name1))
+        path2 = ancestors(self.names.index(name2))
+        common = set(path1) & set(path2)
+
+        return next(i for i, n in enumerate(path1) if n in common) + next(
+            i for i, n in enumerate(path2) if n in common
+        )
+
+
+@lru_cache(maxsize=None)
+def get_phylotree(phylotree_dir: str) -> Phylotree:
+    """Get Phylotree from Haplogrep tree directory (tree.xml and weights.txt), loaded once per process."""
+
+    tree_xml = os.path.join(phylotree_dir, "tree.xml")
+    weights_txt = os.path.join(phylotree_dir, "weights.txt")
+    if not (os.path.isfile(tree_xml) and os.path.isfile(weights_txt)):
+        logging.error(
+            f"Phylotree directory {phylotree_dir} must contain tree.xml and weights.txt."
+        )
+        sys.exit(1)
+
+    return Phylotree.load(tree_xml, weights_txt)
+
+
+def _get_polys(rec: pysam.VariantRecord, alt: int) -> list:
+    """Convert variant allele to Phylotree polymorphisms."""
+
+    ref = rec.ref
+    alt = rec.alleles[alt]
+    if len(ref) == len(alt):
+        return [f"{rec.pos + i}{a}" for i, (r, a) in enumerate(zip(ref, alt)) if r != a]
+    if len(ref) > len(alt):
+        return [f"{rec.pos + i}d" for i in range(len(alt), len(ref))]
+
+    return [f"{rec.pos}.{i}{base}" for i, base in enumerate(alt[len(ref) :], 1)]
+
+
+def get_sample_polys(vcf: str, heteroplasmy_level: float = HETEROPLASMY_LEVEL) -> dict:
+    """Get homoplasmic polymorphisms of each sample in VCF file.
+
+    Returns:
+        dict: Polymorphisms of each sample
+    """
+
+    with pysam.VariantFile(vcf) as in_vcf:
+        samples = list(in_vcf.header.samples)
+        polys = {sample: [] for sample in samples}
+        for rec in in_vcf.fetch():
+            for sample in samples:
+                gt = rec.samples[sample]["GT"]
+                af = rec.samples[sample].get("AF")
+                for alt in sorted({a for a in gt if a is not None and a > 0}):
+                    if af and af[alt - 1] is not None:
+                        if af[alt - 1] < heteroplasmy_level:
+                            continue
+                    polys[sample].extend(_get_polys(rec, alt))
+
+    return polys
+
+
+def classify_vcf(vcf: str, tree: Phylotree, out_fn: str, hits: int = 1) -> str:
+    """Classify samples of VCF file and write report in Haplogrep3 format.
+
+    Args:
+        vcf (str): Path to VCF file
+        tree (Phylotree): Phylotree
+        out_fn (str): Path to report
+        hits (int, optional): Number of top haplogroups per sample. Defaults to 1.
+
+    Returns:
+        str: Path to report
+    """
+
+    with open(out_fn, "w") as f:
+        f.write('"SampleID"\t"Haplogroup"\t"Rank"\t"Quality"\t"Range"\n')
+        for sample, polys in get_sample_polys(vcf).items():
+            for rank, (name, quality) in enumerate(tree.classify(polys, hits), 1):
+                f.write(
+                    f'"{sample}"\t"{name}"\t"{rank}"\t"{quality:.4f}"\t"1-{MT_LENGTH}"\n'
+                )
+
+    return out_fn
+
+
+def _get_sample_profiles(
+    vcf: str, homoplasmy_level: float = CONTAMINATION_HOMOPLASMY_LEVEL
+) -> dict:
+    """Get homoplasmies and heteroplasmies (polymorphisms and allele fraction) of each sample in VCF file."""
+
+    with pysam.VariantFile(vcf) as in_vcf:
+        samples = list(in_vcf.header.samples)
+        profiles = {sample: {"hom": [], "het": []} for sample in samples}
+        for rec in in_vcf.fetch():
+            for sample in samples:
+                gt = rec.samples[sample]["GT"]
+                af = rec.samples[sample].get("AF")
+                for alt in sorted({a for a in gt if a is not None and a > 0}):
+                    alt_af = af[alt - 1] if af and af[alt - 1] is not None else 1.0
+                    if alt_af >= homoplasmy_level:
+                        profiles[sample]["hom"].extend(_get_polys(rec, alt))
+                    else:
+                        profiles[sample]["het"].append((_get_polys(rec, alt), alt_af))
+
+    return profiles
+
+
+def estimate_contamination(vcf: str, tree: Phylotree) -> pd.DataFrame:
+    """Estimate contamination of samples in VCF file based on phylogeny (as in Haplocheck).
+
+    Heteroplasmies are split into major and minor profile (with homoplasmies shared by both), which are classified
+    separately. Sample is contaminated if the haplogroups of profiles are sufficiently distant in the tree,
+    contamination level is the mean minor heteroplasmy level.
+
+    Args:
+        vcf (str): Path to VCF file
+        tree (Phylotree): Phylotree
+
+    Returns:
+        pd.DataFrame: Contamination report with Haplocheck raw report columns
+    """
+
+    rows = []
+    for sample, profile in _get_sample_profiles(vcf).items():
+        major = list(profile["hom"])
+        minor = list(profile["hom"])
+        major_levels = []
+        minor_levels = []
+        for polys, af in profile["het"]:
+            # Alternate allele belongs to major profile if it is the more frequent allele
+            (major if af >= 0.5 else minor).extend(polys)
+            major_levels.append(max(af, 1 - af))
+            minor_levels.append(min(af, 1 - af))
+
+        major_haplogroup, major_quality = tree.classify(major)[0]
+        minor_haplogroup, minor_quality = tree.classify(minor)[0]
+        distance = tree.distance(major_haplogroup, minor_haplogroup)
+        contaminated = bool(profile["het"]) and distance >= CONTAMINATION_MIN_DISTANCE
+
+        rows.append(
+            [
+                sample,
+                "YES" if contaminated else "NO",
+                f"{np.mean(minor_levels):.3f}" if contaminated else "ND",
+                distance,
+                len(profile["hom"]),
+                len(profile["het"]),
+                f"{np.mean(major_levels):.3f}" if major_levels else "ND",
+                f"{np.mean(minor_levels):.3f}" if minor_levels else "ND",
+                major_haplogroup,
+                f"{major_quality:.3f}",
+                minor_haplogroup,
+                f"{minor_quality:.3f}",
+            ]
+        )
+
+    return pd.DataFrame(rows, columns=CONTAMINATION_COLUMNS)
@@ -1,15 +1,23 @@
 from .preprocess import do_preprocess
-from .align import do_align
-from .call import do_call
+from .downsample import do_downsample, check_downsample_params
+from .align import do_align_dual
+from .call import do_call_dual
 from .merge import do_merge
 from .postprocess import do_postprocess
 from .annotate import do_annotate
 from .visualize import do_visualize
 from .haplogroup import do_identify_haplogroup
 from .coverage import do_coverage
+from .report import do_report
+from .scheduler import Stage, run_stages
 import logging
 import os
-from .utils import get_file_basename, get_file_directory, check_files_exist
+from .utils import (
+    get_file_basename,
+    get_file_directory,
+    check_files_exist,
+    read_stats_table,
+)
 import shutil
 import sys
 
@@ -25,12 +33,23 @@ def do_run_pipeline(
     remove_tmp: bool = False,
     prefix: str = None,
     ncores: int = 1,
+    target_depth: float = None,
+    downsample_fraction: float = None,
+    downsample_seed: int = 0,
+    control_region_realign: bool = False,
+    markdup_engine: str = "spark",
     m2_extra_args: str = None,
+    nshards: int = 1,
+    min_call_depth: int = 0,
+    vcf_format: str = "vcf",
     f_score_beta: float = 1,
     contamination_filter: bool = True,
+    contamination_engine: str = "haplocheck",
+    phylotree_dir: str = None,
     max_alt_allele_count: int = 4,
     vaf_treshold: float = 0,
     autosomal_coverage: float = 0,
+    estimate_autosomal_coverage: bool = False,
     blacklisted_sites: str = None,
     remove_non_pass: bool = True,
     normalize: bool = True,
@@ -41,6 +60,8 @@ def do_run_pipeline(
     phenotype_annot: bool = True,
     conservation_scores: bool = True,
     save_as_png: bool = True,
+    shared_plotlyjs: bool = False,
+    create_sample_report: bool = True,
     create_annotation_report: bool = True,
     snpeff_path: str = "snpeff",
     snpsift_path: str = "snpsift",
@@ -64,12 +85,23 @@ def do_run_pipeline(
         remove_tmp (bool, optional): Remove tmp directory. Defaults to False.
         prefix (str, optional): Prefix. Defaults to None.
         ncores (int, optional): Number of cores. Defaults to 1.
+        target_depth (float, optional): Downsample mitochondrial reads to target depth before alignment. Defaults to None.
+        downsample_fraction (float, optional): Downsample mitochondrial read pairs to fraction before alignment. Defaults to None.
+        downsample_seed (int, optional): Random seed for downsampling. Defaults to 0.
+        control_region_realign (bool, optional): Realign only reads touching control region to shifted reference. Defaults to False.
+        markdup_engine (str, optional): Duplicate marking engine ("spark", "samtools" or "auto"). Defaults to "spark".
         m2_extra_args (str, optional): Extra args for Mutect2. Defaults to None.
+        nshards (int, optional): Number of interval shards for variant calling in non-control region. Defaults to 1.
+        min_call_depth (int, optional): Call variants only in regions covered at least min_call_depth. Defaults to 0.
+        vcf_format (str, optional): Format of VCF files produced by all stages, "vcf" or "vcf.gz" (BGZF compressed, tabix indexed). Defaults to "vcf".
         f_score_beta (float, optional): F score beta. Defaults to 1.
         contamination_filter (bool, optional): Contamination filter. Defaults to True.
+        contamination_engine (str, optional): Contamination estimator ("haplocheck" or "native"). Defaults to "haplocheck".
+        phylotree_dir (str, optional): Haplogrep tree directory used by native contamination estimator. Defaults to None.
         max_alt_allele_count (int, optional): Maximuam alt allele count. Defaults to 4.
         vaf_treshold (float, optional): Minimum variant allele fraction. Defaults to 0.
         autosomal_coverage (float, optional): median autosomal coverge. Defaults to 0.
+        estimate_autosomal_coverage (bool, optional): Estimate median autosomal coverage (and mtDNA copy number) from input BAM to filter NuMTs, if autosomal_coverage is not provided. Defaults to False.
         blacklisted_sites (str, optional): Custom BED file with blacklisted sites. Defaults to None.
         remove_non_pass (bool, optional): Remove nonpass variants. Defaults to True.
         normalize (bool, optional): Normalize variants. Defaults to True.
@@ -80,6 +112,8 @@ def do_run_pipeline(
         phenotype_annot (bool, optional): Add phenotype annotations. Defaults to True.
         conservation_scores (bool, optional): Add conservation scores. Defaults to True.
         save_as_png (bool, optional): Save vis plot as PNG. Defaults to True.
+        shared_plotlyjs (bool, optional): Write plotly.js once to results directory and refer to it from HTML reports instead of embedding it. Defaults to False.
+        create_sample_report (bool, optional): Create consolidated single-file HTML report with all figures and tables. Defaults to True.
         create_annotation_report (bool, optional): Create CSV annotation report. Defaults to True.
         snpeff_path (str, optional): Path to SnpEff. Defaults to "snpeff".
         snpsift_path (str, optional): Path to SnpSift. Defaults to "snpsift".
@@ -102,6 +136,9 @@ def do_run_pipeline(
     if not tmp_dir:
         tmp_dir = "tmp"
 
+    if target_depth is not None or downsample_fraction is not None:
+        check_downsample_params(target_depth, downsample_fraction)
+
     results_dir = "results"
     intermediates = os.path.join(out_dir, tmp_dir)
     results = os.path.join(out_dir, results_dir)
@@ -110,162 +147,240 @@ def do_run_pipeline(
     os.makedirs(intermediates, exist_ok=True)
     os.makedirs(results, exist_ok=True)
 
-    final_outputs = {}
-
     logging.info(f"Running mitopy pipeline on {bam} file.")
 
-    # Preprocess BAM file
-    prep_out = do_preprocess(
-        bam=bam,
-        bai=bai,
-        reference_fa=reference_fa,
-        contig_name=contig_name,
-        out_dir=f"{intermediates}/preprocess",
-        prefix=prefix,
-        gatk_path=gatk_path,
-        verbose=verbose,
-    )
+    # Stages receive outputs of the stages they require (by stage name) and granted number of cores
 
-    # Align to canonical reference
-    align_canonical = do_align(
-        ubam=prep_out["unmapped_bam"],
-        mt_ref=mt_ref,
-        out_dir=f"{intermediates}/align",
-        prefix=prefix,
-        gatk_path=gatk_path,
-        bwamem2_path=bwamem2_path,
-        ncores=ncores,
-        verbose=verbose,
-    )
+    # Preprocess BAM file
+    def preprocess(inputs, stage_cores):
+        return do_preprocess(
+            bam=bam,
+            bai=bai,
+            reference_fa=reference_fa,
+            contig_name=contig_name,
+            out_dir=f"{intermediates}/preprocess",
+            prefix=prefix,
+            estimate_coverage=estimate_autosomal_coverage and not autosomal_coverage,
+            gatk_path=gatk_path,
+            verbose=verbose,
+        )
 
-    final_outputs.update(align_canonical)
-
-    # Align to shifted reference
-    align_shifted = do_align(
-        ubam=prep_out["unmapped_bam"],
-        mt_ref=mt_ref,
-        out_dir=f"{intermediates}/align",
-        prefix=prefix,
-        gatk_path=gatk_path,
-        bwamem2_path=bwamem2_path,
-        ncores=ncores,
-        shifted=True,
-        verbose=verbose,
-    )
+    # Downsample ultra-deep samples
+    def downsample(inputs, stage_cores):
+        return do_downsample(
+            ubam=inputs["preprocess"]["unmapped_bam"],
+            target_depth=target_depth,
+            fraction=downsample_fraction,
+            seed=downsample_seed,
+            out_dir=f"{intermediates}/downsample",
+            prefix=prefix,
+        )
 
-    final_outputs.update(
-        {"shifted_" + key: value for key, value in align_shifted.items()}
-    )
+    # Align to canonical and shifted reference
+    def align(inputs, stage_cores):
+        ubam = inputs.get("downsample", inputs["preprocess"])["unmapped_bam"]
+        return do_align_dual(
+            ubam=ubam,
+            mt_ref=mt_ref,
+            out_dir=f"{intermediates}/align",
+            prefix=prefix,
+            gatk_path=gatk_path,
+            bwamem2_path=bwamem2_path,
+            ncores=stage_cores,
+            control_region_only=control_region_realign,
+            markdup_engine=markdup_engine,
+            verbose=verbose,
+        )
 
-    # Call variants in non-control region
-    call_canonical = do_call(
-        bam=align_canonical["dedup_sorted_bam"],
-        mt_ref=mt_ref,
-        m2_extra_args=m2_extra_args,
-        out_dir=f"{intermediates}/call",
-        prefix=prefix,
-        gatk_path=gatk_path,
-        verbose=verbose,
-    )
+    # Calculate coverage
+    def coverage(inputs, stage_cores):
+        return do_coverage(
+            mt_bam=inputs["align"]["dedup_sorted_bam"],
+            shifted_mt_bam=inputs["align"]["shifted_dedup_sorted_bam"],
+            prefix=prefix,
+            out_dir=f"{intermediates}/coverage",
+            shared_plotlyjs=shared_plotlyjs,
+            mosdepth_path=mosdepth_path,
+            verbose=verbose,
+        )
 
-    # Call variants in control region
-    call_shifted = do_call(
-        bam=align_shifted["dedup_sorted_bam"],
-        mt_ref=mt_ref,
-        m2_extra_args=m2_extra_args,
-        out_dir=f"{intermediates}/call",
-        prefix=prefix,
-        gatk_path=gatk_path,
-        shifted=True,
-        verbose=verbose,
-    )
+    # Call variants in non-control and control region
+    def call(inputs, stage_cores):
+        return do_call_dual(
+            bam=inputs["align"]["dedup_sorted_bam"],
+            shifted_bam=inputs["align"]["shifted_dedup_sorted_bam"],
+            mt_ref=mt_ref,
+            m2_extra_args=m2_extra_args,
+            out_dir=f"{intermediates}/call",
+            prefix=prefix,
+            gatk_path=gatk_path,
+            ncores=stage_cores,
+            nshards=nshards,
+            min_depth=min_call_depth,
+            vcf_format=vcf_format,
+            verbose=verbose,
+        )
 
     # Merge variant calls
-    merged = do_merge(
-        vcf=call_canonical["raw_vcf"],
-        vcf_shifted=call_shifted["raw_vcf"],
-        mt_ref=mt_ref,
-        stats=call_canonical["raw_vcf_stats"],
-        stats_shifted=call_shifted["raw_vcf_stats"],
-        out_dir=f"{intermediates}/merge",
-        prefix=prefix,
-        gatk_path=gatk_path,
-        verbose=verbose,
-    )
+    def merge(inputs, stage_cores):
+        calls = inputs["call"]
+        return do_merge(
+            vcf=calls["raw_vcf"],
+            vcf_shifted=calls["shifted_raw_vcf"],
+            mt_ref=mt_ref,
+            stats=calls["raw_vcf_stats"],
+            stats_shifted=calls["shifted_raw_vcf_stats"],
+            out_dir=f"{intermediates}/merge",
+            prefix=prefix,
+            estimate_contamination=contamination_filter,
+            vcf_format=vcf_format,
+            haplocheck_path=haplocheck_path,
+            contamination_engine=contamination_engine,
+            phylotree_dir=phylotree_dir,
+            verbose=verbose,
+        )
 
     # Postprocessing
-    postprocessed = do_postprocess(
-        vcf=merged["merged_vcf"],
-        stats=merged["merged_vcf_stats"],
-        mt_ref=mt_ref,
-        f_score_beta=f_score_beta,
-        contamination_filter=contamination_filter,
-        max_alt_allele_count=max_alt_allele_count,
-        vaf_treshold=vaf_treshold,
-        autosomal_coverage=autosomal_coverage,
-        blacklisted_sites=blacklisted_sites,
-        remove_non_pass=remove_non_pass,
-        normalize=normalize,
-        out_dir=f"{intermediates}/postprocess",
-        prefix=prefix,
-        gatk_path=gatk_path,
-        haplocheck_path=haplocheck_path,
-        verbose=verbose,
-    )
-
-    final_outputs.update(postprocessed)
+    def postprocess(inputs, stage_cores):
+        # Use estimated autosomal coverage for NuMT filtering
+        prep_out = inputs["preprocess"]
+        if "coverage_estimate" in prep_out:
+            numt_coverage = read_stats_table(prep_out["coverage_estimate"])[
+                "autosomal_coverage"
+            ]
+        else:
+            numt_coverage = autosomal_coverage
 
-    # Calculate coverage
-    coverage = do_coverage(
-        mt_bam=align_canonical["dedup_sorted_bam"],
-        shifted_mt_bam=align_shifted["dedup_sorted_bam"],
-        prefix=prefix,
-        out_dir=f"{intermediates}/coverage",
-        mosdepth_path=mosdepth_path,
-        verbose=verbose,
-    )
+        return do_postprocess(
+            vcf=inputs["merge"]["merged_vcf"],
+            stats=inputs["merge"]["merged_vcf_stats"],
+            mt_ref=mt_ref,
+            f_score_beta=f_score_beta,
+            contamination_filter=contamination_filter,
+            max_alt_allele_count=max_alt_allele_count,
+            vaf_treshold=vaf_treshold,
+            autosomal_coverage=numt_coverage,
+            blacklisted_sites=blacklisted_sites,
+            remove_non_pass=remove_non_pass,
+            normalize=normalize,
+            out_dir=f"{intermediates}/postprocess",
+            prefix=prefix,
+            vcf_format=vcf_format,
+            gatk_path=gatk_path,
+            haplocheck_path=haplocheck_path,
+            contamination_engine=contamination_engine,
+            phylotree_dir=phylotree_dir,
+            verbose=verbose,
+        )
 
     # Annotate
-    annotation = do_annotate(
-        vcf=postprocessed["postprocessed_vcf"],
-        min_hom_treshold=min_hom_treshold,
-        population_freqs=population_freqs,
-        patho_predictions=patho_predictions,
-        phenotype_annot=phenotype_annot,
-        conservation_scores=conservation_scores,
-        prefix=prefix,
-        create_csv=create_annotation_report,
-        out_dir=f"{intermediates}/annotate",
-        snpeff_path=snpeff_path,
-        snpsift_path=snpsift_path,
-        verbose=verbose,
-    )
-
-    final_outputs.update(annotation)
+    def annotate(inputs, stage_cores):
+        return do_annotate(
+            vcf=inputs["postprocess"]["postprocessed_vcf"],
+            min_hom_treshold=min_hom_treshold,
+            population_freqs=population_freqs,
+            patho_predictions=patho_predictions,
+            phenotype_annot=phenotype_annot,
+            conservation_scores=conservation_scores,
+            prefix=prefix,
+            create_csv=create_annotation_report,
+            vcf_format=vcf_format,
+            out_dir=f"{intermediates}/annotate",
+            snpeff_path=snpeff_path,
+            snpsift_path=snpsift_path,
+            verbose=verbose,
+        )
 
     # Visualize
-    visualization = do_visualize(
-        vcf=postprocessed["postprocessed_vcf"],
-        coverage_csv=coverage["coverage_csv"],
-        split_strands=split_strands,
-        save_as_png=save_as_png,
-        out_dir=f"{intermediates}/visualize",
-        prefix=prefix,
+    def visualize(inputs, stage_cores):
+        return do_visualize(
+            vcf=inputs["postprocess"]["postprocessed_vcf"],
+            coverage_csv=inputs["coverage"]["coverage_csv"],
+            split_strands=split_strands,
+            save_as_png=save_as_png,
+            shared_plotlyjs=shared_plotlyjs,
+            out_dir=f"{intermediates}/visualize",
+            prefix=prefix,
+        )
+
+    # Identify haplogroups
+    def haplogroup(inputs, stage_cores):
+        return do_identify_haplogroup(
+            vcf=inputs["postprocess"]["postprocessed_vcf"],
+            mt_ref=mt_ref,
+            haplogrep3_path=haplogrep3_path,
+            prefix=prefix,
+            out_dir=f"{intermediates}/haplogroup",
+            verbose=verbose,
+        )
+
+    # Create consolidated report
+    def report(inputs, stage_cores):
+        return do_report(
+            vcf=inputs["postprocess"]["postprocessed_vcf"],
+            coverage_csv=inputs["coverage"]["coverage_csv"],
+            annot_csv=inputs["annotate"].get("annot_csv"),
+            haplogroups=inputs["haplogroup"]["haplogroups"],
+            split_strands=split_strands,
+            shared_plotlyjs=shared_plotlyjs,
+            out_dir=f"{intermediates}/report",
+            prefix=prefix,
+        )
+
+    # Dependency graph of stages, coverage is declared before calling to run alongside it,
+    # align and call use all cores not taken by concurrently running stages
+    downsample_stages = (
+        ["downsample"]
+        if target_depth is not None or downsample_fraction is not None
+        else []
     )
+    stages = [Stage("preprocess", preprocess)]
+    if downsample_stages:
+        stages.append(Stage("downsample", downsample, requires=["preprocess"]))
+    stages += [
+        Stage(
+            "align", align, requires=["preprocess"] + downsample_stages, ncores=ncores
+        ),
+        Stage("coverage", coverage, requires=["align"]),
+        Stage("call", call, requires=["align"], ncores=ncores),
+        Stage("merge", merge, requires=["call"]),
+        Stage("postprocess", postprocess, requires=["preprocess", "merge"]),
+        Stage("annotate", annotate, requires=["postprocess"]),
+        Stage("visualize", visualize, requires=["postprocess", "coverage"]),
+        Stage("haplogroup", haplogroup, requires=["postprocess"]),
+    ]
+    if create_sample_report:
+        stages.append(
+            Stage(
+                "report",
+                report,
+                requires=["postprocess", "coverage", "annotate", "haplogroup"],
+            )
+        )
 
-    final_outputs.update(visualization)
+    outputs = run_stages(stages, ncores=ncores)
 
-    # Identify haplogroups
-    haplogroups = do_identify_haplogroup(
-        vcf=postprocessed["postprocessed_vcf"],
-        mt_ref=mt_ref,
-        haplogrep3_path=haplogrep3_path,
-        prefix=prefix,
-        out_dir=f"{intermediates}/haplogroup",
-        verbose=verbose,
+    # Collect final outputs in stage order
+    final_outputs = {}
+    if "coverage_estimate" in outputs["preprocess"]:
+        final_outputs["coverage_estimate"] = outputs["preprocess"]["coverage_estimate"]
+    if "downsample" in outputs:
+        final_outputs["downsample_metrics"] = outputs["downsample"][
+            "downsample_metrics"
+        ]
+    final_outputs.update(outputs["align"])
+
+    # Record regions excluded from calling
+    final_outputs.update(
+        {
+            key: value
+            for key, value in outputs["call"].items()
+            if "excluded_regions" in key
+        }
     )
 
-    final_outputs.update(haplogroups)
+    for name in ["postprocess", "annotate", "visualize", "haplogroup", "report"]:
+        final_outputs.update(outputs.get(name, {}))
 
     # Move final outputs to results directory
     for _, fpath in final_outputs.items():
@@ -4,31 +4,117 @@ from .utils import (
     get_file_directory,
     create_output_path,
     check_files_exist,
+    get_file_hash,
 )
+from .vcfio import open_vcf_writer, index_vcf, get_vcf_index_path
+from .phylotree import get_phylotree, estimate_contamination
+from concurrent.futures import ThreadPoolExecutor
+import bisect
+import itertools
 import logging
+import math
 import os
 import pandas as pd
+import pysam
 import sys
-import glob
-from .constants import MT_REFS, MT_BLACKLIST
+import tempfile
+from typing import Iterator
+from .constants import MT_REFS, MT_BLACKLIST, CACHE_DIR
+
+# NuMT filter: alleles are expected to be supported by at most this many NuMT copies per autosome
+NUMT_MAX_AUTOSOMAL_COPIES = 4
+NUMT_LOWER_BOUND_PROB = 0.01
+
+# Haplocheck or native phylogeny-based estimator (mitopy.phylotree)
+CONTAMINATION_ENGINES = ["haplocheck", "native"]
+
+# INFO fields of split multi-allelic sites (as LeftAlignAndTrimVariants --keep-original-ac)
+SPLIT_INFO = [
+    ("AC_Orig", ".", "Integer", "Original AC"),
+    ("AF_Orig", ".", "Float", "Original AF"),
+    ("AN_Orig", 1, "Integer", "Original AN"),
+    (
+        "AlleleIndex_Orig",
+        1,
+        "Integer",
+        "Index of alternate allele in original multi-allelic site",
+    ),
+]
+
+# Hard filters of FilterMutectCalls applied natively in parameter sweep
+THRESHOLD_FILTERS = {
+    "low_allele_frac": "Allele fraction is below specified threshold",
+}
+
+
+def get_contamination_cache_path(
+    vcf: str, engine: str = "haplocheck", phylotree_dir: str = None
+) -> str:
+    """Get path of cached contamination estimate.
+
+    Estimate is keyed by content hash of VCF file and engine, for native estimator also by content hash of
+    phylotree (tree.xml and weights.txt).
+    """
 
+    suffix = "" if engine == "haplocheck" else f"_{engine}"
+    if engine == "native" and phylotree_dir:
+        for tree_fn in ["tree.xml", "weights.txt"]:
+            suffix += f"_{get_file_hash(os.path.join(phylotree_dir, tree_fn))[:16]}"
 
-def _get_contamination(vcf: str, out_dir: str, haplocheck_exec: Executable) -> float:
-    """Estimate sample contamination using haplocheck."""
+    return os.path.join(CACHE_DIR, "contamination", f"{get_file_hash(vcf)}{suffix}.txt")
 
-    out_fn = f"{out_dir}/tmp_haplo"
-    params = {"--raw": True, "--out": out_fn}
 
-    logging.info("Estimating sample contamination level using Haplocheck...")
-    haplocheck_exec.run(vcf, **params)
+def get_contamination(
+    vcf: str,
+    haplocheck_exec: Executable,
+    engine: str = "haplocheck",
+    phylotree_dir: str = None,
+) -> float:
+    """Estimate sample contamination using haplocheck or native phylogeny-based estimator.
+
+    For multi-sample VCF, the highest contamination level across samples is returned.
+    Estimates are cached, so VCF file with the same content is never estimated twice.
+    """
 
-    contamination_estimate = pd.read_csv(f"{out_fn}.raw.txt", sep="\t")[
-        "Contamination Level"
-    ].values[0]
+    if engine == "native":
+        if not phylotree_dir:
+            logging.error("Please provide phylotree directory for native estimator.")
+            sys.exit(1)
+        logging.info("Estimating sample contamination level using native estimator...")
+    else:
+        logging.info("Estimating sample contamination level using Haplocheck...")
+    cache_fn = get_contamination_cache_path(vcf, engine, phylotree_dir)
+    if os.path.exists(cache_fn):
+        logging.info(f"Using cached contamination estimate {cache_fn}.")
+        with open(cache_fn) as f:
+            return float(f.read())
+
+    if engine == "native":
+        report = estimate_contamination(vcf, get_phylotree(phylotree_dir))
+    else:
+        # Private scratch directory, so that concurrent runs do not collide
+        with tempfile.TemporaryDirectory(prefix="mitopy_haplocheck_") as scratch_dir:
+            out_fn = os.path.join(scratch_dir, "haplo")
+            params = {"--raw": True, "--out": out_fn}
+            haplocheck_exec.run(vcf, **params)
+            report = pd.read_csv(f"{out_fn}.raw.txt", sep="\t")
+
+    contamination_estimates = pd.to_numeric(
+        report["Contamination Level"], errors="coerce"
+    )
 
-    for f in glob.glob(f"{out_fn}*"):
-        os.remove(f)
-    return 0.0 if contamination_estimate == "ND" else contamination_estimate
+    contamination = (
+        0.0 if contamination_estimates.isna().all() else contamination_estimates.max()
+    )
+
+    # Write cache atomically
+    os.makedirs(os.path.dirname(cache_fn), exist_ok=True)
+    tmp_cache_fn = f"{cache_fn}.{os.getpid()}.tmp"
+    with open(tmp_cache_fn, "w") as f:
+        f.write(f"{contamination}\n")
+    os.replace(tmp_cache_fn, cache_fn)
+
+    return contamination
 
 
 def _filter_by_params(
@@ -59,62 +145,255 @@ def _filter_by_params(
     gatk_exec.run(subcommand="FilterMutectCalls", **params)
 
 
-def _filter_blacklist(
-    vcf: str, out_fn: str, blacklisted_sites: str, gatk_exec: Executable
-) -> None:
-    """Filter out blacklisted sites using gatk VariantFiltration."""
+def _read_records(vcf: str, header: pysam.VariantHeader) -> Iterator:
+    """Stream records of VCF file translated to output header."""
 
-    params = {
-        "-V": vcf,
-        "-O": out_fn,
-        "--apply-allele-specific-filters": True,
-        "--mask": blacklisted_sites,
-        "--mask-name": "blacklisted_site",
-    }
+    with pysam.VariantFile(vcf) as in_vcf:
+        for rec in in_vcf.fetch():
+            rec.translate(header)
+            yield rec
 
-    gatk_exec.run(subcommand="VariantFiltration", **params)
 
+def _add_filter(rec: pysam.VariantRecord, filter_name: str) -> None:
+    """Add filter to record (replaces PASS)."""
 
-def _filter_numts(
-    vcf: str, mt_ref: str, out_fn: str, autosomal_coverage: str, gatk_exec: Executable
-) -> None:
-    """Filter out NuMTs using gakt NuMTFilterTool."""
+    if "PASS" in rec.filter:
+        rec.filter.clear()
+    rec.filter.add(filter_name)
 
-    params = {
-        "-R": mt_ref,
-        "-V": vcf,
-        "-O": out_fn,
-        "--autosomal-coverage": autosomal_coverage,
-    }
 
-    gatk_exec.run(subcommand="NuMTFilterTool", **params)
+def _read_blacklist(blacklisted_sites: str) -> dict:
+    """Index blacklisted sites from BED file by contig (sorted, merged, 0-based half-open)."""
 
+    intervals = {}
+    with open(blacklisted_sites) as f:
+        for line in f:
+            if not line.strip() or line.startswith(("#", "track", "browser")):
+                continue
+            contig, start, end = line.split("\t")[:3]
+            intervals.setdefault(contig, []).append((int(start), int(end)))
 
-def _normalize_vcf(vcf: str, out_fn: str, mt_ref: str, gatk_exec: Executable) -> None:
-    """Normalize variants calls using gatk LeftAlignAndTrimVariants."""
+    index = {}
+    for contig, contig_intervals in intervals.items():
+        merged = []
+        for start, end in sorted(contig_intervals):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        index[contig] = ([start for start, _ in merged], [end for _, end in merged])
 
-    params = {
-        "-R": mt_ref,
-        "-V": vcf,
-        "-O": out_fn,
-        "--split-multi-allelics": True,
-        "--dont-trim-alleles": True,
-        "--keep-original-ac": True,
-    }
+    return index
 
-    gatk_exec.run(subcommand="LeftAlignAndTrimVariants", **params)
 
+def _filter_blacklist(records: Iterator, blacklisted_sites: str) -> Iterator:
+    """Filter out records overlapping blacklisted sites."""
 
-def _remove_non_pass(vcf: str, out_fn: str, gatk_exec: Executable) -> None:
-    """Remove non pass variants using gatk SelectVariants."""
+    index = _read_blacklist(blacklisted_sites)
 
-    params = {
-        "-V": vcf,
-        "-O": out_fn,
-        "--exclude-filtered": True,
-    }
+    for rec in records:
+        starts, ends = index.get(rec.chrom, ([], []))
+        i = bisect.bisect_left(starts, rec.stop)
+        if i > 0 and ends[i - 1] > rec.start:
+            _add_filter(rec, "blacklisted_site")
+        yield rec
+
+
+def _poisson_quantile(mean: float, prob: float) -> int:
+    """Smallest k such that Poisson CDF of k is at least prob."""
+
+    k = 0
+    log_pmf = -mean
+    cdf = math.exp(log_pmf)
+    while cdf < prob:
+        k += 1
+        log_pmf += math.log(mean) - math.log(k)
+        cdf += math.exp(log_pmf)
+
+    return k
+
+
+def _filter_numts(records: Iterator, autosomal_coverage: float) -> Iterator:
+    """Filter out possible NuMTs, i.e. alleles supported by fewer reads than expected from NuMT copies in autosomes."""
+
+    max_alt_depth = _poisson_quantile(
+        autosomal_coverage * NUMT_MAX_AUTOSOMAL_COPIES / 2, 1 - NUMT_LOWER_BOUND_PROB
+    )
+
+    for rec in records:
+        alt_depths = [
+            max(sample["AD"][1:], default=0)
+            for sample in rec.samples.values()
+            if sample.get("AD") and None not in sample["AD"]
+        ]
+        if alt_depths and max(alt_depths) < max_alt_depth:
+            _add_filter(rec, "possible_numt")
+        yield rec
+
+
+def _add_split_info(header: pysam.VariantHeader) -> None:
+    """Add INFO fields keeping original allele counts of split multi-allelic sites to header."""
+
+    for key, number, value_type, description in SPLIT_INFO:
+        if key not in header.info:
+            header.info.add(key, number, value_type, description)
+
+
+def _split_multiallelics(records: Iterator) -> Iterator:
+    """Split multi-allelic records to bi-allelic ones, subsetting per-allele fields.
 
-    gatk_exec.run(subcommand="SelectVariants", **params)
+    Original AC, AF and AN (if present) and the index of the alternate allele are kept in INFO,
+    as LeftAlignAndTrimVariants --keep-original-ac does (INFO fields have to be added by _add_split_info).
+    """
+
+    for rec in records:
+        if len(rec.alleles) <= 2:
+            yield rec
+            continue
+
+        for alt_idx in range(1, len(rec.alleles)):
+            split = rec.copy()
+            split.alleles = (rec.ref, rec.alleles[alt_idx])
+            for key in ["AC", "AF", "AN"]:
+                if key in rec.info and f"{key}_Orig" in rec.header.info:
+                    split.info[f"{key}_Orig"] = rec.info[key]
+            if "AlleleIndex_Orig" in rec.header.info:
+                split.info["AlleleIndex_Orig"] = alt_idx
+
+            for key, value in rec.info.items():
+                number = rec.header.info[key].number
+                if number == "A":
+                    split.info[key] = (value[alt_idx - 1],)
+                elif number == "R":
+                    split.info[key] = (value[0], value[alt_idx])
+
+            for sample_name, sample in rec.samples.items():
+                split_sample = split.samples[sample_name]
+                for key, value in sample.items():
+                    number = rec.header.formats[key].number
+                    if key == "GT" or value is None or not isinstance(value, tuple):
+                        continue
+                    if number == "A":
+                        split_sample[key] = (value[alt_idx - 1],)
+                    elif number == "R":
+                        split_sample[key] = (value[0], value[alt_idx])
+                split_sample["GT"] = (0, 1)
+                split_sample.phased = sample.phased
+
+            yield split
+
+
+def _left_align(records: Iterator, mt_ref: str) -> Iterator:
+    """Left-align bi-allelic indels against reference.
+
+    Alleles are not trimmed (bases shared by split alleles are kept), as LeftAlignAndTrimVariants --dont-trim-alleles.
+    """
+
+    with pysam.FastaFile(mt_ref) as fasta:
+        sequences = {contig: fasta.fetch(contig).upper() for contig in fasta.references}
+
+    for rec in records:
+        ref, alt = rec.alleles[0].upper(), rec.alleles[-1].upper()
+        if len(rec.alleles) != 2 or len(ref) == len(alt) or rec.chrom not in sequences:
+            yield rec
+            continue
+
+        start = rec.start
+        while ref[-1] == alt[-1] and start > 0:
+            start -= 1
+            base = sequences[rec.chrom][start]
+            ref, alt = base + ref[:-1], base + alt[:-1]
+
+        if start != rec.start:
+            rec.pos = start + 1
+            rec.alleles = (ref, alt)
+        yield rec
+
+
+def _normalize_vcf(records: Iterator, mt_ref: str) -> Iterator:
+    """Split multi-allelic sites and left-align variant calls (alleles are not trimmed)."""
+
+    return _left_align(_split_multiallelics(records), mt_ref)
+
+
+def _remove_non_pass(records: Iterator) -> Iterator:
+    """Remove non pass variants."""
+
+    for rec in records:
+        if set(rec.filter.keys()) <= {"PASS"}:
+            yield rec
+
+
+def _filter_thresholds(records: Iterator, vaf_treshold: float) -> Iterator:
+    """Apply VAF treshold to copies of records (as FilterMutectCalls hard filter)."""
+
+    for rec in records:
+        rec = rec.copy()
+        if _get_vaf(rec) < vaf_treshold:
+            _add_filter(rec, "low_allele_frac")
+        yield rec
+
+
+def _get_vaf(rec: pysam.VariantRecord) -> float:
+    """Get the highest variant allele fraction of record across samples and alleles."""
+
+    return max(
+        (
+            af
+            for sample in rec.samples.values()
+            for af in (sample.get("AF") or ())
+            if af is not None
+        ),
+        default=0.0,
+    )
+
+
+def _apply_site_filters(
+    vcf: str,
+    header: pysam.VariantHeader,
+    blacklisted_sites: str,
+    autosomal_coverage: float,
+) -> Iterator:
+    """Stream records of FilterMutectCalls output filtered for blacklisted sites and NuMTs.
+
+    Filters are added to header.
+    """
+
+    if "blacklisted_site" not in header.filters:
+        header.filters.add("blacklisted_site", None, None, "Overlaps a user-input mask")
+
+    logging.info("Filtering blacklisted sites...")
+    records = _filter_blacklist(
+        _read_records(vcf, header), blacklisted_sites=blacklisted_sites
+    )
+
+    # Filtering of NuMTs
+    if autosomal_coverage != 0:
+        logging.info("Filtering Numts...")
+        if "possible_numt" not in header.filters:
+            header.filters.add(
+                "possible_numt",
+                None,
+                None,
+                "Allele depth is below expected coverage of NuMT in autosome",
+            )
+        records = _filter_numts(records, autosomal_coverage=autosomal_coverage)
+
+    return records
+
+
+def _write_records(
+    records: Iterator, header: pysam.VariantHeader, out_fn: str, sort: bool = False
+) -> None:
+    """Write records to VCF file and index it."""
+
+    if sort:
+        records = sorted(records, key=lambda rec: (rec.chrom, rec.pos))
+
+    with open_vcf_writer(out_fn, header) as out_vcf:
+        for rec in records:
+            out_vcf.write(rec)
+    index_vcf(out_fn)
 
 
 def do_postprocess(
@@ -131,8 +410,11 @@ def do_postprocess(
     normalize: bool = True,
     out_dir: str = None,
     prefix: str = None,
+    vcf_format: str = "vcf",
     gatk_path: str = "gatk",
     haplocheck_path: str = "haplocheck",
+    contamination_engine: str = "haplocheck",
+    phylotree_dir: str = None,
     verbose: bool = False,
 ) -> dict:
     """Filter and normalize raw variant calls.
@@ -151,8 +433,11 @@ def do_postprocess(
         normalize (bool, optional): Normalize variants. Defaults to True.
         out_dir (str, optional): Output directory. Defaults to None.
         prefix (str, optional): Prefix. Defaults to None.
+        vcf_format (str, optional): Output VCF format, "vcf" or "vcf.gz" (BGZF compressed, tabix indexed). Defaults to "vcf".
         gatk_path (str, optional): Path to GATK executable. Defaults to "gatk".
         haplocheck_path (str, optional): Path to Haplocheck executable. Defaults to "haplocheck".
+        contamination_engine (str, optional): Contamination estimator, Haplocheck or native phylogeny-based estimator. Defaults to "haplocheck".
+        phylotree_dir (str, optional): Haplogrep tree directory (tree.xml and weights.txt) used by native estimator. Defaults to None.
         verbose (bool, optional): Verbosity. Defaults to False.
 
     Returns:
@@ -174,26 +459,27 @@ def do_postprocess(
 
     mt_ref_fasta = MT_REFS[mt_ref.lower()]
 
-    postprocessed_vcf = create_output_path(prefix, out_dir, "_postprocessed", ".vcf")
-
     # If contamination filter is enabled, estimate contamination, else set to 0.0
     contamination = (
-        _get_contamination(vcf=vcf, out_dir=out_dir, haplocheck_exec=haplocheck)
+        get_contamination(
+            vcf=vcf,
+            haplocheck_exec=haplocheck,
+            engine=contamination_engine,
+            phylotree_dir=phylotree_dir,
+        )
         if contamination_filter
         else 0.0
     )
 
     # Check if stats file exists
     if not stats:
-        stats = create_output_path(
-            get_file_basename(vcf), get_file_directory(vcf), "", ".vcf.stats"
-        )
+        stats = f"{vcf}.stats"
         if not os.path.exists(stats):
             logging.error("VCF stats not found, please provide path to VCF stats.")
 
     # Initial filter
     logging.info("Filtering variants by parameters...")
-    final_vcf = create_output_path(prefix, out_dir, "_filtered", ".vcf")
+    final_vcf = create_output_path(prefix, out_dir, "_filtered", f".{vcf_format}")
     _filter_by_params(
         vcf=vcf,
         mt_ref=mt_ref_fasta,
@@ -206,59 +492,35 @@ def do_postprocess(
         gatk_exec=gatk,
     )
 
-    # Blacklist filtering
-    logging.info("Filtering blacklisted sites...")
-    blacklist_vcf = create_output_path(prefix, out_dir, "_blacklisted", ".vcf")
+    # Remaining filters and normalization are fused into a single pass over the records
+    with pysam.VariantFile(final_vcf) as filtered_vcf:
+        header = filtered_vcf.header.copy()
 
-    _filter_blacklist(
-        vcf=final_vcf,
-        out_fn=blacklist_vcf,
+    records = _apply_site_filters(
+        final_vcf,
+        header,
         blacklisted_sites=blacklisted_sites,
-        gatk_exec=gatk,
+        autosomal_coverage=autosomal_coverage,
     )
 
-    final_vcf = blacklist_vcf
-
-    # Filtering of NuMTs
-    if autosomal_coverage != 0:
-        logging.info("Filtering Numts...")
-        filtered_numt = create_output_path(prefix, out_dir, "_numt", ".vcf")
-        _filter_numts(
-            vcf=final_vcf,
-            mt_ref=mt_ref_fasta,
-            out_fn=filtered_numt,
-            gatk_exec=gatk,
-            autosomal_coverage=autosomal_coverage,
-        )
-
-        final_vcf = filtered_numt
-
     # Normalize
     if normalize:
         logging.info("Splitting multi-allelic sites and left-aligning variant calls...")
-        normalized_vcf = create_output_path(prefix, out_dir, "_normalized", ".vcf")
-
-        _normalize_vcf(
-            vcf=final_vcf, out_fn=normalized_vcf, mt_ref=mt_ref_fasta, gatk_exec=gatk
-        )
-
-        final_vcf = normalized_vcf
+        _add_split_info(header)
+        records = _normalize_vcf(records, mt_ref=mt_ref_fasta)
 
     # Remove non pass variants
     if remove_non_pass:
         logging.info("Removing non pass variants...")
-        pass_vcf = create_output_path(prefix, out_dir, "_pass", ".vcf")
-        _remove_non_pass(vcf=final_vcf, out_fn=pass_vcf, gatk_exec=gatk)
-
-        final_vcf = pass_vcf
+        records = _remove_non_pass(records)
 
-    postprocessed_vcf = create_output_path(prefix, out_dir, "_postprocessed", ".vcf")
-    postprocessed_vcf_idx = create_output_path(
-        prefix, out_dir, "_postprocessed", ".vcf.idx"
+    postprocessed_vcf = create_output_path(
+        prefix, out_dir, "_postprocessed", f".{vcf_format}"
     )
+    postprocessed_vcf_idx = get_vcf_index_path(postprocessed_vcf)
 
-    os.rename(final_vcf, postprocessed_vcf)
-    os.rename(f"{final_vcf}.idx", postprocessed_vcf_idx)
+    # Left-alignment may change order of records
+    _write_records(records, header, postprocessed_vcf, sort=normalize)
 
     # Collect outputs
     output_paths = {
@@ -274,3 +536,197 @@ def do_postprocess(
         sys.exit(1)
 
     return output_paths
+
+
+def do_postprocess_sweep(
+    vcf: str,
+    stats: str = None,
+    mt_ref: str = "rcrs",
+    f_score_beta: list = None,
+    vaf_treshold: list = None,
+    max_alt_allele_count: list = None,
+    min_hom_treshold: list = None,
+    contamination_filter: bool = False,
+    autosomal_coverage: float = 0,
+    blacklisted_sites: str = None,
+    normalize: bool = True,
+    write_vcfs: bool = False,
+    ncores: int = 1,
+    out_dir: str = None,
+    prefix: str = None,
+    vcf_format: str = "vcf",
+    gatk_path: str = "gatk",
+    haplocheck_path: str = "haplocheck",
+    contamination_engine: str = "haplocheck",
+    phylotree_dir: str = None,
+    verbose: bool = False,
+) -> dict:
+    """Sweep postprocessing parameters on a single VCF file.
+
+    FilterMutectCalls is run once per F score beta and max alternate allele count (in parallel), the VAF and homoplasmy tresholds are applied to cached records.
+    Number of passing variants for each parameter combination is recorded in a table.
+
+    Args:
+        vcf (str): Path to VCF file
+        stats (str, optional): Path to VCF stats file. Defaults to None.
+        mt_ref (str, optional): Mitochondrial reference. Defaults to "rcrs".
+        f_score_beta (list, optional): F score beta values. Defaults to None ([1.0]).
+        vaf_treshold (list, optional): VAF treshold values. Defaults to None ([0]).
+        max_alt_allele_count (list, optional): Max alternate allele count values. Defaults to None ([4]).
+        min_hom_treshold (list, optional): Minimum homoplasmy level treshold values. Defaults to None ([0.95]).
+        contamination_filter (bool, optional): Activate contamination filter. Defaults to False.
+        autosomal_coverage (float, optional): Median autosomal coverage. If set, NuMTs will be filtered. Defaults to 0.
+        blacklisted_sites (str, optional): Path to BED file containing custom blacklisted sites. Defaults to None.
+        normalize (bool, optional): Normalize variants. Defaults to True.
+        write_vcfs (bool, optional): Write postprocessed VCF file for each parameter combination. Defaults to False.
+        ncores (int, optional): Number of cores. Defaults to 1.
+        out_dir (str, optional): Output directory. Defaults to None.
+        prefix (str, optional): Prefix. Defaults to None.
+        vcf_format (str, optional): Output VCF format, "vcf" or "vcf.gz" (BGZF compressed, tabix indexed). Defaults to "vcf".
+        gatk_path (str, optional): Path to GATK executable. Defaults to "gatk".
+        haplocheck_path (str, optional): Path to Haplocheck executable. Defaults to "haplocheck".
+        contamination_engine (str, optional): Contamination estimator, Haplocheck or native phylogeny-based estimator. Defaults to "haplocheck".
+        phylotree_dir (str, optional): Haplogrep tree directory (tree.xml and weights.txt) used by native estimator. Defaults to None.
+        verbose (bool, optional): Verbosity. Defaults to False.
+
+    Returns:
+        dict: Main output file paths
+    """
+    haplocheck = Executable(haplocheck_path, verbose)
+    gatk = Executable(gatk_path, verbose)
+
+    if not prefix:
+        prefix = get_file_basename(vcf)
+
+    if not out_dir:
+        out_dir = get_file_directory(vcf)
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    if not blacklisted_sites:
+        blacklisted_sites = MT_BLACKLIST[mt_ref.lower()]
+
+    mt_ref_fasta = MT_REFS[mt_ref.lower()]
+
+    f_score_beta = f_score_beta or [1.0]
+    vaf_treshold = vaf_treshold or [0]
+    max_alt_allele_count = max_alt_allele_count or [4]
+    min_hom_treshold = min_hom_treshold or [0.95]
+
+    # Contamination does not depend on swept parameters, estimate it once
+    contamination = (
+        get_contamination(
+            vcf=vcf,
+            haplocheck_exec=haplocheck,
+            engine=contamination_engine,
+            phylotree_dir=phylotree_dir,
+        )
+        if contamination_filter
+        else 0.0
+    )
+
+    if not stats:
+        stats = f"{vcf}.stats"
+        if not os.path.exists(stats):
+            logging.error("VCF stats not found, please provide path to VCF stats.")
+            sys.exit(1)
+
+    # FilterMutectCalls once per F score beta and max alternate allele count (multiallelic filter counts
+    # only alleles passing tumor LOD, which is decided by FilterMutectCalls), VAF treshold is applied later
+    filtered_vcfs = {
+        (beta, max_alt): create_output_path(
+            prefix, out_dir, f"_filtered_beta{beta}_maxalt{max_alt}", f".{vcf_format}"
+        )
+        for beta, max_alt in itertools.product(
+            sorted(set(f_score_beta)), sorted(set(max_alt_allele_count))
+        )
+    }
+
+    logging.info(
+        f"Filtering variants with {len(filtered_vcfs)} F score beta and max alternate allele count combinations..."
+    )
+    ncores = os.cpu_count() if ncores == -1 else ncores
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(ncores, len(filtered_vcfs)))
+    ) as executor:
+        futures = [
+            executor.submit(
+                _filter_by_params,
+                vcf=vcf,
+                mt_ref=mt_ref_fasta,
+                stats=stats,
+                vaf_treshold=0,
+                max_alt_allele_count=max_alt,
+                f_score_beta=beta,
+                contamination=contamination,
+                out_fn=filtered_vcf,
+                gatk_exec=gatk,
+            )
+            for (beta, max_alt), filtered_vcf in filtered_vcfs.items()
+        ]
+        for future in futures:
+            future.result()
+
+    # Apply tresholds to cached records
+    logging.info("Applying tresholds for each parameter combination...")
+    sweep = []
+    output_paths = {}
+    for (beta, max_alt), filtered_vcf in filtered_vcfs.items():
+        with pysam.VariantFile(filtered_vcf) as in_vcf:
+            header = in_vcf.header.copy()
+        for filter_name, description in THRESHOLD_FILTERS.items():
+            if filter_name not in header.filters:
+                header.filters.add(filter_name, None, None, description)
+        if normalize:
+            _add_split_info(header)
+
+        records = list(
+            _apply_site_filters(
+                filtered_vcf,
+                header,
+                blacklisted_sites=blacklisted_sites,
+                autosomal_coverage=autosomal_coverage,
+            )
+        )
+
+        for vaf in sorted(set(vaf_treshold)):
+            passing = _filter_thresholds(records, vaf_treshold=vaf)
+            if normalize:
+                passing = _normalize_vcf(passing, mt_ref=mt_ref_fasta)
+            passing = list(_remove_non_pass(passing))
+
+            vafs = [_get_vaf(rec) for rec in passing]
+            for min_hom in sorted(set(min_hom_treshold)):
+                n_homoplasmic = sum(af > min_hom for af in vafs)
+                sweep.append(
+                    {
+                        "f_score_beta": beta,
+                        "vaf_treshold": vaf,
+                        "max_alt_allele_count": max_alt,
+                        "min_hom_treshold": min_hom,
+                        "variants": len(vafs),
+                        "homoplasmic": n_homoplasmic,
+                        "heteroplasmic": len(vafs) - n_homoplasmic,
+                    }
+                )
+
+            if write_vcfs:
+                setting = f"beta{beta}_vaf{vaf}_maxalt{max_alt}"
+                setting_vcf = create_output_path(
+                    prefix, out_dir, f"_postprocessed_{setting}", f".{vcf_format}"
+                )
+                _write_records(passing, header, setting_vcf, sort=normalize)
+                output_paths[f"postprocessed_vcf_{setting}"] = setting_vcf
+
+    sweep_table = create_output_path(prefix, out_dir, "_sweep", ".csv")
+    pd.DataFrame(sweep).to_csv(sweep_table, index=False)
+    output_paths = {"sweep_table": sweep_table, **output_paths}
+
+    # Check if output files exist
+    if check_files_exist(list(output_paths.values())):
+        logging.info(f"Postprocessing parameter sweep completed successfully.")
+    else:
+        logging.error("Some output files are missing! Please rerun the analysis.")
+        sys.exit(1)
+
+    return output_paths
@@ -10,12 +10,22 @@ from .utils import (
     get_file_directory,
     get_mt_contig_name,
     create_output_path,
+    write_stats_table,
 )
+from .constants import MT_LENGTH
 import logging
+import numpy as np
 import os
+import pysam
 from .executable import Executable
 import sys
 
+AUTOSOMES = {str(i) for i in range(1, 23)} | {f"chr{i}" for i in range(1, 23)}
+
+# Autosomal coverage is sampled in evenly spaced windows
+COVERAGE_WINDOWS = 100
+COVERAGE_WINDOW_SIZE = 10000
+
 
 def _subset_bam_chrm(
     bam: str,
@@ -56,6 +66,131 @@ def _generate_ubam(bam: str, out_fn: str, gatk_exec: Executable) -> None:
     gatk_exec.run(subcommand="RevertSam", **params)
 
 
+def _sample_window_depth(
+    aln: pysam.AlignmentFile, contig: str, start: int, end: int
+) -> np.ndarray:
+    """Per-base depth of window (CollectWgsMetrics read filters)."""
+
+    depth_diff = np.zeros(end - start + 1, dtype=np.int64)
+    for read in aln.fetch(contig, start, end):
+        if (
+            read.is_unmapped
+            or read.is_secondary
+            or read.is_supplementary
+            or read.is_duplicate
+            or read.is_qcfail
+            or read.mapping_quality < 20
+        ):
+            continue
+        depth_diff[max(read.reference_start, start) - start] += 1
+        depth_diff[min(read.reference_end, end) - start] -= 1
+
+    return np.cumsum(depth_diff[:-1])
+
+
+def _estimate_coverage(
+    bam: str,
+    contig_name: str,
+    reference_fa: str = None,
+    bai: str = None,
+    nwindows: int = COVERAGE_WINDOWS,
+    window_size: int = COVERAGE_WINDOW_SIZE,
+) -> dict:
+    """Estimate autosomal coverage and mtDNA copy number without full scan of BAM/CRAM.
+
+    Mean coverages are derived from index statistics (mapped reads), median autosomal coverage from sampled windows.
+    If index statistics are not available (CRAM), mean coverages are derived from sampled windows and mitochondrial contig depth.
+    """
+
+    with pysam.AlignmentFile(
+        bam, reference_filename=reference_fa, index_filename=bai
+    ) as aln:
+        autosomes = [
+            (contig, length)
+            for contig, length in zip(aln.references, aln.lengths)
+            if contig in AUTOSOMES
+        ]
+        if not autosomes:
+            raise ValueError("Autosomal contigs not found in the BAM/CRAM file.")
+        autosomal_length = sum(length for _, length in autosomes)
+
+        # Evenly spaced windows across concatenated autosomes
+        offsets = np.cumsum([0] + [length for _, length in autosomes])
+        window_starts = np.linspace(0, autosomal_length - window_size, nwindows)
+        depths = []
+        read_lengths = []
+        fasta = pysam.FastaFile(reference_fa) if reference_fa else None
+        for window_start in window_starts.astype(np.int64):
+            i = np.searchsorted(offsets, window_start, side="right") - 1
+            contig, length = autosomes[i]
+            start = int(window_start - offsets[i])
+            end = min(start + window_size, length)
+
+            depth = _sample_window_depth(aln, contig, start, end)
+            if fasta:
+                # Exclude reference gaps (N), as CollectWgsMetrics
+                sequence = np.frombuffer(
+                    fasta.fetch(contig, start, end).upper().encode(), dtype="S1"
+                )
+                depth = depth[sequence != b"N"]
+            elif not depth.any():
+                # Without reference, empty windows are likely reference gaps
+                continue
+            depths.append(depth)
+
+            if len(read_lengths) < 1000:
+                read_lengths.extend(
+                    read.query_length or read.infer_read_length() or 0
+                    for _, read in zip(range(100), aln.fetch(contig, start, end))
+                )
+
+        if fasta:
+            fasta.close()
+
+        depths = np.concatenate(depths) if depths else np.zeros(1)
+        read_length = np.mean(read_lengths) if read_lengths else 0.0
+
+        coverage = {
+            "autosomal_coverage": float(np.median(depths)),
+            "autosomal_coverage_mean": float(np.mean(depths)),
+            "read_length": float(read_length),
+        }
+
+        # Mean coverage from index statistics (BAM only, CRAI lacks read counts and reports zeros)
+        try:
+            mapped = {stat.contig: stat.mapped for stat in aln.get_index_statistics()}
+        except (ValueError, AttributeError):
+            mapped = {}
+
+        if any(mapped.values()):
+            autosomal_mean = coverage["autosomal_coverage_index"] = (
+                sum(mapped.get(contig, 0) for contig, _ in autosomes)
+                * read_length
+                / autosomal_length
+            )
+            coverage["mt_coverage"] = (
+                mapped.get(contig_name, 0) * read_length / MT_LENGTH
+            )
+        elif contig_name in aln.references:
+            # Mitochondrial contig is small, its mean depth is computed directly
+            autosomal_mean = coverage["autosomal_coverage_mean"]
+            coverage["mt_coverage"] = float(
+                np.mean(
+                    _sample_window_depth(
+                        aln, contig_name, 0, aln.get_reference_length(contig_name)
+                    )
+                )
+            )
+        else:
+            autosomal_mean = 0
+
+    # Two autosome copies per diploid cell
+    if autosomal_mean > 0:
+        coverage["mtdna_copy_number"] = 2 * coverage["mt_coverage"] / autosomal_mean
+
+    return coverage
+
+
 def do_preprocess(
     bam: str,
     bai: str = None,
@@ -63,6 +198,7 @@ def do_preprocess(
     contig_name: str = None,
     out_dir: str = None,
     prefix: str = None,
+    estimate_coverage: bool = False,
     gatk_path: str = "gatk",
     verbose: bool = True,
 ) -> dict:
@@ -75,6 +211,7 @@ def do_preprocess(
         contig_name (str, optional): Name of the mitochondrial contig. Defaults to None.
         out_dir (str, optional): Output directory. Defaults to None.
         prefix (str, optional): Prefix. Defaults to None.
+        estimate_coverage (bool, optional): Estimate median autosomal coverage and mtDNA copy number from index statistics and sampled windows. Defaults to False.
         gatk_path (str, optional): Path to GATK executable. Defaults to "gatk".
         verbose (bool, optional): Verbosity. If True, record logs of underlying tools. Defaults to True.
 
@@ -171,6 +308,24 @@ def do_preprocess(
     # Collect outputs
     output_paths = {"unmapped_bam": revert_out}
 
+    # Estimate autosomal coverage (e.g. for NuMT filtering)
+    if estimate_coverage:
+        logging.info("Estimating autosomal coverage and mtDNA copy number...")
+        try:
+            coverage = _estimate_coverage(bam, contig_name, reference_fa, bai)
+        except ValueError as e:
+            logging.error(f"Coverage could not be estimated: {e}")
+            sys.exit(1)
+
+        coverage_estimate = create_output_path(
+            prefix, out_dir, "_coverage_estimate", ".txt"
+        )
+        write_stats_table(coverage, coverage_estimate)
+        logging.info(
+            f"Estimated median autosomal coverage: {coverage['autosomal_coverage']:.1f}x."
+        )
+        output_paths["coverage_estimate"] = coverage_estimate
+
     # Check if output files exist
     if check_files_exist(list(output_paths.values())):
         logging.info(f"Preprocessing of {bam} completed successfully.")
@@ -0,0 +1,243 @@
+from .utils import (
+    get_file_basename,
+    get_file_directory,
+    create_output_path,
+    check_files_exist,
+    write_plotlyjs,
+)
+from .visualize import _create_figure
+from .coverage import _plot_coverage
+import base64
+import gzip
+import html
+import json
+import logging
+import os
+import pandas as pd
+import plotly.offline
+import sys
+
+# Height of annotation table row (px), rows are rendered only when scrolled into view
+TABLE_ROW_HEIGHT = 24
+
+REPORT_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{{title}}</title>
+<style>
+body { font-family: sans-serif; margin: 0; }
+header { padding: 12px 20px; background: #333; color: white; }
+nav button { border: none; padding: 10px 16px; cursor: pointer; background: #eee; }
+nav button.active { background: #ccc; }
+section { display: none; padding: 16px 20px; }
+section.active { display: block; }
+.viewport { height: 600px; overflow: auto; position: relative; border: 1px solid #ccc; }
+.viewport table { position: absolute; top: 0; border-collapse: collapse; font-size: 13px; }
+.viewport td, .viewport th { height: {{row_height}}px; padding: 0 8px; white-space: nowrap; border-bottom: 1px solid #eee; }
+.viewport thead th { position: sticky; top: 0; background: #f6f6f6; }
+</style>
+{{plotlyjs}}
+</head>
+<body>
+<header><b>{{title}}</b></header>
+<nav>{{tabs}}</nav>
+{{sections}}
+{{data}}
+<script>
+const ROW_HEIGHT = {{row_height}};
+const decoded = {};
+
+// Decode gzip compressed, base64 encoded data embedded in the report (once, on first use)
+function loadData(name) {
+  if (!decoded[name]) {
+    const bytes = Uint8Array.from(atob(document.getElementById("data-" + name).textContent.trim()), c => c.charCodeAt(0));
+    const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("gzip"));
+    decoded[name] = new Response(stream).json();
+  }
+  return decoded[name];
+}
+
+// Render only rows visible in the viewport
+function renderTable(section, table) {
+  const viewport = section.querySelector(".viewport");
+  const spacer = viewport.querySelector(".spacer");
+  const tbody = viewport.querySelector("tbody");
+  const escape = value => String(value).replace(/&/g, "&amp;").replace(/</g, "&lt;");
+  viewport.querySelector("thead").innerHTML = "<tr>" + table.columns.map(c => "<th>" + escape(c) + "</th>").join("") + "</tr>";
+  spacer.style.height = ((table.rows.length + 1) * ROW_HEIGHT) + "px";
+  const draw = () => {
+    const first = Math.max(0, Math.floor(viewport.scrollTop / ROW_HEIGHT) - 10);
+    const last = Math.min(table.rows.length, first + Math.ceil(viewport.clientHeight / ROW_HEIGHT) + 20);
+    const rows = [];
+    for (let i = first; i < last; i++) {
+      rows.push("<tr>" + table.rows[i].map(v => "<td>" + escape(v) + "</td>").join("") + "</tr>");
+    }
+    tbody.style.transform = "translateY(" + (first * ROW_HEIGHT) + "px)";
+    tbody.innerHTML = rows.join("");
+  };
+  viewport.addEventListener("scroll", () => requestAnimationFrame(draw));
+  draw();
+}
+
+const rendered = {};
+async function show(name) {
+  document.querySelectorAll("nav button, section").forEach(e => e.classList.toggle("active", e.dataset.name === name));
+  if (rendered[name]) return;
+  rendered[name] = true;
+  const section = document.getElementById("section-" + name);
+  const data = await loadData(name);
+  if (section.dataset.kind === "figure") {
+    Plotly.newPlot(section.querySelector(".figure"), data.data, data.layout);
+  } else {
+    renderTable(section, data);
+  }
+}
+document.querySelectorAll("nav button").forEach(b => b.addEventListener("click", () => show(b.dataset.name)));
+show(document.querySelector("nav button").dataset.name);
+</script>
+</body>
+</html>
+"""
+
+
+def _encode_data(data_json: str) -> str:
+    """Gzip compress and base64 encode JSON data."""
+
+    return base64.b64encode(gzip.compress(data_json.encode(), mtime=0)).decode()
+
+
+def _read_table(table_fn: str, sep: str = ",") -> str:
+    """Read table to JSON with columns and rows of strings."""
+
+    table = pd.read_csv(table_fn, sep=sep, dtype=str, keep_default_na=False)
+    return json.dumps(
+        {"columns": table.columns.tolist(), "rows": table.to_numpy().tolist()},
+        separators=(",", ":"),
+    )
+
+
+def _create_section(name: str, title: str, kind: str) -> str:
+    """Create HTML of report section (figure or virtualised table)."""
+
+    if kind == "figure":
+        content = '<div class="figure"></div>'
+    else:
+        content = (
+            '<div class="viewport"><div class="spacer"></div>'
+            "<table><thead></thead><tbody></tbody></table></div>"
+        )
+
+    return f'<section id="section-{name}" data-name="{name}" data-kind="{kind}"><h2>{html.escape(title)}</h2>{content}</section>'
+
+
+def do_report(
+    vcf: str,
+    coverage_csv: str = None,
+    annot_csv: str = None,
+    haplogroups: str = None,
+    split_strands: bool = False,
+    shared_plotlyjs: bool = False,
+    out_dir: str = None,
+    prefix: str = None,
+) -> dict:
+    """Create consolidated single-file HTML report of a sample.
+
+    Figures and tables are embedded once as gzip compressed JSON and decoded in the browser when their tab is opened.
+    Annotation table is virtualised, only rows scrolled into view are rendered.
+
+    Args:
+        vcf (str): Path to VCF file with (postprocessed) variants
+        coverage_csv (str, optional): Path to CSV containing coverage. Defaults to None.
+        annot_csv (str, optional): Path to CSV annotation report. Defaults to None.
+        haplogroups (str, optional): Path to haplogroup classification. Defaults to None.
+        split_strands (bool, optional): Split strands on mito genome. Defaults to False.
+        shared_plotlyjs (bool, optional): Write plotly.js once per output directory (plotly.min.js) and refer to it from report instead of embedding it. Defaults to False.
+        out_dir (str, optional): Output directory. Defaults to None.
+        prefix (str, optional): Prefix. Defaults to None.
+
+    Returns:
+        dict: Main output file paths
+    """
+
+    if not out_dir:
+        out_dir = get_file_directory(vcf)
+
+    if not prefix:
+        prefix = get_file_basename(vcf)
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Collect sections (name, title, kind, data), coverage has its own section
+    logging.info("Collecting report data...")
+    sections = [
+        (
+            "variants",
+            "Variants",
+            "figure",
+            _create_figure(vcf, None, split_strands).to_json(),
+        )
+    ]
+    if coverage_csv:
+        coverage_fig = _plot_coverage(pd.read_csv(coverage_csv))
+        sections.append(("coverage", "Coverage", "figure", coverage_fig.to_json()))
+    if annot_csv:
+        sections.append(("annotation", "Annotation", "table", _read_table(annot_csv)))
+    if haplogroups:
+        sections.append(
+            ("haplogroup", "Haplogroup", "table", _read_table(haplogroups, sep="\t"))
+        )
+
+    # Shared or embedded plotly.js
+    if shared_plotlyjs:
+        plotlyjs_fn = write_plotlyjs(out_dir)
+        plotlyjs = '<script src="plotly.min.js"></script>'
+    else:
+        plotlyjs = f"<script>{plotly.offline.get_plotlyjs()}</script>"
+
+    # Fill template
+    logging.info("Writing report...")
+    report = (
+        REPORT_TEMPLATE.replace("{{title}}", html.escape(f"mitopy report: {prefix}"))
+        .replace("{{row_height}}", str(TABLE_ROW_HEIGHT))
+        .replace(
+            "{{tabs}}",
+            "".join(
+                f'<button data-name="{name}">{title}</button>'
+                for name, title, _, _ in sections
+            ),
+        )
+        .replace(
+            "{{sections}}",
+            "\n".join(
+                _create_section(name, title, kind) for name, title, kind, _ in sections
+            ),
+        )
+        .replace(
+            "{{data}}",
+            "\n".join(
+                f'<script type="application/octet-stream" id="data-{name}">{_encode_data(data)}</script>'
+                for name, _, _, data in sections
+            ),
+        )
+        .replace("{{plotlyjs}}", plotlyjs)
+    )
+
+    report_html = create_output_path(prefix, out_dir, "_report", ".html")
+    with open(report_html, "w") as f:
+        f.write(report)
+
+    output_paths = {
+        "report_html": report_html,
+    }
+    if shared_plotlyjs:
+        output_paths["plotlyjs"] = plotlyjs_fn
+
+    # Check if output files exist
+    if check_files_exist(list(output_paths.values())):
+        logging.info(f"Sample report completed successfully.")
+    else:
+        logging.error("Some output files are missing! Please rerun the analysis.")
+        sys.exit(1)
+
+    return output_paths
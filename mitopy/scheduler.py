@@ -0,0 +1,108 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import logging
+import os
+import sys
+
+
+class Stage:
+    """A pipeline stage, a function of outputs of the stages it requires.
+
+    The function is called as func(inputs, ncores), where inputs maps names of required stages to their outputs
+    and ncores is the number of cores granted to the stage. It returns a dict of output file paths.
+    """
+
+    def __init__(self, name: str, func, requires: list = None, ncores: int = 1):
+        self.name = name
+        self.func = func
+        self.requires = list(requires) if requires else []
+        self.ncores = ncores
+
+
+def _check_stages(stages: list) -> None:
+    """Check that stage names are unique, required stages exist and dependencies are acyclic."""
+
+    names = [stage.name for stage in stages]
+    if len(set(names)) != len(names):
+        logging.error("Pipeline stage names are not unique.")
+        sys.exit(1)
+
+    requires = {stage.name: stage.requires for stage in stages}
+    for stage in stages:
+        missing = [name for name in stage.requires if name not in requires]
+        if missing:
+            logging.error(
+                f"Pipeline stage {stage.name} requires unknown stages: {', '.join(missing)}"
+            )
+            sys.exit(1)
+
+    # Kahn's algorithm, stages left over are part of a cycle
+    resolved = set()
+    while len(resolved) < len(stages):
+        ready = [
+            name
+            for name, deps in requires.items()
+            if name not in resolved and all(dep in resolved for dep in deps)
+        ]
+        if not ready:
+            logging.error(
+                f"Pipeline stages contain a dependency cycle: {', '.join(sorted(set(names) - resolved))}"
+            )
+            sys.exit(1)
+        resolved.update(ready)
+
+
+def run_stages(stages: list, ncores: int = 1) -> dict:
+    """Run stages as a dependency graph, running stages whose inputs are ready concurrently.
+
+    Stages are started in the order given as soon as all required stages have finished and cores are free.
+    A stage is granted up to its requested cores (-1 for all), but at least one, so the total never exceeds ncores.
+    If a stage fails, no further stages are started, running stages are awaited and the error is raised.
+
+    Args:
+        stages (list): Stages to run
+        ncores (int, optional): Number of cores. Defaults to 1.
+
+    Returns:
+        dict: Outputs of stages by stage name
+    """
+
+    _check_stages(stages)
+
+    ncores = os.cpu_count() if ncores == -1 else max(1, ncores)
+
+    outputs = {}
+    pending = list(stages)
+    running = {}
+    free_cores = ncores
+
+    with ThreadPoolExecutor(max_workers=max(1, len(stages))) as executor:
+        while pending or running:
+            # Start ready stages while cores are available
+            for stage in list(pending):
+                if free_cores == 0:
+                    break
+                if not all(name in outputs for name in stage.requires):
+                    continue
+
+                requested = ncores if stage.ncores == -1 else max(1, stage.ncores)
+                granted = min(requested, free_cores)
+                free_cores -= granted
+                pending.remove(stage)
+
+                inputs = {name: outputs[name] for name in stage.requires}
+                future = executor.submit(stage.func, inputs, granted)
+                running[future] = (stage, granted)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                stage, granted = running.pop(future)
+                free_cores += granted
+
+                # Raised once running stages finish (on executor shutdown)
+                if future.exception() is not None:
+                    raise future.exception()
+
+                outputs[stage.name] = future.result()
+
+    return outputs
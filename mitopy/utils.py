@@ -1,8 +1,11 @@
 import os
+import hashlib
 import logging
+import plotly.offline
 import pysam
 from pathlib import Path
 import subprocess
+import tempfile
 
 
 def check_files_exist(files: list | str, verbose: bool = False) -> bool:
@@ -83,8 +86,9 @@ def get_file_directory(file_path: str) -> str:
 
 
 def get_file_basename(file_path: str) -> str:
-    """Get basename of the file."""
-    return str(Path(file_path).stem)
+    """Get basename of the file (without .gz compression extension)."""
+    path = Path(file_path)
+    return str(Path(path.stem).stem if path.suffix == ".gz" else path.stem)
 
 
 def get_file_extension(file_path: str) -> str:
@@ -95,3 +99,70 @@ def get_file_extension(file_path: str) -> str:
 def create_output_path(prefix, out_dir, suffix, ext):
     """Create file path."""
     return f"{out_dir}/{prefix}{suffix}{ext}"
+
+
+def get_file_hash(file_path: str) -> str:
+    """Get SHA-256 hash of the file content."""
+
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def read_stats_table(stats_file: str) -> dict:
+    """Read two-column (statistic, value) table, e.g. Mutect2 stats."""
+
+    stats = {}
+    with open(stats_file) as f:
+        next(f)
+        for line in f:
+            if line.strip():
+                statistic, value = line.rstrip("\n").split("\t")
+                stats[statistic] = float(value)
+    return stats
+
+
+def write_stats_table(stats: dict, out_fn: str) -> None:
+    """Write two-column (statistic, value) table, e.g. Mutect2 stats."""
+
+    with open(out_fn, "w") as f:
+        f.write("statistic\tvalue\n")
+        for statistic, value in stats.items():
+            f.write(f"{statistic}\t{value}\n")
+
+
+def merge_stats_tables(stats: list, out_fn: str) -> None:
+    """Merge Mutect2 stats files by summing the statistics (e.g. callable sites)."""
+
+    merged = {}
+    for stats_file in stats:
+        for statistic, value in read_stats_table(stats_file).items():
+            merged[statistic] = merged.get(statistic, 0.0) + value
+
+    write_stats_table(merged, out_fn)
+
+
+def write_plotlyjs(out_dir: str) -> str:
+    """Write plotly.js of installed plotly version to output directory as plotly.min.js, shared by HTML files.
+
+    Existing copy is replaced if it differs (e.g. written by other plotly version).
+
+    Returns:
+        str: Path to plotly.js
+    """
+
+    plotlyjs = plotly.offline.get_plotlyjs()
+    plotlyjs_fn = os.path.join(out_dir, "plotly.min.js")
+    if os.path.exists(plotlyjs_fn):
+        with open(plotlyjs_fn) as f:
+            if f.read() == plotlyjs:
+                return plotlyjs_fn
+
+    # Atomic write, so that concurrent runs never read a partial file
+    with tempfile.NamedTemporaryFile("w", dir=out_dir, suffix=".js", delete=False) as f:
+        f.write(plotlyjs)
+    os.replace(f.name, plotlyjs_fn)
+
+    return plotlyjs_fn
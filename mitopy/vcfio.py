@@ -0,0 +1,294 @@
+import gzip
+import heapq
+import logging
+import os
+import pysam
+import struct
+import sys
+
+# Tribble linear index (htsjdk LinearIndex, version 3)
+TRIBBLE_MAGIC_NUMBER = 1480870228
+TRIBBLE_LINEAR_INDEX_TYPE = 1
+TRIBBLE_INDEX_VERSION = 3
+TRIBBLE_SEQUENCE_DICTIONARY_FLAG = 0x8000
+TRIBBLE_BIN_WIDTH = 8000
+
+# Plain text VCF with Tribble index or BGZF compressed VCF with tabix index
+VCF_FORMATS = ["vcf", "vcf.gz"]
+
+
+def get_vcf_index_path(vcf: str) -> str:
+    """Get path of VCF index (tabix for compressed, Tribble for plain text VCF)."""
+
+    return f"{vcf}.tbi" if vcf.endswith(".gz") else f"{vcf}.idx"
+
+
+def open_vcf_writer(out_fn: str, header: pysam.VariantHeader) -> pysam.VariantFile:
+    """Open VCF file for writing (BGZF compressed if path ends with .gz)."""
+
+    return pysam.VariantFile(
+        out_fn, "wz" if out_fn.endswith(".gz") else "w", header=header
+    )
+
+
+def read_vcf_lines(vcf: str):
+    """Iterate over record lines of VCF file (plain text or BGZF compressed) as written, without re-encoding values."""
+
+    with gzip.open(vcf, "rt") if vcf.endswith(".gz") else open(vcf) as f:
+        for line in f:
+            if not line.startswith("#"):
+                yield line if line.endswith("\n") else f"{line}\n"
+
+
+def write_vcf_lines(out_fn: str, header: pysam.VariantHeader, lines) -> None:
+    """Write VCF header and record lines (BGZF compressed if path ends with .gz)."""
+
+    with (
+        pysam.BGZFile(out_fn, "wb") if out_fn.endswith(".gz") else open(out_fn, "wb")
+    ) as f:
+        f.write(str(header).encode())
+        for line in lines:
+            f.write(line.encode())
+
+
+def index_vcf(vcf: str) -> str:
+    """Index coordinate-sorted VCF file (tabix for compressed, Tribble for plain text VCF).
+
+    Returns:
+        str: Path to index
+    """
+
+    if vcf.endswith(".gz"):
+        pysam.tabix_index(vcf, preset="vcf", force=True)
+        return get_vcf_index_path(vcf)
+
+    return write_tribble_index(vcf)
+
+
+def _merge_headers(headers: list) -> pysam.VariantHeader:
+    """Reconcile headers of VCF files (union of header records, samples have to match)."""
+
+    merged = headers[0].copy()
+    for header in headers[1:]:
+        if list(header.samples) != list(merged.samples):
+            logging.error("VCF files to merge contain different samples.")
+            sys.exit(1)
+        merged.merge(header)
+
+    return merged
+
+
+def _tribble_string(value: str) -> bytes:
+    """Encode null-terminated string."""
+
+    return value.encode() + b"\0"
+
+
+def write_tribble_index(vcf: str, out_fn: str = None) -> str:
+    """Write Tribble linear index (.idx) of uncompressed, coordinate-sorted VCF file.
+
+    Args:
+        vcf (str): Path to VCF file
+        out_fn (str, optional): Path to index. Defaults to None (VCF path with .idx suffix).
+
+    Returns:
+        str: Path to index
+    """
+
+    if not out_fn:
+        out_fn = f"{vcf}.idx"
+
+    contigs = []
+    chr_indices = []
+    with open(vcf, "rb") as f:
+        offset = 0
+        for line in f:
+            line_start = offset
+            offset += len(line)
+
+            if line.startswith(b"##contig=<"):
+                fields = dict(
+                    field.split("=", 1)
+                    for field in line.decode().strip()[10:-1].split(",")
+                    if "=" in field
+                )
+                contigs.append((fields["ID"], fields.get("length", "0")))
+            if line.startswith(b"#"):
+                continue
+
+            contig, pos, _, ref = line.split(b"\t", 4)[:4]
+            contig, pos = contig.decode(), int(pos)
+
+            # New contig, blocks of previous one end at the current record
+            if not chr_indices or chr_indices[-1]["name"] != contig:
+                if chr_indices:
+                    chr_indices[-1]["end"] = line_start
+                chr_indices.append({"name": contig, "blocks": [], "longest": 0, "n": 0})
+
+            # Bins are 1-based as in htsjdk LinearIndexCreator, (k * width, (k + 1) * width]
+            chr_index = chr_indices[-1]
+            while len(chr_index["blocks"]) <= (pos - 1) // TRIBBLE_BIN_WIDTH:
+                chr_index["blocks"].append(line_start)
+            chr_index["longest"] = max(chr_index["longest"], len(ref))
+            chr_index["n"] += 1
+
+        if chr_indices:
+            chr_indices[-1]["end"] = offset
+
+    # Header
+    index = struct.pack(
+        "<iii", TRIBBLE_MAGIC_NUMBER, TRIBBLE_LINEAR_INDEX_TYPE, TRIBBLE_INDEX_VERSION
+    )
+    index += _tribble_string(os.path.abspath(vcf))
+    index += struct.pack("<qq", os.path.getsize(vcf), int(os.path.getmtime(vcf) * 1000))
+    index += _tribble_string("")
+    index += struct.pack(
+        "<ii", TRIBBLE_SEQUENCE_DICTIONARY_FLAG if contigs else 0, len(contigs)
+    )
+    for name, length in contigs:
+        index += _tribble_string(f"DICT:{name}") + _tribble_string(length)
+
+    # Per contig blocks (start offsets of bins, followed by end of last bin)
+    index += struct.pack("<i", len(chr_indices))
+    for chr_index in chr_indices:
+        index += _tribble_string(chr_index["name"])
+        index += struct.pack(
+            "<iiiii",
+            TRIBBLE_BIN_WIDTH,
+            len(chr_index["blocks"]),
+            chr_index["longest"],
+            0,
+            chr_index["n"],
+        )
+        for block_start in chr_index["blocks"] + [chr_index["end"]]:
+            index += struct.pack("<q", block_start)
+
+    with open(out_fn, "wb") as f:
+        f.write(index)
+
+    return out_fn
+
+
+def merge_vcfs(vcfs: list, out_fn: str, index: bool = True) -> str:
+    """Merge coordinate-sorted VCF files by streaming k-way merge.
+
+    Headers are reconciled and records are ordered by contig order of the merged header and position.
+    Records are copied as written.
+
+    Args:
+        vcfs (list): Paths to VCF files
+        out_fn (str): Path to merged VCF file
+        index (bool, optional): Index merged VCF file. Defaults to True.
+
+    Returns:
+        str: Path to merged VCF file
+    """
+
+    headers = []
+    for vcf in vcfs:
+        with pysam.VariantFile(vcf) as in_vcf:
+            headers.append(in_vcf.header.copy())
+    header = _merge_headers(headers)
+    contig_order = {contig: i for i, contig in enumerate(header.contigs)}
+
+    def record_key(line):
+        contig, pos = line.split("\t", 2)[:2]
+        return contig_order.get(contig, -1), int(pos)
+
+    # Records are merged as text, so that values are kept as written
+    write_vcf_lines(
+        out_fn,
+        header,
+        heapq.merge(*(read_vcf_lines(vcf) for vcf in vcfs), key=record_key),
+    )
+
+    if index:
+        index_vcf(out_fn)
+
+    return out_fn
+
+
+def _format_genotype(sample: pysam.libcbcf.VariantRecordSample) -> str:
+    """Format genotype and allele fraction of a sample as GT:AF string."""
+
+    gt = "/".join("." if allele is None else str(allele) for allele in sample["GT"])
+    af = sample.get("AF")
+    af = ",".join(f"{value:.3f}" for value in af) if af and None not in af else "."
+
+    return f"{gt}:{af}"
+
+
+def merge_samples(vcfs: list, out_fn: str, sample_names: list = None) -> str:
+    """Merge single-sample VCF files into a multi-sample VCF file.
+
+    Sites are matched on position and alleles. Samples without a variant at a site are given a reference genotype,
+    as single-sample VCF files only list variant sites. Only genotype (GT) and allele fraction (AF) are kept.
+
+    Args:
+        vcfs (list): Paths to single-sample VCF files
+        out_fn (str): Path to merged VCF file
+        sample_names (list, optional): Sample names in merged VCF file. Defaults to None (names from input VCF files).
+
+    Returns:
+        str: Path to merged VCF file
+    """
+
+    sites = {}
+    names = []
+    for i, vcf in enumerate(vcfs):
+        with pysam.VariantFile(vcf) as in_vcf:
+            if len(in_vcf.header.samples) != 1:
+                logging.error(f"VCF file {vcf} does not contain exactly one sample.")
+                sys.exit(1)
+
+            if i == 0:
+                header = in_vcf.header
+                contig_order = {contig: j for j, contig in enumerate(header.contigs)}
+            names.append(in_vcf.header.samples[0])
+
+            for rec in in_vcf.fetch():
+                key = (contig_order.get(rec.chrom, -1), rec.pos, rec.chrom, rec.alleles)
+                sites.setdefault(key, {})[i] = _format_genotype(rec.samples[0])
+
+    if sample_names:
+        names = sample_names
+
+    with open(out_fn, "w") as f:
+        f.write("##fileformat=VCFv4.2\n")
+        f.write(
+            '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n'
+            '##FORMAT=<ID=AF,Number=A,Type=Float,Description="Allele fractions of alternate alleles">\n'
+        )
+        for contig in header.contigs.values():
+            f.write(f"##contig=<ID={contig.name},length={contig.length}>\n")
+        f.write(
+            "\t".join(
+                [
+                    "#CHROM",
+                    "POS",
+                    "ID",
+                    "REF",
+                    "ALT",
+                    "QUAL",
+                    "FILTER",
+                    "INFO",
+                    "FORMAT",
+                ]
+                + names
+            )
+            + "\n"
+        )
+
+        for key in sorted(sites):
+            _, pos, chrom, alleles = key
+            genotypes = [sites[key].get(i, "0/0:.") for i in range(len(vcfs))]
+            f.write(
+                "\t".join(
+                    [chrom, str(pos), ".", alleles[0], ",".join(alleles[1:])]
+                    + [".", ".", ".", "GT:AF"]
+                    + genotypes
+                )
+                + "\n"
+            )
+
+    return out_fn
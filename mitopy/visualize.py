@@ -1,15 +1,24 @@
 import pandas as pd
+import plotly
 import plotly.graph_objects as go
+import plotly.io as pio
 from pysam import VariantFile
+from concurrent.futures import Future, ProcessPoolExecutor
+import copy
+import itertools
+import json
 import sys
 import os
+import tempfile
 from .utils import (
     get_file_directory,
     create_output_path,
     get_file_basename,
     check_files_exist,
+    get_file_hash,
+    write_plotlyjs,
 )
-from .constants import VIS_RESOURCES
+from .constants import VIS_RESOURCES, MT_LENGTH, CACHE_DIR
 import logging
 
 
@@ -20,7 +29,17 @@ color_type_mapping = {
     "CDS": "darkred",
 }
 
-MT_LENGTH = 16569
+# Serialised mitochondrial genome base figures, keyed by annotation content, layout version, plotly version and strand split
+_mtbase_cache = {}
+
+# Bump when _plot_mtbase changes, so that figures cached on disk are rebuilt
+MTBASE_LAYOUT_VERSION = 1
+
+# Cohort visualization modes: variants of all samples on gene ring or position x sample heatmap
+COHORT_VIS_MODES = ["ring", "heatmap"]
+
+# Columns of cohort variant table
+VARIANT_TABLE_COLUMNS = ["sample", "pos", "ref", "alt", "af"]
 
 
 def _convert_to_polar(pos: int) -> float:
@@ -53,6 +72,48 @@ def _parse_vcf(vcf: str) -> dict:
     }
 
 
+def _read_variant_table(vcf: str) -> tuple:
+    """Read samples and variants of all samples in VCF file into table (one row per sample and alternate allele)."""
+
+    rows = []
+    with VariantFile(vcf) as vcf_file:
+        samples = list(vcf_file.header.samples)
+        for rec in vcf_file.fetch():
+            for sample in samples:
+                gt = rec.samples[sample]["GT"]
+                af = rec.samples[sample].get("AF") or [None] * len(rec.alts)
+                for alt in sorted({a for a in gt if a is not None and a > 0}):
+                    rows.append(
+                        (sample, rec.pos, rec.ref, rec.alleles[alt], af[alt - 1])
+                    )
+
+    return samples, pd.DataFrame(rows, columns=VARIANT_TABLE_COLUMNS)
+
+
+def read_variant_tables(vcfs: list, ncores: int = 1) -> pd.DataFrame:
+    """Read variants of multiple VCF files in parallel into a single columnar table.
+
+    Samples of VCF headers are categories of the sample column, including samples without variants.
+
+    Returns:
+        pd.DataFrame: Variant table (sample, pos, ref, alt, af)
+    """
+
+    if not vcfs:
+        logging.error("No VCF files to read variants from.")
+        sys.exit(1)
+
+    with ProcessPoolExecutor(max_workers=ncores) as executor:
+        results = list(executor.map(_read_variant_table, vcfs))
+
+    samples = list(dict.fromkeys(s for samples, _ in results for s in samples))
+    table = pd.concat([table for _, table in results], ignore_index=True)
+    table["sample"] = pd.Categorical(table["sample"], categories=samples)
+    table["af"] = table["af"].astype(float)
+
+    return table
+
+
 def _create_feature_trace(mito_map: list, feature_type: str) -> go.Figure:
     """Create mito feature trace."""
 
@@ -94,11 +155,8 @@ def _plot_mtbase(split: bool = False) -> go.Figure:
         for strand in mito_annot["strand"]
     ]
 
-    # Calculate thetas (positions of angular axis)
-    theta = [0.5 * w for w in widths]
-    for index, w in enumerate(widths):
-        for subsequent_index in range(index + 1, len(widths)):
-            theta[subsequent_index] += w
+    # Calculate thetas (positions of angular axis), centers of features laid out one after another
+    theta = [end - 0.5 * w for end, w in zip(itertools.accumulate(widths), widths)]
 
     # MT coordinates
     mt_coordinates = list(range(0, MT_LENGTH + 1, 1000))
@@ -155,6 +213,38 @@ def _plot_mtbase(split: bool = False) -> go.Figure:
     return fig
 
 
+def _get_mtbase(split: bool = False) -> go.Figure:
+    """Get mitochondrial genome map.
+
+    Base figure is built once per annotation, layout version, plotly version and strand split,
+    cached in memory and on disk (as JSON) and cloned for each sample.
+    """
+
+    key = (
+        f"mtbase_{get_file_hash(VIS_RESOURCES['mitomap'])[:16]}"
+        f"_v{MTBASE_LAYOUT_VERSION}_plotly{plotly.__version__}"
+        f"_{'split' if split else 'joint'}"
+    )
+    if key not in _mtbase_cache:
+        cache_fn = os.path.join(CACHE_DIR, "visualize", f"{key}.json")
+        if os.path.exists(cache_fn):
+            with open(cache_fn) as f:
+                _mtbase_cache[key] = json.load(f)
+        else:
+            _mtbase_cache[key] = json.loads(_plot_mtbase(split).to_json())
+
+            # Atomic write, so that concurrent runs never read a partial file
+            os.makedirs(os.path.dirname(cache_fn), exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "w", dir=os.path.dirname(cache_fn), suffix=".json", delete=False
+            ) as f:
+                json.dump(_mtbase_cache[key], f)
+            os.replace(f.name, cache_fn)
+
+    # Cached figure is already validated
+    return go.Figure(copy.deepcopy(_mtbase_cache[key]), _validate=False)
+
+
 def _add_variant_trace(fig: go.Figure, vcf: str) -> go.Figure:
     """Add variants to the figure."""
 
@@ -256,11 +346,74 @@ def _add_coverage_trace(fig: go.Figure, coverage_csv: str) -> go.Figure:
     return fig
 
 
+def _create_figure(
+    vcf: str, coverage_csv: str = None, split_strands: bool = False
+) -> go.Figure:
+    """Create visualization of variants (and coverage) on mitochondrial genome map."""
+
+    # Plot mitochondrial genome map
+    logging.info("Plotting mtiochondrial genome base...")
+    fig = _get_mtbase(split_strands)
+
+    # Plot variants
+    logging.info("Plotting variants...")
+    fig = _add_variant_trace(fig, vcf)
+
+    # Add coverage plot
+    if coverage_csv:
+        logging.info("Plotting per base coverage...")
+        fig = _add_coverage_trace(fig, coverage_csv)
+
+    return fig
+
+
+def _init_png_worker() -> None:
+    """Start Kaleido renderer of worker process, it is kept alive for all figures rendered by the worker."""
+
+    pio.to_image(go.Figure(), format="png")
+
+
+def _render_png(fig_json: str, out_png: str) -> str:
+    """Render figure (serialised as JSON) to PNG image."""
+
+    pio.write_image(json.loads(fig_json), out_png, format="png", validate=False)
+
+    return out_png
+
+
+class PngRenderer:
+    """A pool of persistent PNG export workers, each keeping one Kaleido renderer alive."""
+
+    def __init__(self, nworkers: int = 1):
+        self.executor = ProcessPoolExecutor(
+            max_workers=nworkers, initializer=_init_png_worker
+        )
+
+    def submit(self, fig: go.Figure, out_png: str) -> Future:
+        """Queue figure for rendering to PNG image.
+
+        Returns:
+            Future: Future resolving to path of PNG image
+        """
+        return self.executor.submit(_render_png, fig.to_json(), out_png)
+
+    def close(self) -> None:
+        """Wait for queued figures and stop workers."""
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
 def do_visualize(
     vcf: str,
     coverage_csv: str = None,
     split_strands: bool = False,
     save_as_png: bool = False,
+    shared_plotlyjs: bool = False,
     out_dir: str = None,
     prefix: str = None,
 ) -> dict:
@@ -271,6 +424,7 @@ def do_visualize(
         coverage_csv (str, optional): Path to CSV containing coverage. Defaults to None.
         split_strands (bool, optional): Split strands on mito genome. Defaults to False.
         save_as_png (bool, optional): Save plot as PNG. Defaults to False.
+        shared_plotlyjs (bool, optional): Write plotly.js once per output directory (plotly.min.js) and refer to it from HTML instead of embedding it. Defaults to False.
         out_dir (str, optional): Output directory. Defaults to None.
         prefix (str, optional): Prefix. Defaults to None.
 
@@ -286,28 +440,20 @@ def do_visualize(
 
     os.makedirs(out_dir, exist_ok=True)
 
-    # Plot mitochondrial genome map
-    logging.info("Plotting mtiochondrial genome base...")
-    fig = _plot_mtbase(split_strands)
-
-    # Plot variants
-    logging.info("Plotting variants...")
-    fig = _add_variant_trace(fig, vcf)
-
-    # Add coverage plot
-    if coverage_csv:
-        logging.info("Plotting per base coverage...")
-        fig = _add_coverage_trace(fig, coverage_csv)
+    fig = _create_figure(vcf, coverage_csv, split_strands)
 
     # Save as HTML
     out_html = create_output_path(
         prefix=prefix, out_dir=out_dir, suffix="", ext=".html"
     )
-    fig.write_html(out_html)
-
     output_paths = {
         "vis_html": out_html,
     }
+    if shared_plotlyjs:
+        output_paths["plotlyjs"] = write_plotlyjs(out_dir)
+    fig.write_html(
+        out_html, include_plotlyjs="plotly.min.js" if shared_plotlyjs else True
+    )
 
     # Save as PNG
     if save_as_png:
@@ -315,8 +461,8 @@ def do_visualize(
         out_png = create_output_path(
             prefix=prefix, out_dir=out_dir, suffix="", ext=".png"
         )
-        fig.write_image(out_png)
-        output_paths["vis_png"] = out_png
+        with PngRenderer() as renderer:
+            output_paths["vis_png"] = renderer.submit(fig, out_png).result()
 
     # Check if output files exist
     if check_files_exist(list(output_paths.values())):
@@ -326,3 +472,264 @@ def do_visualize(
         sys.exit(1)
 
     return output_paths
+
+
+def do_visualize_batch(
+    vcfs: list,
+    coverage_csvs: list = None,
+    split_strands: bool = False,
+    save_as_png: bool = False,
+    shared_plotlyjs: bool = False,
+    ncores: int = 1,
+    out_dir: str = None,
+) -> dict:
+    """Visualize variant calls of multiple samples.
+
+    Figures are created in the main process while PNG images are rendered by a pool of persistent Kaleido workers,
+    so the renderer is started once per worker instead of once per sample.
+
+    Args:
+        vcfs (list): Paths to input VCF files
+        coverage_csvs (list, optional): Paths to CSVs containing coverage (in the same order as VCF files). Defaults to None.
+        split_strands (bool, optional): Split strands on mito genome. Defaults to False.
+        save_as_png (bool, optional): Save plots as PNG. Defaults to False.
+        shared_plotlyjs (bool, optional): Write plotly.js once per output directory (plotly.min.js) and refer to it from HTML instead of embedding it. Defaults to False.
+        ncores (int, optional): Number of PNG rendering workers. Defaults to 1.
+        out_dir (str, optional): Output directory. Defaults to None (directory of each VCF file).
+
+    Returns:
+        dict: Main output file paths
+    """
+
+    if coverage_csvs and len(coverage_csvs) != len(vcfs):
+        logging.error("Please provide coverage CSV for each VCF file.")
+        sys.exit(1)
+
+    if not coverage_csvs:
+        coverage_csvs = [None] * len(vcfs)
+
+    output_paths = {"vis_html": []}
+    renderer = PngRenderer(ncores) if save_as_png else None
+    try:
+        pngs = []
+        for vcf, coverage_csv in zip(vcfs, coverage_csvs):
+            vis_dir = out_dir if out_dir else get_file_directory(vcf)
+            os.makedirs(vis_dir, exist_ok=True)
+            prefix = get_file_basename(vcf)
+
+            fig = _create_figure(vcf, coverage_csv, split_strands)
+
+            # Save as HTML
+            out_html = create_output_path(
+                prefix=prefix, out_dir=vis_dir, suffix="", ext=".html"
+            )
+            if shared_plotlyjs:
+                write_plotlyjs(vis_dir)
+            fig.write_html(
+                out_html, include_plotlyjs="plotly.min.js" if shared_plotlyjs else True
+            )
+            output_paths["vis_html"].append(out_html)
+
+            # Queue PNG rendering
+            if renderer:
+                out_png = create_output_path(
+                    prefix=prefix, out_dir=vis_dir, suffix="", ext=".png"
+                )
+                pngs.append(renderer.submit(fig, out_png))
+
+        if renderer:
+            logging.info("Saving as PNG images...")
+            output_paths["vis_png"] = [png.result() for png in pngs]
+    finally:
+        if renderer:
+            renderer.close()
+
+    if shared_plotlyjs:
+        output_paths["plotlyjs"] = sorted(
+            {
+                os.path.join(get_file_directory(html), "plotly.min.js")
+                for html in output_paths["vis_html"]
+            }
+        )
+
+    # Check if output files exist
+    if check_files_exist(
+        output_paths["vis_html"]
+        + output_paths.get("vis_png", [])
+        + output_paths.get("plotlyjs", [])
+    ):
+        logging.info(f"Variant visualization completed successfully.")
+    else:
+        logging.error("Some output files are missing! Please rerun the analysis.")
+        sys.exit(1)
+
+    return output_paths
+
+
+def _plot_cohort_ring(
+    table: pd.DataFrame, bin_size: int, split_strands: bool
+) -> go.Figure:
+    """Plot variants of all samples on mitochondrial genome map (WebGL), with number of carriers per bin."""
+
+    fig = _get_mtbase(split_strands)
+    n_samples = max(len(table["sample"].cat.categories), 1)
+
+    # Variants (heteroplasmy level scaled to variant band)
+    trace_width = 20
+    trace_start = 40
+    fig.add_trace(
+        go.Barpolar(
+            r=[0.3, 0.3],
+            theta=[0, 0],
+            width=[360, 360],
+            base=[trace_start, trace_start + trace_width],
+            marker_color=["black", "black"],
+            hoverinfo="skip",
+            showlegend=False,
+        )
+    )
+    fig.add_trace(
+        go.Scatterpolargl(
+            r=trace_start + table["af"].fillna(1.0) * trace_width,
+            theta=table["pos"].map(_convert_to_polar),
+            mode="markers",
+            marker=dict(color="black", size=4, opacity=0.4),
+            customdata=table[VARIANT_TABLE_COLUMNS].to_numpy(),
+            hovertemplate="Sample: %{customdata[0]}<br>"
+            + "Position: %{customdata[1]}<br>"
+            + "Reference Allele: %{customdata[2]}<br>"
+            + "Alternate Allele: %{customdata[3]}<br>"
+            + "Heteroplasmy Fraction: %{customdata[4]:.2f}<extra></extra>",
+            name="Variants",
+        )
+    )
+
+    # Carriers per bin (scaled to inner band)
+    trace_width = 20
+    bins = (table["pos"] - 1) // bin_size
+    carriers = table.assign(bin=bins).groupby("bin")["sample"].nunique()
+    fig.add_trace(
+        go.Barpolar(
+            r=carriers.to_numpy() / n_samples * trace_width,
+            theta=[_convert_to_polar((b + 0.5) * bin_size) for b in carriers.index],
+            width=_convert_to_polar(bin_size),
+            marker_color="#E3735E",
+            customdata=[
+                (b * bin_size + 1, (b + 1) * bin_size, c) for b, c in carriers.items()
+            ],
+            hovertemplate="Positions: %{customdata[0]}-%{customdata[1]}<br>"
+            + "Samples with variants: %{customdata[2]}<extra></extra>",
+            name="Samples with variants",
+        )
+    )
+
+    fig.update_layout(title=f"Variants of {n_samples} samples")
+
+    return fig
+
+
+def _plot_cohort_heatmap(table: pd.DataFrame, bin_size: int) -> go.Figure:
+    """Plot maximal heteroplasmy level per position bin and sample."""
+
+    bins = (table["pos"] - 1) // bin_size
+    heatmap = (
+        table.assign(bin=bins, af=table["af"].fillna(1.0))
+        .pivot_table(
+            index="sample", columns="bin", values="af", aggfunc="max", observed=False
+        )
+        .reindex(
+            index=table["sample"].cat.categories,
+            columns=range((MT_LENGTH - 1) // bin_size + 1),
+        )
+    )
+
+    fig = go.Figure(
+        go.Heatmap(
+            z=heatmap.to_numpy(),
+            x=[b * bin_size + 1 for b in heatmap.columns],
+            y=heatmap.index.astype(str),
+            colorscale="Reds",
+            zmin=0,
+            zmax=1,
+            colorbar=dict(title="Heteroplasmy"),
+            hovertemplate="Sample: %{y}<br>Positions from: %{x}<br>"
+            + "Max heteroplasmy fraction: %{z:.2f}<extra></extra>",
+        )
+    )
+    fig.update_layout(
+        title=f"Heteroplasmy of {len(heatmap)} samples",
+        xaxis_title="Position (bp)",
+        yaxis_title="Sample",
+        height=max(400, 15 * len(heatmap)),
+    )
+
+    return fig
+
+
+def do_visualize_cohort(
+    vcfs: list,
+    mode: str = "ring",
+    bin_size: int = 100,
+    split_strands: bool = False,
+    shared_plotlyjs: bool = False,
+    ncores: int = 1,
+    out_dir: str = None,
+    prefix: str = "cohort",
+) -> dict:
+    """Visualize variant calls of multiple samples in a single figure.
+
+    VCF files are read in parallel into a single variant table, which is rendered either as variants of all samples
+    on mitochondrial genome map (WebGL) or as heatmap of heteroplasmy levels per position bin and sample.
+
+    Args:
+        vcfs (list): Paths to input VCF files
+        mode (str, optional): Visualization mode, "ring" or "heatmap". Defaults to "ring".
+        bin_size (int, optional): Size of position bins (bp). Defaults to 100.
+        split_strands (bool, optional): Split strands on mito genome (ring mode). Defaults to False.
+        shared_plotlyjs (bool, optional): Write plotly.js once per output directory (plotly.min.js) and refer to it from HTML instead of embedding it. Defaults to False.
+        ncores (int, optional): Number of cores used to read VCF files. Defaults to 1.
+        out_dir (str, optional): Output directory. Defaults to None.
+        prefix (str, optional): Prefix. Defaults to "cohort".
+
+    Returns:
+        dict: Main output file paths
+    """
+
+    # Read variants of all samples
+    logging.info(f"Reading variants of {len(vcfs)} VCF files...")
+    table = read_variant_tables(vcfs, ncores)
+
+    if not out_dir:
+        out_dir = get_file_directory(vcfs[0])
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    variants_csv = create_output_path(prefix, out_dir, "_variants", ".csv")
+    table.to_csv(variants_csv, index=False)
+
+    # Plot
+    logging.info(f"Plotting variants of cohort ({mode})...")
+    if mode == "heatmap":
+        fig = _plot_cohort_heatmap(table, bin_size)
+    else:
+        fig = _plot_cohort_ring(table, bin_size, split_strands)
+
+    out_html = create_output_path(prefix, out_dir, f"_{mode}", ".html")
+    output_paths = {
+        "variants_csv": variants_csv,
+        "vis_html": out_html,
+    }
+    if shared_plotlyjs:
+        output_paths["plotlyjs"] = write_plotlyjs(out_dir)
+    fig.write_html(
+        out_html, include_plotlyjs="plotly.min.js" if shared_plotlyjs else True
+    )
+
+    # Check if output files exist
+    if check_files_exist(list(output_paths.values())):
+        logging.info(f"Cohort visualization completed successfully.")
+    else:
+        logging.error("Some output files are missing! Please rerun the analysis.")
+        sys.exit(1)
+
+    return output_paths
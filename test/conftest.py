@@ -1,6 +1,27 @@
 import pytest
 import os
 import hashlib
+import mitopy.constants
+import mitopy.haplogroup
+import mitopy.phylotree
+import mitopy.postprocess
+import mitopy.visualize
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path_factory, monkeypatch):
+    # Caches of tests are kept out of the user cache directory
+    cache_dir = str(tmp_path_factory.mktemp("cache"))
+    monkeypatch.setenv("MITOPY_CACHE_DIR", cache_dir)
+    for module in [
+        mitopy.constants,
+        mitopy.haplogroup,
+        mitopy.phylotree,
+        mitopy.postprocess,
+        mitopy.visualize,
+    ]:
+        monkeypatch.setattr(module, "CACHE_DIR", cache_dir)
+    return cache_dir
 
 
 @pytest.fixture
@@ -41,4 +62,5 @@ def test_files(test_dir):
         "shifted_vcf": f"{test_dir}/vcfs/NA12878_shifted.vcf",
         "shifted_vcf_stats": f"{test_dir}/vcfs/NA12878_shifted.vcf.stats",
         "coverage_csv": f"{test_dir}/vis/coverage.csv",
+        "phylotree_dir": f"{test_dir}/phylotree",
     }
@@ -1,4 +1,11 @@
-from mitopy.align import do_align
+from mitopy.align import (
+    do_align,
+    do_align_dual,
+    _select_control_region_reads,
+    _subset_ubam,
+    _mark_dup_sort_samtools,
+)
+from mitopy.utils import check_files_exist
 import pytest
 import pysam
 
@@ -19,3 +26,47 @@ def test_do_align(test_files, tmp_path, get_md5, shifted_mode, expected_md5_bam)
     pysam.view(aln["dedup_sorted_bam"], "-o", sam, catch_stdout=False)
     # Check main output
     assert get_md5(sam) == expected_md5_bam
+
+
+def test_do_align_dual(test_files, tmp_path, get_md5):
+    aln = do_align_dual(test_files["unmapped_bam"], out_dir=tmp_path, ncores=2)
+
+    # convert to sam (to ignore header)
+    for key, expected_md5_bam in [
+        ("dedup_sorted_bam", "454b6e5c2f58c6254429664f32f5dbb1"),
+        ("shifted_dedup_sorted_bam", "4cf9524a77c439987a764ad4a3120ad2"),
+    ]:
+        sam = f"{tmp_path}/test.sam"
+        pysam.view(aln[key], "-o", sam, catch_stdout=False)
+        assert get_md5(sam) == expected_md5_bam
+
+
+def test_subset_control_region_reads(test_files, tmp_path):
+    read_names = _select_control_region_reads(test_files["dedup_bam"])
+
+    subset_ubam = f"{tmp_path}/subset.bam"
+    n_reads = _subset_ubam(test_files["unmapped_bam"], read_names, subset_ubam)
+
+    # Both mates of every selected pair are kept
+    assert n_reads == 2 * len(read_names)
+    with pysam.AlignmentFile(subset_ubam, "rb", check_sq=False) as bam:
+        assert {read.query_name for read in bam.fetch(until_eof=True)} == read_names
+
+
+def test_mark_dup_sort_samtools(test_files, tmp_path):
+    # Simulate queryname-sorted output of MergeBamAlignment
+    qname_bam = f"{tmp_path}/qname.bam"
+    pysam.sort("-n", "-o", qname_bam, test_files["dedup_bam"], catch_stdout=False)
+
+    out_bam = f"{tmp_path}/dedup.bam"
+    out_metrics = f"{tmp_path}/dedup.metrics.txt"
+    _mark_dup_sort_samtools(qname_bam, out_bam, out_metrics, ncores=1)
+
+    assert check_files_exist([out_bam, f"{out_bam}.bai", out_metrics])
+
+    # Flags are equivalent to MarkDuplicatesSpark
+    def get_flags(bam):
+        with pysam.AlignmentFile(bam, "rb") as aln:
+            return sorted((r.query_name, r.flag, r.reference_start) for r in aln)
+
+    assert get_flags(out_bam) == get_flags(test_files["dedup_bam"])
@@ -1,6 +1,19 @@
-from mitopy.call import do_call
+from mitopy.call import (
+    do_call,
+    do_call_dual,
+    _split_interval,
+    _parse_interval,
+    _get_covered_intervals,
+    _count_callable_sites,
+    _trim_shard,
+    NON_CONTROL_REGION,
+    SHARD_OVERLAP,
+)
+from mitopy.utils import read_stats_table
+import pysam
 import pytest
 import subprocess
+import threading
 
 
 # shifted and unshifted mode
@@ -26,3 +39,163 @@ def test_do_call(
     # Check main output
     assert get_md5(no_header_vcf) == expected_md5_vcf
     assert get_md5(call["raw_vcf_stats"]) == expected_md5_stats
+
+
+def test_split_interval():
+    shards = _split_interval(NON_CONTROL_REGION, 4)
+
+    # Cores partition the interval
+    _, start, end = _parse_interval(NON_CONTROL_REGION)
+    assert len(shards) == 4
+    assert shards[0][2] == start and shards[-1][3] == end
+    for (_, _, _, core_end), (_, _, next_start, _) in zip(shards, shards[1:]):
+        assert next_start == core_end + 1
+
+    # Call intervals overlap neighbouring cores, clipped to the interval
+    assert shards[0][0] == start and shards[-1][1] == end
+    for call_start, call_end, core_start, core_end in shards[1:-1]:
+        assert call_start == core_start - SHARD_OVERLAP
+        assert call_end == core_end + SHARD_OVERLAP
+
+
+def test_do_call_sharded(test_files, tmp_path):
+    single = do_call(test_files["dedup_bam"], out_dir=tmp_path / "single")
+    sharded = do_call(
+        test_files["dedup_bam"], out_dir=tmp_path / "sharded", ncores=4, nshards=4
+    )
+
+    def read_calls(vcf):
+        with pysam.VariantFile(vcf) as f:
+            return [(rec.pos, rec.ref, rec.alts) for rec in f.fetch()]
+
+    # Sharded calls match a single run
+    assert read_calls(sharded["raw_vcf"]) == read_calls(single["raw_vcf"])
+
+    # Callable sites are counted once on the whole region, close to Mutect2 count of a single run
+    _, start, end = _parse_interval(NON_CONTROL_REGION)
+    sharded_callable = read_stats_table(sharded["raw_vcf_stats"])["callable"]
+    assert sharded_callable == _count_callable_sites(
+        test_files["dedup_bam"], "chrM", [(start, end)]
+    )
+    assert sharded_callable == pytest.approx(
+        read_stats_table(single["raw_vcf_stats"])["callable"], rel=0.01
+    )
+
+
+def test_trim_shard(test_files, tmp_path):
+    trimmed_vcf = f"{tmp_path}/trimmed.vcf"
+    _trim_shard(test_files["vcf"], 1000, 3000, trimmed_vcf)
+
+    def read_lines(vcf, keep=lambda pos: True):
+        with open(vcf) as f:
+            return [
+                line
+                for line in f
+                if not line.startswith("#") and keep(int(line.split("\t")[1]))
+            ]
+
+    # Calls within core are kept as written
+    assert read_lines(trimmed_vcf) == read_lines(
+        test_files["vcf"], lambda pos: 1000 <= pos <= 3000
+    )
+    assert read_lines(trimmed_vcf)
+
+
+def test_count_callable_sites(test_files):
+    _, start, end = _parse_interval(NON_CONTROL_REGION)
+    middle = (start + end) // 2
+
+    # Sites of a partition are counted once, joint depth of samples is summed
+    whole = _count_callable_sites(test_files["dedup_bam"], "chrM", [(start, end)])
+    assert 0 < whole <= end - start + 1
+    assert whole == _count_callable_sites(
+        test_files["dedup_bam"], "chrM", [(start, middle), (middle + 1, end)]
+    )
+    assert whole <= _count_callable_sites(
+        [test_files["dedup_bam"]] * 2, "chrM", [(start, end)]
+    )
+
+
+def test_do_call_dual(test_files, tmp_path, get_md5):
+    call = do_call_dual(
+        test_files["dedup_bam"], test_files["shifted_dedup_bam"], out_dir=tmp_path
+    )
+
+    # Outputs match separate canonical and shifted calls
+    assert get_md5(call["raw_vcf_stats"]) == "c76d2113af8dda3f76d616598a236e59"
+    assert get_md5(call["shifted_raw_vcf_stats"]) == "e7d6c05baa9dede12aa3041af9f73258"
+
+
+def test_get_covered_intervals(test_files):
+    covered, excluded = _get_covered_intervals(
+        test_files["dedup_bam"], NON_CONTROL_REGION, min_depth=5
+    )
+
+    # Covered and excluded regions tile the interval
+    _, start, end = _parse_interval(NON_CONTROL_REGION)
+    regions = sorted(covered + excluded)
+    assert regions[0][0] == start and regions[-1][1] == end
+    assert all(a[1] + 1 == b[0] for a, b in zip(regions, regions[1:]))
+
+
+def test_get_covered_intervals_cohort(test_files, tmp_path):
+    # Samples covering different halves of the mitochondrial genome
+    bams = []
+    with pysam.AlignmentFile(test_files["dedup_bam"], "rb") as aln:
+        for name, keep in [
+            ("first", lambda read: read.reference_start < 8000),
+            ("second", lambda read: read.reference_start >= 8000),
+        ]:
+            bam = str(tmp_path / f"{name}.bam")
+            with pysam.AlignmentFile(bam, "wb", template=aln) as out:
+                for read in aln.fetch():
+                    if keep(read):
+                        out.write(read)
+            pysam.index(bam)
+            bams.append(bam)
+
+    def covered_positions(bam):
+        covered, _ = _get_covered_intervals(bam, NON_CONTROL_REGION, min_depth=5)
+        return {pos for start, end in covered for pos in range(start, end + 1)}
+
+    first, second = covered_positions(bams[0]), covered_positions(bams[1])
+    cohort = covered_positions(bams)
+
+    # Region covered in any of the samples is covered in cohort
+    assert first | second <= cohort
+    assert cohort - first and cohort - second
+
+
+@pytest.mark.parametrize("ncores", [1, 4])
+def test_do_call_dual_cores(mocker, tmp_path, ncores):
+    lock = threading.Lock()
+    used = {"now": 0, "max": 0}
+
+    def call(bam, ncores, **kwargs):
+        with lock:
+            used["now"] += ncores
+            used["max"] = max(used["max"], used["now"])
+        threading.Event().wait(0.05)
+        with lock:
+            used["now"] -= ncores
+        return {"raw_vcf": bam}
+
+    mocker.patch("mitopy.call.do_call", side_effect=call)
+    call = do_call_dual("canonical.bam", "shifted.bam", out_dir=tmp_path, ncores=ncores)
+
+    # Cores in use never exceed ncores, a single core runs the calls one after the other
+    assert used["max"] == ncores
+    assert call == {"raw_vcf": "canonical.bam", "shifted_raw_vcf": "shifted.bam"}
+
+
+def test_do_call_uncovered(test_files, tmp_path, mocker):
+    def run_mutect2(out_fn, **kwargs):
+        for fn in [out_fn, f"{out_fn}.idx", f"{out_fn}.stats"]:
+            open(fn, "w").close()
+
+    mutect2 = mocker.patch("mitopy.call._run_mutect2", side_effect=run_mutect2)
+    call = do_call(test_files["dedup_bam"], out_dir=tmp_path, min_depth=10**6)
+
+    # Without any covered region, the whole interval is called and nothing is excluded
+    assert mutect2.call_args.kwargs["interval"] == NON_CONTROL_REGION
+    assert open(call["excluded_regions"]).read() == ""
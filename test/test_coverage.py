@@ -1,4 +1,6 @@
 from mitopy.coverage import do_coverage
+import pandas as pd
+import plotly.offline
 import pytest
 import warnings
 
@@ -11,3 +13,26 @@ def test_do_coverage(test_files, tmp_path, get_md5):
 
     # Check main outputs
     assert get_md5(cov["coverage_csv"]) == "3c4073b9073e14ae6b10f745a5c96c84"
+
+
+def test_do_coverage_shared_plotlyjs(test_files, tmp_path, mocker):
+    pb_cov = pd.DataFrame(
+        {"chrom": "chrM", "start": range(1, 16570), "end": range(2, 16571)}
+    ).assign(coverage=100)
+    mocker.patch("mitopy.coverage._get_mosdepth_pb_coverage", return_value=pb_cov)
+
+    # Copy of plotly.js from other plotly version is replaced
+    with open(f"{tmp_path}/plotly.min.js", "w") as f:
+        f.write("/* stale plotly.js */")
+
+    cov = do_coverage(
+        test_files["dedup_bam"],
+        test_files["shifted_dedup_bam"],
+        out_dir=tmp_path,
+        shared_plotlyjs=True,
+    )
+
+    with open(cov["plotlyjs"]) as f:
+        assert f.read() == plotly.offline.get_plotlyjs()
+    with open(cov["coverage_html"]) as f:
+        assert 'src="plotly.min.js"' in f.read()
@@ -0,0 +1,39 @@
+from mitopy.downsample import do_downsample
+from mitopy.utils import read_stats_table
+import pysam
+import pytest
+
+
+def test_do_downsample(test_files, tmp_path, get_md5):
+    runs = [
+        do_downsample(
+            test_files["unmapped_bam"], fraction=0.5, seed=1, out_dir=tmp_path / run
+        )
+        for run in ["a", "b"]
+    ]
+
+    # Reproducible for the same seed
+    assert get_md5(runs[0]["unmapped_bam"]) == get_md5(runs[1]["unmapped_bam"])
+
+    # Pair-aware: both mates of selected pairs are kept
+    with pysam.AlignmentFile(runs[0]["unmapped_bam"], "rb", check_sq=False) as bam:
+        names = [read.query_name for read in bam.fetch(until_eof=True)]
+    assert all(names.count(name) == 2 for name in names)
+
+    metrics = read_stats_table(runs[0]["downsample_metrics"])
+    assert metrics["fraction"] == 0.5
+    assert metrics["reads_out"] == len(names)
+
+
+def test_do_downsample_below_target(test_files, tmp_path):
+    ds = do_downsample(test_files["unmapped_bam"], target_depth=1e6, out_dir=tmp_path)
+
+    # Nothing to downsample, input is passed through
+    assert ds["unmapped_bam"] == test_files["unmapped_bam"]
+    assert read_stats_table(ds["downsample_metrics"])["fraction"] == 1.0
+
+
+@pytest.mark.parametrize("fraction", [0, -0.5, 1.5])
+def test_do_downsample_invalid_fraction(test_files, tmp_path, fraction):
+    with pytest.raises(SystemExit):
+        do_downsample(test_files["unmapped_bam"], fraction=fraction, out_dir=tmp_path)
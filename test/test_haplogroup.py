@@ -1,6 +1,15 @@
-from mitopy.haplogroup import do_identify_haplogroup
+from mitopy.haplogroup import (
+    do_identify_haplogroup,
+    _split_haplogroups,
+    _install_phylotree,
+    _get_haplogrep3_fingerprint,
+    _get_installed_tree_dir,
+    get_phylotree_marker_path,
+)
+from mitopy.executable import Executable
 import pytest
 import logging
+import os
 
 
 @pytest.mark.parametrize(
@@ -11,9 +20,10 @@ import logging
     ],
 )
 def test_do_identify_haplogroup(
-    test_files, tmp_path, get_md5, caplog, mt_ref, expected_md5
+    test_files, tmp_path, get_md5, caplog, monkeypatch, mt_ref, expected_md5
 ):
     caplog.set_level(logging.INFO)
+    monkeypatch.setattr("mitopy.haplogroup.CACHE_DIR", f"{tmp_path}/cache")
 
     haplo_report = do_identify_haplogroup(test_files["vcf"], mt_ref, out_dir=tmp_path)
 
@@ -22,3 +32,72 @@ def test_do_identify_haplogroup(
 
     if mt_ref == "rsrs":
         assert "Downloading phylotree for RSRS reference..." in caplog.text
+
+
+def test_split_haplogroups(tmp_path):
+    haplo_out = f"{tmp_path}/cohort_haplogroups.txt"
+    with open(haplo_out, "w") as f:
+        f.write('"SampleID"\t"Haplogroup"\t"Rank"\t"Quality"\t"Range"\n')
+        f.write('"s1"\t"H2a2a1"\t"1"\t"0.9"\t"1-16569"\n')
+        f.write('"s2"\t"K1a"\t"1"\t"0.8"\t"1-16569"\n')
+
+    out_fns = {
+        "s1": f"{tmp_path}/s1_haplogroup.txt",
+        "s2": f"{tmp_path}/s2_haplogroup.txt",
+    }
+    _split_haplogroups(haplo_out, {"s1": "NA12878", "s2": "NA12891"}, out_fns)
+
+    # Per-sample reports contain header and classification with original sample name
+    with open(out_fns["s2"]) as f:
+        assert f.readlines() == [
+            '"SampleID"\t"Haplogroup"\t"Rank"\t"Quality"\t"Range"\n',
+            '"NA12891"\t"K1a"\t"1"\t"0.8"\t"1-16569"\n',
+        ]
+
+
+def test_install_phylotree_cached(tmp_path, caplog, monkeypatch):
+    caplog.set_level(logging.INFO)
+    monkeypatch.setattr("mitopy.haplogroup.CACHE_DIR", str(tmp_path))
+    haplogrep3 = Executable(f"{tmp_path}/missing_haplogrep3", False)
+    tree = "phylotree-rsrs@17.1"
+
+    marker_fn = get_phylotree_marker_path(tree)
+    os.makedirs(os.path.dirname(marker_fn))
+    with open(marker_fn, "w") as f:
+        f.write(_get_haplogrep3_fingerprint(haplogrep3, tree))
+    os.makedirs(_get_installed_tree_dir(haplogrep3, tree))
+
+    # Installed phylotree is reused without running Haplogrep3
+    _install_phylotree(haplogrep3, tree)
+    assert "Using installed phylotree phylotree-rsrs@17.1." in caplog.text
+
+
+def test_install_phylotree_outdated(tmp_path, monkeypatch, mocker):
+    monkeypatch.setattr("mitopy.haplogroup.CACHE_DIR", str(tmp_path))
+    haplogrep3 = Executable(f"{tmp_path}/missing_haplogrep3", False)
+    tree = "phylotree-rsrs@17.1"
+    tree_dir = _get_installed_tree_dir(haplogrep3, tree)
+    run = mocker.patch.object(
+        haplogrep3,
+        "run",
+        side_effect=lambda *args, **kwargs: os.makedirs(tree_dir, exist_ok=True),
+    )
+
+    archive = f"{tmp_path}/tree.zip"
+    with open(archive, "w") as f:
+        f.write("17.1")
+
+    _install_phylotree(haplogrep3, tree, archive)
+    _install_phylotree(haplogrep3, tree, archive)
+    assert run.call_count == 1
+
+    # Updated archive is reinstalled
+    with open(archive, "w") as f:
+        f.write("17.1 updated")
+    _install_phylotree(haplogrep3, tree, archive)
+    assert run.call_count == 2
+
+    # Tree removed from Haplogrep3 trees directory is reinstalled
+    os.rmdir(tree_dir)
+    _install_phylotree(haplogrep3, tree, archive)
+    assert run.call_count == 3
@@ -1,9 +1,135 @@
-from mitopy.merge import do_merge
+from mitopy.merge import do_merge, _liftover_shifted, _lift_interval, _read_chain
+from mitopy.constants import MT_REFS
+import pysam
 
 
 def test_do_merge(test_files, tmp_path, get_md5):
-    merge = do_merge(test_files["vcf"], test_files["shifted_vcf"], out_dir=tmp_path)
+    # gatk_path is still accepted, although GATK is not run
+    merge = do_merge(
+        test_files["vcf"], test_files["shifted_vcf"], out_dir=tmp_path, gatk_path="gatk"
+    )
 
-    # Check main output
-    assert get_md5(merge["merged_vcf"]) == "79f41b8d71dcf941e70667eb44f9b3ad"
+    def read_records(vcf, pos=None):
+        with pysam.VariantFile(vcf) as f:
+            return [
+                (
+                    rec.chrom,
+                    pos[rec.pos] if pos else rec.pos,
+                    rec.ref,
+                    rec.alts,
+                    list(rec.filter),
+                    dict(rec.info),
+                    [dict(sample) for sample in rec.samples.values()],
+                )
+                for rec in f.fetch()
+            ]
+
+    # As MergeVcfs: canonical records and control region records shifted back to canonical positions, sorted by position
+    shifted_back = dict(
+        zip([8721, 8832, 8871, 8879, 8885, 9068], [152, 263, 302, 310, 316, 499])
+    )
+    expected = sorted(
+        read_records(test_files["vcf"])
+        + read_records(test_files["shifted_vcf"], shifted_back),
+        key=lambda rec: rec[1],
+    )
+    merged = read_records(merge["merged_vcf"])
+    assert merged == expected
+    assert [rec[1] for rec in merged] == sorted(rec[1] for rec in merged)
+
+    with pysam.VariantFile(merge["merged_vcf"]) as f:
+        assert list(f.header.samples) == ["NA12878"]
+
+    # Stats match MergeMutectStats output
     assert get_md5(merge["merged_vcf_stats"]) == "6eee922d3d362325d9bdaab81af2d1cc"
+
+
+def test_liftover_shifted(test_files, tmp_path):
+    lifted_vcf = f"{tmp_path}/lifted.vcf"
+    rejected_vcf = f"{tmp_path}/rejected.vcf"
+    _liftover_shifted(
+        test_files["shifted_vcf"],
+        MT_REFS["rcrs"],
+        MT_REFS["rcrs_shift_back_chain"],
+        lifted_vcf,
+        rejected_vcf,
+    )
+
+    # Control region variants are shifted back to canonical positions
+    with pysam.VariantFile(lifted_vcf) as vcf:
+        assert [rec.pos for rec in vcf.fetch()] == [152, 263, 302, 310, 316, 499]
+    with pysam.VariantFile(rejected_vcf) as vcf:
+        assert not list(vcf.fetch())
+
+    # Records are otherwise kept as written by Mutect2
+    def read_lines(vcf):
+        with open(vcf) as f:
+            return [line.split("\t", 2)[2] for line in f if not line.startswith("#")]
+
+    assert read_lines(lifted_vcf) == read_lines(test_files["shifted_vcf"])
+
+
+def test_liftover_shifted_ref(test_files, tmp_path):
+    shifted_vcf = f"{tmp_path}/shifted.vcf"
+    with pysam.VariantFile(test_files["shifted_vcf"]) as in_vcf:
+        with pysam.VariantFile(shifted_vcf, "w", header=in_vcf.header) as out_vcf:
+            for rec in in_vcf.fetch():
+                # Reference of T>C at 152 differs, in the second record it equals alternate allele
+                if rec.pos == 8721:
+                    rec.ref = "A"
+                elif rec.pos == 8832:
+                    rec.ref = "G"
+                    rec.alts = ("A",)
+                out_vcf.write(rec)
+
+    lifted_vcf = f"{tmp_path}/lifted.vcf"
+    rejected_vcf = f"{tmp_path}/rejected.vcf"
+    _liftover_shifted(
+        shifted_vcf,
+        MT_REFS["rcrs"],
+        MT_REFS["rcrs_shift_back_chain"],
+        lifted_vcf,
+        rejected_vcf,
+    )
+
+    # Mismatched reference allele is rewritten from canonical reference
+    with pysam.VariantFile(lifted_vcf) as vcf:
+        records = {rec.pos: (rec.ref, rec.alts) for rec in vcf.fetch()}
+    assert records[152] == ("T", ("C",))
+    assert 263 not in records
+
+    # Rewritten reference allele equal to alternate allele is rejected
+    with pysam.VariantFile(rejected_vcf) as vcf:
+        assert [(rec.pos, list(rec.filter)) for rec in vcf.fetch()] == [
+            (8832, ["MismatchedRefAllele"])
+        ]
+
+
+def test_lift_interval():
+    blocks = _read_chain(MT_REFS["rcrs_shift_back_chain"])
+
+    assert _lift_interval(blocks, "chrM", 0, 1) == ("chrM", 8000)
+    assert _lift_interval(blocks, "chrM", 16568, 16569) == ("chrM", 7999)
+    # Interval spanning both blocks cannot be lifted
+    assert _lift_interval(blocks, "chrM", 8568, 8570) is None
+
+
+def test_do_merge_compressed(test_files, tmp_path):
+    merge = do_merge(
+        test_files["vcf"],
+        test_files["shifted_vcf"],
+        out_dir=tmp_path,
+        vcf_format="vcf.gz",
+    )
+
+    # Compressed VCF is indexed and accessible by region
+    assert merge["merged_vcf_index"].endswith(".vcf.gz.tbi")
+    with pysam.VariantFile(merge["merged_vcf"]) as vcf:
+        assert [rec.pos for rec in vcf.fetch("chrM", 0, 500)] == [
+            152,
+            263,
+            302,
+            310,
+            316,
+            499,
+        ]
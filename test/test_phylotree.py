@@ -0,0 +1,133 @@
+from mitopy.phylotree import (
+    Phylotree,
+    get_sample_polys,
+    estimate_contamination,
+    _parse_poly,
+)
+from mitopy.haplogroup import do_identify_haplogroup
+import os
+import pysam
+import pytest
+
+
+@pytest.mark.parametrize(
+    "poly, expected",
+    [
+        ("263G", ("263G", False)),
+        ("8281d", ("8281d", False)),
+        ("315.1C", ("315.1C", False)),
+        ("2259T!", ("2259T", True)),
+        ("(16519C)", ("16519C", False)),
+    ],
+)
+def test_parse_poly(poly, expected):
+    assert _parse_poly(poly) == expected
+
+
+def test_classify(test_files):
+    tree = Phylotree.from_xml(
+        os.path.join(test_files["phylotree_dir"], "tree.xml"),
+        os.path.join(test_files["phylotree_dir"], "weights.txt"),
+    )
+
+    # Back mutation removes 2259T from expected mutations of B1
+    assert "2259T" not in [
+        tree.mutations[i]
+        for i in range(len(tree.mutations))
+        if tree.bitsets[tree.names.index("B1"), i // 8] >> (7 - i % 8) & 1
+    ]
+
+    # Heteroplasmic variant (16023A, AF 0.46) is not used for classification
+    polys = get_sample_polys(test_files["vcf"])["NA12878"]
+    assert "16023A" not in polys
+
+    hits = tree.classify(polys, hits=3)
+    assert [name for name, _ in hits] == ["B2", "B", "B1"]
+    assert hits[0][1] == pytest.approx(0.8571, abs=1e-4)
+
+
+@pytest.mark.parametrize("polys", [[], ["99999A"]])
+def test_classify_no_known_polys(test_files, polys):
+    tree = Phylotree.from_xml(
+        os.path.join(test_files["phylotree_dir"], "tree.xml"),
+        os.path.join(test_files["phylotree_dir"], "weights.txt"),
+    )
+
+    # Sample without polymorphisms of the tree is classified to the root with zero quality
+    assert tree.classify(polys) == [(tree.names[0], 0.0)]
+
+
+def test_do_identify_haplogroup_native(test_files, tmp_path, monkeypatch):
+    monkeypatch.setattr("mitopy.phylotree.CACHE_DIR", str(tmp_path))
+
+    haplo_report = do_identify_haplogroup(
+        test_files["vcf"],
+        engine="native",
+        phylotree_dir=test_files["phylotree_dir"],
+        out_dir=tmp_path,
+    )
+
+    with open(haplo_report["haplogroups"]) as f:
+        assert f.readlines() == [
+            '"SampleID"\t"Haplogroup"\t"Rank"\t"Quality"\t"Range"\n',
+            '"NA12878"\t"B2"\t"1"\t"0.8571"\t"1-16569"\n',
+        ]
+
+    # Compiled phylotree is cached
+    assert os.listdir(f"{tmp_path}/phylotrees")
+
+
+@pytest.fixture
+def contaminated_vcf(tmp_path):
+    header = pysam.VariantHeader()
+    header.add_line("##contig=<ID=chrM,length=16569>")
+    header.add_line('##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">')
+    header.add_line(
+        '##FORMAT=<ID=AF,Number=A,Type=Float,Description="Allele fractions">'
+    )
+    header.add_sample("sample")
+
+    # Major profile defines haplogroup B, minor profile haplogroup A
+    vcf_fn = f"{tmp_path}/contaminated.vcf"
+    with pysam.VariantFile(vcf_fn, "w", header=header) as vcf:
+        for pos, ref, alt, af in [
+            (750, "A", "G", 1.0),
+            (1438, "A", "G", 0.85),
+            (2259, "C", "T", 0.85),
+            (3000, "C", "T", 0.15),
+            (4769, "A", "G", 0.15),
+        ]:
+            rec = vcf.new_record(contig="chrM", start=pos - 1, alleles=(ref, alt))
+            rec.samples["sample"]["GT"] = (0, 1)
+            rec.samples["sample"]["AF"] = (af,)
+            vcf.write(rec)
+
+    return vcf_fn
+
+
+def test_estimate_contamination(test_files, contaminated_vcf):
+    tree = Phylotree.from_xml(
+        os.path.join(test_files["phylotree_dir"], "tree.xml"),
+        os.path.join(test_files["phylotree_dir"], "weights.txt"),
+    )
+
+    report = estimate_contamination(contaminated_vcf, tree).iloc[0]
+    assert report["Major Haplogroup"] == "B"
+    assert report["Minor Haplogroup"] == "A"
+    assert report["Distance"] == 2
+    assert report["Contamination Status"] == "YES"
+    assert report["Contamination Level"] == "0.150"
+
+    # Sample without heteroplasmies supporting another haplogroup is not contaminated
+    report = estimate_contamination(test_files["vcf"], tree).iloc[0]
+    assert report["Contamination Status"] == "NO"
+    assert report["Contamination Level"] == "ND"
+
+    # Sample without any variants has empty major and minor profiles
+    empty_vcf = contaminated_vcf.replace(".vcf", "_empty.vcf")
+    with pysam.VariantFile(contaminated_vcf) as in_vcf:
+        with pysam.VariantFile(empty_vcf, "w", header=in_vcf.header):
+            pass
+    report = estimate_contamination(empty_vcf, tree).iloc[0]
+    assert report["Contamination Status"] == "NO"
+    assert report["Major Haplogroup"] == tree.names[0]
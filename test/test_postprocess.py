@@ -1,25 +1,99 @@
-from mitopy.postprocess import do_postprocess
+from mitopy.postprocess import (
+    do_postprocess,
+    do_postprocess_sweep,
+    _normalize_vcf,
+    _left_align,
+    _add_split_info,
+    get_contamination,
+    get_contamination_cache_path,
+)
+from mitopy.constants import MT_REFS, MT_BLACKLIST
+from mitopy.executable import Executable
+import os
+import shutil
+import pandas as pd
+import pysam
 import pytest
 import logging
-import subprocess
+
+
+def _read_calls(vcf):
+    """Read calls as (position, alleles, filters, allele fractions)."""
+
+    with pysam.VariantFile(vcf) as f:
+        return [
+            (
+                rec.pos,
+                rec.alleles,
+                tuple(rec.filter.keys()),
+                tuple(round(af, 3) for af in rec.samples[0]["AF"]),
+            )
+            for rec in f.fetch()
+        ]
+
+
+def _postprocess_gatk(filtered_vcf, out_dir, autosomal_coverage):
+    """Postprocess FilterMutectCalls output with the GATK tools replaced by the native pass."""
+
+    gatk = Executable("gatk")
+    vcf = f"{out_dir}/gatk_blacklisted.vcf"
+    gatk.run(
+        subcommand="VariantFiltration",
+        **{
+            "-V": filtered_vcf,
+            "-O": vcf,
+            "--apply-allele-specific-filters": True,
+            "--mask": MT_BLACKLIST["rcrs"],
+            "--mask-name": "blacklisted_site",
+        },
+    )
+    if autosomal_coverage:
+        gatk.run(
+            subcommand="NuMTFilterTool",
+            **{
+                "-R": MT_REFS["rcrs"],
+                "-V": vcf,
+                "-O": f"{out_dir}/gatk_numt.vcf",
+                "--autosomal-coverage": autosomal_coverage,
+            },
+        )
+        vcf = f"{out_dir}/gatk_numt.vcf"
+    gatk.run(
+        subcommand="LeftAlignAndTrimVariants",
+        **{
+            "-R": MT_REFS["rcrs"],
+            "-V": vcf,
+            "-O": f"{out_dir}/gatk_normalized.vcf",
+            "--split-multi-allelics": True,
+            "--dont-trim-alleles": True,
+            "--keep-original-ac": True,
+        },
+    )
+    gatk.run(
+        subcommand="SelectVariants",
+        **{
+            "-V": f"{out_dir}/gatk_normalized.vcf",
+            "-O": f"{out_dir}/gatk_pass.vcf",
+            "--exclude-filtered": True,
+        },
+    )
+    return f"{out_dir}/gatk_pass.vcf"
 
 
 @pytest.mark.parametrize(
-    "autosomal_coverage, contamination_filter, expected_md5_vcf",
+    "autosomal_coverage, contamination_filter",
     [
-        (0, True, "00fab9cfd45e2dd6d4eec1c911888ffb"),  # activate contamination filter
-        (30, False, "00fab9cfd45e2dd6d4eec1c911888ffb"),  # activate numt filter
-        (0, False, "00fab9cfd45e2dd6d4eec1c911888ffb"),  # deactivate both filters
+        (0, True),  # activate contamination filter
+        (30, False),  # activate numt filter
+        (0, False),  # deactivate both filters
     ],
 )
 def test_do_postprocess(
     test_files,
     tmp_path,
-    get_md5,
     caplog,
     autosomal_coverage,
     contamination_filter,
-    expected_md5_vcf,
 ):
     caplog.set_level(logging.INFO)
 
@@ -31,13 +105,11 @@ def test_do_postprocess(
         out_dir=tmp_path,
     )
 
-    no_header_vcf = f"{tmp_path}/no_header.vcf"
-    subprocess.run(
-        f"egrep -v '^#' {postprocess['postprocessed_vcf']} > {no_header_vcf}",
-        shell=True,
+    # Native pass produces the same calls as the GATK tools it replaces
+    gatk_vcf = _postprocess_gatk(
+        f"{tmp_path}/NA12878_filtered.vcf", tmp_path, autosomal_coverage
     )
-    # Check main output
-    assert get_md5(no_header_vcf) == expected_md5_vcf
+    assert _read_calls(postprocess["postprocessed_vcf"]) == _read_calls(gatk_vcf)
 
     if contamination_filter:
         assert (
@@ -46,3 +118,101 @@ def test_do_postprocess(
 
     if autosomal_coverage != 0:
         assert "Filtering Numts..." in caplog.text
+
+
+def test_normalize_vcf(test_files):
+    with pysam.VariantFile(test_files["vcf"]) as vcf:
+        header = vcf.header.copy()
+    _add_split_info(header)
+
+    # Synthetic multi-allelic site
+    rec = header.new_record(
+        contig="chrM", start=1000, alleles=("A", "G", "T"), info={"TLOD": (40.5, 8.25)}
+    )
+    rec.samples[0]["GT"] = (0, 1, 2)
+    rec.samples[0]["AD"] = (10, 60, 30)
+    rec.samples[0]["AF"] = (0.6, 0.3)
+
+    records = list(_normalize_vcf([rec], MT_REFS["rcrs"]))
+
+    # Multi-allelic site is split to bi-allelic records with per-allele fields
+    assert [split.alleles for split in records] == [("A", "G"), ("A", "T")]
+    assert [split.info["TLOD"] for split in records] == [(40.5,), (8.25,)]
+    assert [split.samples[0]["AD"] for split in records] == [(10, 60), (10, 30)]
+    assert [split.samples[0]["AF"] for split in records] == [
+        pytest.approx((0.6,)),
+        pytest.approx((0.3,)),
+    ]
+    assert [split.info["AlleleIndex_Orig"] for split in records] == [1, 2]
+
+
+def test_left_align(test_files):
+    with pysam.VariantFile(test_files["vcf"]) as vcf:
+        header = vcf.header.copy()
+
+    # Insertion at the end of poly-C tract is shifted to its start
+    rec = header.new_record(contig="chrM", start=308, alleles=("C", "CC"))
+    (aligned,) = _left_align([rec], MT_REFS["rcrs"])
+    assert (aligned.pos, aligned.alleles) == (302, ("A", "AC"))
+
+
+def test_do_postprocess_sweep(test_files, tmp_path):
+    sweep = do_postprocess_sweep(
+        test_files["vcf"],
+        test_files["vcf_stats"],
+        f_score_beta=[0.5, 1.0],
+        vaf_treshold=[0, 0.1],
+        max_alt_allele_count=[1, 4],
+        write_vcfs=True,
+        out_dir=tmp_path,
+    )
+
+    # One row per parameter combination, passing variants decrease with VAF treshold
+    table = pd.read_csv(sweep["sweep_table"])
+    assert len(table) == 8
+    for _, setting_table in table.groupby(["f_score_beta", "max_alt_allele_count"]):
+        assert setting_table["variants"].is_monotonic_decreasing
+    assert len(sweep) == 9
+
+
+def test_get_contamination_cached(test_files, tmp_path, monkeypatch):
+    monkeypatch.setattr("mitopy.postprocess.CACHE_DIR", str(tmp_path))
+    cache_fn = get_contamination_cache_path(test_files["vcf"])
+    os.makedirs(os.path.dirname(cache_fn))
+    with open(cache_fn, "w") as f:
+        f.write("0.05\n")
+
+    # Cached estimate is reused without running Haplocheck
+    haplocheck = Executable(f"{tmp_path}/missing_haplocheck", False)
+    assert get_contamination(test_files["vcf"], haplocheck) == 0.05
+
+
+def test_get_contamination_native(test_files, tmp_path, monkeypatch):
+    monkeypatch.setattr("mitopy.postprocess.CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr("mitopy.phylotree.CACHE_DIR", str(tmp_path))
+
+    # Native estimator runs without Haplocheck, estimate is cached per engine
+    haplocheck = Executable(f"{tmp_path}/missing_haplocheck", False)
+    contamination = get_contamination(
+        test_files["vcf"],
+        haplocheck,
+        engine="native",
+        phylotree_dir=test_files["phylotree_dir"],
+    )
+    assert contamination == 0.0
+    assert os.path.exists(
+        get_contamination_cache_path(
+            test_files["vcf"], "native", test_files["phylotree_dir"]
+        )
+    )
+    assert not os.path.exists(get_contamination_cache_path(test_files["vcf"]))
+
+    # Estimate is cached per phylotree, updated tree is not served a stale estimate
+    phylotree_dir = shutil.copytree(test_files["phylotree_dir"], f"{tmp_path}/tree")
+    with open(f"{phylotree_dir}/weights.txt", "a") as f:
+        f.write("16519C\t1.0\n")
+    assert get_contamination_cache_path(
+        test_files["vcf"], "native", phylotree_dir
+    ) != get_contamination_cache_path(
+        test_files["vcf"], "native", test_files["phylotree_dir"]
+    )
@@ -1,4 +1,7 @@
-from mitopy.preprocess import do_preprocess
+from mitopy.preprocess import do_preprocess, _estimate_coverage
+import os
+import pysam
+import pytest
 
 
 def test_do_preprocess(test_files, tmp_path, get_md5):
@@ -6,3 +9,75 @@ def test_do_preprocess(test_files, tmp_path, get_md5):
 
     # Check main output
     assert get_md5(prep["unmapped_bam"]) == "aab17066bb85e07ff89733f055847f79"
+
+
+@pytest.fixture
+def synthetic_wgs_bam(tmp_path):
+    # Autosomes covered 10x, mitochondrial contig 200x (100 bp reads)
+    header = {
+        "HD": {"VN": "1.6", "SO": "coordinate"},
+        "SQ": [
+            {"SN": "chr1", "LN": 200000},
+            {"SN": "chr2", "LN": 200000},
+            {"SN": "chrM", "LN": 16569},
+        ],
+    }
+    bam = f"{tmp_path}/synthetic.bam"
+    with pysam.AlignmentFile(bam, "wb", header=header) as out_bam:
+        for tid, length, step, copies in [
+            (0, 200000, 10, 1),
+            (1, 200000, 10, 1),
+            (2, 16569, 1, 2),
+        ]:
+            for pos in range(0, length - 100, step):
+                for copy in range(copies):
+                    read = pysam.AlignedSegment(out_bam.header)
+                    read.query_name = f"read_{tid}_{pos}_{copy}"
+                    read.reference_id = tid
+                    read.reference_start = pos
+                    read.query_sequence = "A" * 100
+                    read.query_qualities = pysam.qualitystring_to_array("I" * 100)
+                    read.cigarstring = "100M"
+                    read.mapping_quality = 60
+                    out_bam.write(read)
+    pysam.index(bam)
+    return bam
+
+
+def test_estimate_coverage(synthetic_wgs_bam):
+    coverage = _estimate_coverage(synthetic_wgs_bam, "chrM")
+
+    assert coverage["autosomal_coverage"] == 10
+    assert coverage["mtdna_copy_number"] == pytest.approx(40, rel=0.05)
+
+
+def test_estimate_coverage_index(synthetic_wgs_bam, tmp_path):
+    # Index at non-default location is used
+    bai = f"{tmp_path}/custom.bai"
+    os.rename(f"{synthetic_wgs_bam}.bai", bai)
+    coverage = _estimate_coverage(synthetic_wgs_bam, "chrM", bai=bai)
+
+    assert coverage["autosomal_coverage"] == 10
+
+
+def test_estimate_coverage_cram(synthetic_wgs_bam, tmp_path):
+    reference_fa = f"{tmp_path}/reference.fa"
+    with open(reference_fa, "w") as f:
+        for contig, length in [("chr1", 200000), ("chr2", 200000), ("chrM", 16569)]:
+            f.write(f">{contig}\n{'A' * length}\n")
+    pysam.faidx(reference_fa)
+
+    cram = f"{tmp_path}/synthetic.cram"
+    with pysam.AlignmentFile(synthetic_wgs_bam) as in_bam:
+        with pysam.AlignmentFile(
+            cram, "wc", template=in_bam, reference_filename=reference_fa
+        ) as out_cram:
+            for read in in_bam.fetch(until_eof=True):
+                out_cram.write(read)
+    pysam.index(cram)
+
+    # CRAI lacks read counts, mean coverages are derived from sampled windows
+    coverage = _estimate_coverage(cram, "chrM", reference_fa)
+
+    assert coverage["autosomal_coverage"] == 10
+    assert coverage["mtdna_copy_number"] == pytest.approx(40, rel=0.05)
@@ -0,0 +1,75 @@
+from mitopy.report import do_report, REPORT_TEMPLATE
+import base64
+import gzip
+import json
+import plotly.offline
+import pytest
+import re
+import shutil
+import subprocess
+
+
+def _decode_section(report: str, name: str):
+    data = re.search(rf'id="data-{name}">([^<]*)<', report).group(1)
+    return json.loads(gzip.decompress(base64.b64decode(data)))
+
+
+def test_do_report(test_files, tmp_path):
+    annot_csv = f"{tmp_path}/annotated.csv"
+    with open(annot_csv, "w") as f:
+        f.write("POS,REF,ALT,gene\n750,A,G,MT-RNR1\n16023,G,A,MT-DLOOP\n")
+
+    report = do_report(
+        test_files["vcf"],
+        coverage_csv=test_files["coverage_csv"],
+        annot_csv=annot_csv,
+        out_dir=tmp_path,
+    )
+
+    with open(report["report_html"]) as f:
+        report_html = f.read()
+
+    # plotly.js is included once, figures and tables are embedded compressed
+    assert report_html.count("<script>/**") == 1
+    assert _decode_section(report_html, "annotation") == {
+        "columns": ["POS", "REF", "ALT", "gene"],
+        "rows": [["750", "A", "G", "MT-RNR1"], ["16023", "G", "A", "MT-DLOOP"]],
+    }
+    variants = _decode_section(report_html, "variants")
+    assert "Variants" in [trace.get("name") for trace in variants["data"]]
+
+    # Coverage is plotted only in its own section
+    assert "Coverage per Base" not in [trace.get("name") for trace in variants["data"]]
+    assert 'data-name="coverage"' in report_html
+    assert 'data-name="haplogroup"' not in report_html
+
+
+def test_do_report_shared_plotlyjs(test_files, tmp_path):
+    # Copy of plotly.js from other plotly version is replaced
+    with open(f"{tmp_path}/plotly.min.js", "w") as f:
+        f.write("/* stale plotly.js */")
+
+    report = do_report(test_files["vcf"], shared_plotlyjs=True, out_dir=tmp_path)
+
+    with open(report["plotlyjs"]) as f:
+        assert f.read() == plotly.offline.get_plotlyjs()
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node not found")
+def test_render_table_escape():
+    render_table = re.search(r"function renderTable.*?\n}\n", REPORT_TEMPLATE, re.S)
+    script = "const ROW_HEIGHT = 24;\n" + render_table.group(0) + """
+const element = () => ({style: {}});
+const parts = {".spacer": element(), "thead": element(), "tbody": element()};
+const viewport = {scrollTop: 0, clientHeight: 240, addEventListener: () => {}, querySelector: s => parts[s]};
+renderTable({querySelector: () => viewport}, {columns: ["<b>&AF"], rows: [["<i>"]]});
+console.log(parts["thead"].innerHTML + parts["tbody"].innerHTML);
+"""
+    out = subprocess.run(
+        ["node", "-e", script], capture_output=True, text=True, check=True
+    )
+
+    # Column headers are escaped as cell values
+    assert out.stdout.strip() == (
+        "<tr><th>&lt;b>&amp;AF</th></tr><tr><td>&lt;i></td></tr>"
+    )
@@ -0,0 +1,91 @@
+from mitopy.scheduler import Stage, run_stages
+import threading
+import pytest
+
+
+def test_run_stages():
+    def stage(name):
+        def func(inputs, ncores):
+            return {name: sorted(inputs)}
+
+        return func
+
+    outputs = run_stages(
+        [
+            Stage("a", stage("a")),
+            Stage("b", stage("b"), requires=["a"]),
+            Stage("c", stage("c"), requires=["a"]),
+            Stage("d", stage("d"), requires=["b", "c"]),
+        ],
+        ncores=2,
+    )
+
+    # Stages receive outputs of required stages
+    assert outputs["d"] == {"d": ["b", "c"]}
+    assert outputs["a"] == {"a": []}
+
+
+def test_run_stages_concurrent():
+    # Independent stages have to run at the same time to pass the barrier
+    barrier = threading.Barrier(2, timeout=10)
+
+    def func(inputs, ncores):
+        barrier.wait()
+        return {}
+
+    outputs = run_stages([Stage("a", func), Stage("b", func)], ncores=2)
+
+    assert set(outputs) == {"a", "b"}
+
+
+def test_run_stages_cores():
+    lock = threading.Lock()
+    used = {"now": 0, "max": 0}
+    granted = {}
+
+    def stage(name):
+        def func(inputs, ncores):
+            with lock:
+                used["now"] += ncores
+                used["max"] = max(used["max"], used["now"])
+                granted[name] = ncores
+            threading.Event().wait(0.05)
+            with lock:
+                used["now"] -= ncores
+            return {}
+
+        return func
+
+    run_stages(
+        [
+            Stage("a", stage("a")),
+            Stage("b", stage("b")),
+            Stage("c", stage("c"), ncores=-1),
+        ],
+        ncores=3,
+    )
+
+    # Cores in use never exceed budget, stage requesting all cores gets what is free
+    assert used["max"] <= 3
+    assert granted["c"] == 1
+
+
+def test_run_stages_error():
+    ran = []
+
+    def fail(inputs, ncores):
+        raise ValueError("stage failed")
+
+    def func(inputs, ncores):
+        ran.append(True)
+        return {}
+
+    with pytest.raises(ValueError):
+        run_stages([Stage("a", fail), Stage("b", func, requires=["a"])])
+
+    # Dependent stages are not started
+    assert not ran
+
+    # Cyclic dependencies are rejected
+    with pytest.raises(SystemExit):
+        run_stages([Stage("a", func, requires=["b"]), Stage("b", func, requires=["a"])])
@@ -1,5 +1,7 @@
-from mitopy.utils import check_files_exist
+from mitopy.utils import check_files_exist, write_plotlyjs
 import logging
+import os
+import plotly.offline
 
 
 def test_check_files_exist(caplog):
@@ -9,3 +11,21 @@ def test_check_files_exist(caplog):
     assert check_files_exist("test/conftest.py", verbose=True) == True
     assert check_files_exist("non_existent_file.py", verbose=True) == False
     assert "File non_existent_file.py not found." in caplog.text
+
+
+def test_write_plotlyjs(tmp_path):
+    plotlyjs_fn = write_plotlyjs(tmp_path)
+    assert plotlyjs_fn == f"{tmp_path}/plotly.min.js"
+
+    # Up-to-date copy is kept
+    mtime = os.path.getmtime(plotlyjs_fn)
+    assert write_plotlyjs(tmp_path) == plotlyjs_fn
+    assert os.path.getmtime(plotlyjs_fn) == mtime
+
+    # Stale copy is replaced
+    with open(plotlyjs_fn, "w") as f:
+        f.write("/* stale plotly.js */")
+    write_plotlyjs(tmp_path)
+    with open(plotlyjs_fn) as f:
+        assert f.read() == plotly.offline.get_plotlyjs()
+    assert os.listdir(tmp_path) == ["plotly.min.js"]
@@ -0,0 +1,138 @@
+from mitopy.vcfio import (
+    merge_vcfs,
+    merge_samples,
+    write_tribble_index,
+    TRIBBLE_MAGIC_NUMBER,
+    TRIBBLE_BIN_WIDTH,
+)
+from mitopy.executable import Executable
+import os
+import pysam
+import shutil
+import struct
+
+
+def _read_tribble_index(idx: str) -> dict:
+    """Read Tribble linear index following htsjdk LinearIndex (version 3) layout."""
+
+    with open(idx, "rb") as f:
+        data = f.read()
+    offset = 0
+
+    def read(fmt):
+        nonlocal offset
+        values = struct.unpack_from(fmt, data, offset)
+        offset += struct.calcsize(fmt)
+        return values
+
+    def read_string():
+        nonlocal offset
+        end = data.index(b"\0", offset)
+        value = data[offset:end].decode()
+        offset = end + 1
+        return value
+
+    index = dict(zip(["magic", "type", "version"], read("<iii")))
+    index["path"] = read_string()
+    index["size"], index["timestamp"] = read("<qq")
+    index["md5"] = read_string()
+    index["flags"], n_properties = read("<ii")
+    index["properties"] = dict(
+        (read_string(), read_string()) for _ in range(n_properties)
+    )
+
+    index["contigs"] = {}
+    for _ in range(read("<i")[0]):
+        name = read_string()
+        bin_width, n_blocks, longest, _, n_features = read("<iiiii")
+        index["contigs"][name] = {
+            "bin_width": bin_width,
+            "longest": longest,
+            "n_features": n_features,
+            "blocks": list(read(f"<{n_blocks + 1}q")),
+        }
+
+    assert offset == len(data)
+    return index
+
+
+def test_merge_vcfs(test_files, tmp_path):
+    merged_vcf = merge_vcfs(
+        [test_files["vcf"], test_files["vcf"]], f"{tmp_path}/merged.vcf"
+    )
+
+    # Records from both inputs are interleaved in coordinate order
+    with pysam.VariantFile(test_files["vcf"]) as vcf:
+        positions = [rec.pos for rec in vcf.fetch()]
+    with pysam.VariantFile(merged_vcf) as vcf:
+        assert [rec.pos for rec in vcf.fetch()] == sorted(positions * 2)
+
+    # Tribble index is written
+    with open(f"{merged_vcf}.idx", "rb") as f:
+        assert struct.unpack("<i", f.read(4))[0] == TRIBBLE_MAGIC_NUMBER
+
+
+def test_merge_samples(test_files, tmp_path):
+    merged_vcf = merge_samples(
+        [test_files["vcf"], test_files["shifted_vcf"]],
+        f"{tmp_path}/merged_samples.vcf",
+        sample_names=["sample1", "sample2"],
+    )
+
+    with pysam.VariantFile(test_files["vcf"]) as vcf:
+        sites = {(rec.pos, rec.alleles) for rec in vcf.fetch()}
+
+    with pysam.VariantFile(merged_vcf) as vcf:
+        assert list(vcf.header.samples) == ["sample1", "sample2"]
+        for rec in vcf.fetch():
+            # Samples without variant at the site have reference genotype
+            if (rec.pos, rec.alleles) not in sites:
+                assert rec.samples["sample1"]["GT"] == (0, 0)
+            else:
+                assert rec.samples["sample1"]["GT"] == (0, 1)
+
+
+def test_write_tribble_index(test_files, tmp_path):
+    vcf = shutil.copy(test_files["vcf"], tmp_path / "test.vcf")
+    index = _read_tribble_index(write_tribble_index(str(vcf)))
+
+    assert index["magic"] == TRIBBLE_MAGIC_NUMBER
+    assert (index["type"], index["version"]) == (1, 3)
+    assert index["path"] == os.path.abspath(vcf)
+    assert index["size"] == os.path.getsize(vcf)
+    assert index["properties"]["DICT:chrM"] == "16569"
+
+    # Record offsets
+    offsets = []
+    with open(vcf, "rb") as f:
+        offset = 0
+        for line in f:
+            if not line.startswith(b"#"):
+                offsets.append((int(line.split(b"\t")[1]), offset))
+            offset += len(line)
+
+    # Every record lies within the block of its (1-based) bin
+    chrm = index["contigs"]["chrM"]
+    assert chrm["bin_width"] == TRIBBLE_BIN_WIDTH
+    assert chrm["n_features"] == len(offsets)
+    assert chrm["blocks"][-1] == os.path.getsize(vcf)
+    for pos, offset in offsets:
+        k = (pos - 1) // TRIBBLE_BIN_WIDTH
+        assert chrm["blocks"][k] <= offset < chrm["blocks"][k + 1]
+
+
+def test_write_tribble_index_gatk(test_files, tmp_path):
+    vcf = shutil.copy(test_files["vcf"], tmp_path / "test.vcf")
+    write_tribble_index(str(vcf))
+
+    # GATK queries interval through the index
+    selected = tmp_path / "selected.vcf"
+    Executable("gatk").run(
+        subcommand="SelectVariants",
+        **{"-V": vcf, "-L": "chrM:7000-9000", "-O": selected},
+    )
+
+    with pysam.VariantFile(vcf) as f:
+        expected = [rec.pos for rec in f.fetch() if 7000 <= rec.pos <= 9000]
+    with pysam.VariantFile(selected) as f:
+        assert [rec.pos for rec in f.fetch()] == expected
@@ -1,6 +1,22 @@
-from mitopy.visualize import do_visualize
+from mitopy.visualize import (
+    do_visualize,
+    do_visualize_batch,
+    do_visualize_cohort,
+    read_variant_tables,
+    _plot_cohort_ring,
+    _plot_cohort_heatmap,
+    _get_mtbase,
+    _plot_mtbase,
+)
+import mitopy.visualize
+from concurrent.futures import Future
+import json
+import os
 import pytest
 import logging
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.offline
 import warnings
 
 
@@ -32,3 +48,157 @@ def test_do_visualize(
 
     if include_coverage:
         assert "Plotting per base coverage..." in caplog.text
+
+
+@pytest.mark.parametrize("split", [True, False])
+def test_get_mtbase(tmp_path, monkeypatch, split):
+    monkeypatch.setattr("mitopy.visualize.CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr("mitopy.visualize._mtbase_cache", {})
+
+    fig = _get_mtbase(split)
+    assert json.loads(fig.to_json()) == json.loads(_plot_mtbase(split).to_json())
+    assert len(os.listdir(f"{tmp_path}/visualize")) == 1
+
+    # Base figure is loaded from disk cache and cloned, so samples do not share traces
+    mitopy.visualize._mtbase_cache.clear()
+    fig.add_trace(go.Scatterpolar(r=[50], theta=[0]))
+    assert len(_get_mtbase(split).data) == len(fig.data) - 1
+
+    # Figures cached by other layout or plotly version are not reused
+    mitopy.visualize._mtbase_cache.clear()
+    monkeypatch.setattr("mitopy.visualize.MTBASE_LAYOUT_VERSION", 0)
+    _get_mtbase(split)
+    monkeypatch.setattr("mitopy.visualize.plotly.__version__", "0.0.0")
+    _get_mtbase(split)
+    assert len(os.listdir(f"{tmp_path}/visualize")) == 3
+
+
+@pytest.mark.parametrize("nworkers", [1, 2])
+def test_png_renderer(test_files, tmp_path, monkeypatch, nworkers):
+    calls_fn = f"{tmp_path}/calls.txt"
+
+    def record(call):
+        with open(calls_fn, "a") as f:
+            f.write(f"{call}\t{os.getpid()}\n")
+
+    # Workers are forked from the test process, so they inherit mocked Kaleido export
+    monkeypatch.setattr("plotly.io.to_image", lambda *args, **kwargs: record("init"))
+    monkeypatch.setattr(
+        "plotly.io.write_image",
+        lambda fig, out_png, **kwargs: (record("render"), open(out_png, "w").close()),
+    )
+
+    with mitopy.visualize.PngRenderer(nworkers) as renderer:
+        pngs = [
+            renderer.submit(go.Figure(), f"{tmp_path}/{i}.png").result()
+            for i in range(5)
+        ]
+    assert pngs == [f"{tmp_path}/{i}.png" for i in range(5)]
+
+    with open(calls_fn) as f:
+        calls = [line.split() for line in f]
+    inits = [pid for call, pid in calls if call == "init"]
+    renders = [pid for call, pid in calls if call == "render"]
+
+    # Renderer of each worker is started once and reused for all of its figures
+    assert len(renders) == 5
+    assert len(inits) == len(set(inits)) <= nworkers
+    assert set(renders) <= set(inits)
+
+
+def test_do_visualize_png_renderer(test_files, tmp_path, mocker):
+    def submit(fig, out_png):
+        open(out_png, "w").close()
+        png = Future()
+        png.set_result(out_png)
+        return png
+
+    renderer = mocker.patch("mitopy.visualize.PngRenderer")
+    renderer.return_value.__enter__.return_value.submit.side_effect = submit
+    write_image = mocker.patch("plotly.graph_objects.Figure.write_image")
+
+    vis = do_visualize(test_files["vcf"], out_dir=tmp_path, save_as_png=True)
+
+    # Single sample PNG is rendered by persistent renderer, not Figure.write_image
+    assert vis["vis_png"] == f"{tmp_path}/NA12878.png"
+    assert renderer.return_value.__enter__.return_value.submit.call_count == 1
+    assert not write_image.called
+
+
+def test_do_visualize_batch(test_files, tmp_path):
+    vis = do_visualize_batch(
+        [test_files["vcf"], test_files["shifted_vcf"]],
+        [test_files["coverage_csv"], test_files["coverage_csv"]],
+        out_dir=tmp_path,
+    )
+
+    # HTML report for each sample
+    assert vis["vis_html"] == [
+        f"{tmp_path}/NA12878.html",
+        f"{tmp_path}/NA12878_shifted.html",
+    ]
+
+
+def test_do_visualize_shared_plotlyjs(test_files, tmp_path):
+    # Copy of plotly.js from other plotly version is replaced
+    with open(f"{tmp_path}/plotly.min.js", "w") as f:
+        f.write("/* stale plotly.js */")
+
+    vis = do_visualize_batch(
+        [test_files["vcf"], test_files["shifted_vcf"]],
+        shared_plotlyjs=True,
+        out_dir=tmp_path,
+    )
+
+    # plotly.js is written once and referenced from slim HTML files
+    assert vis["plotlyjs"] == [f"{tmp_path}/plotly.min.js"]
+    for html in vis["vis_html"]:
+        with open(html) as f:
+            assert 'src="plotly.min.js"' in f.read()
+        assert os.path.getsize(html) < os.path.getsize(vis["plotlyjs"][0]) / 10
+    with open(vis["plotlyjs"][0]) as f:
+        assert f.read() == plotly.offline.get_plotlyjs()
+
+
+@pytest.mark.parametrize("mode", ["ring", "heatmap"])
+def test_do_visualize_cohort(test_files, tmp_path, mode):
+    # Second sample with the same variants
+    with open(test_files["vcf"]) as f:
+        vcf_text = f.read()
+    other_vcf = f"{tmp_path}/other.vcf"
+    with open(other_vcf, "w") as f:
+        f.write(vcf_text.replace("\tNA12878\n", "\tother\n"))
+
+    vis = do_visualize_cohort(
+        [test_files["vcf"], other_vcf], mode=mode, ncores=2, out_dir=tmp_path
+    )
+
+    # Variants of both samples are in a single table and figure
+    table = pd.read_csv(vis["variants_csv"])
+    assert table.groupby("sample").size().to_dict() == {"NA12878": 14, "other": 14}
+    assert vis["vis_html"] == f"{tmp_path}/cohort_{mode}.html"
+
+
+def test_read_variant_tables_no_variants(test_files, tmp_path):
+    # Sample without variants
+    with open(test_files["vcf"]) as f:
+        header = [line for line in f if line.startswith("#")]
+    empty_vcf = f"{tmp_path}/empty.vcf"
+    with open(empty_vcf, "w") as f:
+        f.write("".join(header).replace("\tNA12878\n", "\tempty\n"))
+
+    table = read_variant_tables([test_files["vcf"], empty_vcf])
+    assert list(table["sample"].cat.categories) == ["NA12878", "empty"]
+    assert set(table["sample"]) == {"NA12878"}
+
+    # Sample is counted and has a heatmap row
+    ring = _plot_cohort_ring(table, bin_size=100, split_strands=False)
+    assert "Variants of 2 samples" in ring.to_json()
+    heatmap = _plot_cohort_heatmap(table, bin_size=100)
+    assert list(heatmap.data[0].y) == ["NA12878", "empty"]
+    assert "Heteroplasmy of 2 samples" in heatmap.to_json()
+
+
+def test_read_variant_tables_empty():
+    with pytest.raises(SystemExit):
+        read_variant_tables([])